@@ -0,0 +1,106 @@
+"""
+Turn latency of the agent server with 1, 10 and 100 sessions talking to it at once. Everything runs
+in this process: a fake OpenAI API that answers after --latency seconds, the agent server on a
+throwaway database of --messages synthetic rows, and the sessions, each taking --turns turns.
+
+    python -m benchmarks.agent_server_load --sessions 1 10 100 --turns 5 --latency 0.05
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import tempfile
+import time
+
+import aiohttp
+import numpy as np
+import openai
+
+from llm_client.agent.memory.memory import Memory
+from llm_client.agent.server import AgentServer
+from llm_client.async_llm_utils import AsyncLLMClient
+from llm_client.embedding_cache import EmbeddingCache
+from benchmarks.fake_openai_server import FakeOpenAIServer
+from benchmarks.synthetic import populate
+
+
+def start_fake_api(latency: float, dim: int) -> FakeOpenAIServer:
+    """Run the fake API on its own loop and thread, so it doesn't compete with the server measured."""
+    fake_api = FakeOpenAIServer(latency=latency, embedding_dim=dim)
+    fake_api.start_in_thread()
+    openai.api_base = fake_api.api_base
+    openai.api_key = openai.api_key or "sk-fake"
+    return fake_api
+
+
+async def run_session(client: aiohttp.ClientSession, address: str, name: str, turns: int) -> list[float]:
+    async with client.post(f"{address}/sessions", json={"name": name, "objectives": ["Answer briefly."]}) as response:
+        session_id = (await response.json())["session_id"]
+    timings = []
+    for turn in range(turns):
+        start = time.perf_counter()
+        async with client.post(
+            f"{address}/sessions/{session_id}/turns", json={"message": f"{name} asks question number {turn}"}
+        ) as response:
+            response.raise_for_status()
+            await response.json()
+        timings.append(time.perf_counter() - start)
+    async with client.delete(f"{address}/sessions/{session_id}"):
+        pass
+    return timings
+
+
+async def measure(address: str, sessions: int, turns: int) -> list[float]:
+    connector = aiohttp.TCPConnector(limit=sessions)
+    async with aiohttp.ClientSession(connector=connector) as client:
+        results = await asyncio.gather(
+            *(run_session(client, address, f"s{sessions}-{idx}", turns) for idx in range(sessions))
+        )
+    return [timing for timings in results for timing in timings]
+
+
+async def run(args, db_path: str):
+    memory = Memory(db_path)
+    server = AgentServer(memory, model=args.model)
+    address = await server.start(port=0)
+    try:
+        print(f"{'sessions':>8} {'turns':>6} {'p50':>10} {'p99':>10} {'turns/s':>10}")
+        for sessions in args.sessions:
+            start = time.perf_counter()
+            timings_ms = np.array(await measure(address, sessions, args.turns)) * 1000
+            elapsed = time.perf_counter() - start
+            print(
+                f"{sessions:>8} {len(timings_ms):>6}"
+                f" {np.percentile(timings_ms, 50):>7.1f} ms {np.percentile(timings_ms, 99):>7.1f} ms"
+                f" {len(timings_ms) / elapsed:>10.1f}"
+            )
+    finally:
+        await server.stop()
+        memory.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--turns", type=int, default=5, help="Turns taken by each session.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds the fake API takes per request.")
+    parser.add_argument("--messages", type=int, default=10_000, help="Synthetic messages already in memory.")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument(
+        "--llm-concurrency", type=int, default=None, help="Requests in flight to the API (LLM_MAX_CONCURRENCY)."
+    )
+    args = parser.parse_args()
+
+    AsyncLLMClient(max_concurrency=args.llm_concurrency)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Keep the fake embeddings out of the real embedding cache.
+        EmbeddingCache(path=str(Path(tmp_dir) / "embedding_cache.db"))
+        db_path = str(Path(tmp_dir) / "memory.db")
+        populate(db_path, args.messages, dim=args.dim)
+        start_fake_api(args.latency, args.dim)
+        asyncio.run(run(args, db_path))
+
+
+if __name__ == "__main__":
+    main()
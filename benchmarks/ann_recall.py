@@ -0,0 +1,67 @@
+"""
+Recall@k and query latency of IVFFlatIndex at several n_probe settings, and of Int8Index at
+several re-rank depths, against the exact scan.
+
+    python -m benchmarks.ann_recall --size 1000000 --k 5
+"""
+import argparse
+import time
+from uuid import uuid4
+
+import numpy as np
+
+from llm_client.agent.memory.embedding_matrix import EmbeddingMatrix
+from llm_client.agent.memory.vector_index import ExactIndex, Int8Index, IVFFlatIndex
+from benchmarks.synthetic import clustered_embeddings
+
+
+def timed_search(index, queries: np.ndarray, k: int) -> tuple[list[set[int]], float]:
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        rows, _ = index.search(query, k)
+        results.append(set(rows.tolist()))
+    return results, (time.perf_counter() - start) / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--rerank", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    matrix = EmbeddingMatrix()
+    matrix.extend([uuid4().hex for _ in range(args.size)], clustered_embeddings(rng, args.size, args.dim))
+    queries = clustered_embeddings(rng, args.queries, args.dim)
+
+    exact_results, exact_latency = timed_search(ExactIndex(matrix), queries, args.k)
+    print(f"{'index':<16} {'recall@' + str(args.k):>9} {'latency':>12}")
+    print(f"{'exact':<16} {1.0:>9.3f} {exact_latency * 1000:>9.3f} ms")
+
+    start = time.perf_counter()
+    index = IVFFlatIndex(matrix, min_train_size=0)
+    index.train()
+    print(f"(trained {len(index.centroids)} lists in {time.perf_counter() - start:.1f}s)")
+    for n_probe in args.n_probe:
+        index.n_probe = n_probe
+        results, latency = timed_search(index, queries, args.k)
+        recall = np.mean([len(found & expected) / args.k for found, expected in zip(results, exact_results)])
+        print(f"{'ivf n_probe=' + str(n_probe):<16} {recall:>9.3f} {latency * 1000:>9.3f} ms")
+
+    index = Int8Index(matrix)
+    index.fit()
+    print(f"(int8 codes: {index.codes.nbytes / 2**20:.0f} MB, float32 matrix: {matrix.matrix.nbytes / 2**20:.0f} MB)")
+    for rerank in args.rerank:
+        index.rerank = rerank
+        results, latency = timed_search(index, queries, args.k)
+        recall = np.mean([len(found & expected) / args.k for found, expected in zip(results, exact_results)])
+        print(f"{'int8 rerank=' + str(rerank):<16} {recall:>9.3f} {latency * 1000:>9.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
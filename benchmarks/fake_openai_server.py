@@ -0,0 +1,223 @@
+"""
+A local stand-in for the OpenAI HTTP API, for exercising the client without a network or a bill.
+
+Run it with `python -m benchmarks.fake_openai_server --port 8765 --latency 0.2` and point the
+client at it with OPENAI_API_BASE=http://127.0.0.1:8765/v1 (or `openai.api_base`).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+import numpy as np
+from aiohttp import web
+
+EMBEDDING_DIM = 1536
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM) -> list[float]:
+    """Deterministic unit vector derived from `text`."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def fake_reply(messages: list[dict]) -> str:
+    last = messages[-1]["content"] if messages else ""
+    return f"Echo: {last}"
+
+
+class FakeOpenAIServer:
+    """
+    Serves /v1/chat/completions and /v1/embeddings with a fixed per-request latency.
+
+    Chat completions requested with `"stream": true` are sent word by word as server-sent events,
+    `chunk_latency` seconds apart.
+
+    `fail_every` makes every n-th request answer 429, to exercise retries; with
+    `fail_with_reset=False` those 429s carry no `retry-after` header. With `rpm` set, the
+    server enforces a sliding one-minute request limit and reports it in `x-ratelimit-*` headers
+    like the real API. Request counts are kept in `requests`, rejected ones in `rate_limited`, and
+    the peak number of requests handled at once in `max_in_flight`.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        embedding_dim: int = EMBEDDING_DIM,
+        fail_every: Optional[int] = None,
+        rpm: Optional[int] = None,
+        chunk_latency: float = 0.0,
+        fail_with_reset: bool = True,
+    ):
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.embedding_dim = embedding_dim
+        self.fail_every = fail_every
+        self.fail_with_reset = fail_with_reset
+        self.rpm = rpm
+        self._window: deque[float] = deque()
+        self.rate_limited = 0
+        self.requests: dict[str, int] = {"chat/completions": 0, "embeddings": 0}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._runner: Optional[web.AppRunner] = None
+        self._thread_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.port: Optional[int] = None
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_post("/v1/embeddings", self.embeddings)
+        return app
+
+    @property
+    def api_base(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    async def start(self, port: int = 0):
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    def start_in_thread(self, port: int = 0):
+        """Serve from a daemon thread with its own event loop, so the server doesn't share the caller's."""
+        self._thread_loop = asyncio.new_event_loop()
+        threading.Thread(target=self._thread_loop.run_forever, name="fake-openai-server", daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self.start(port), self._thread_loop).result()
+
+    def stop_in_thread(self):
+        """Stop a server started with `start_in_thread`, along with its thread."""
+        if self._thread_loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.stop(), self._thread_loop).result()
+        self._thread_loop.call_soon_threadsafe(self._thread_loop.stop)
+        self._thread_loop = None
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _rate_limit_headers(self) -> dict[str, str]:
+        if self.rpm is None:
+            return {}
+        now = time.monotonic()
+        while self._window and self._window[0] <= now - 60:
+            self._window.popleft()
+        reset = 60 - (now - self._window[0]) if self._window else 0.0
+        return {
+            "x-ratelimit-limit-requests": str(self.rpm),
+            "x-ratelimit-remaining-requests": str(max(0, self.rpm - len(self._window))),
+            "x-ratelimit-reset-requests": f"{reset:.3f}s",
+        }
+
+    async def _handle(self, endpoint: str) -> Optional[web.Response]:
+        if self.rpm is not None:
+            headers = self._rate_limit_headers()
+            if len(self._window) >= self.rpm:
+                self.rate_limited += 1
+                return web.json_response(
+                    {"error": {"message": "Rate limit reached for requests", "type": "requests"}},
+                    status=429,
+                    headers=headers,
+                )
+            self._window.append(time.monotonic())
+        self.requests[endpoint] += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        if self.fail_every and sum(self.requests.values()) % self.fail_every == 0:
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "requests"}},
+                status=429,
+                headers={"retry-after": "0"} if self.fail_with_reset else {},
+            )
+        return None
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        error = await self._handle("chat/completions")
+        if error is not None:
+            return error
+        content = fake_reply(body.get("messages", []))
+        if body.get("stream"):
+            return await self._stream_chat(request, body, content)
+        return web.json_response(
+            {
+                "id": f"chatcmpl-{self.requests['chat/completions']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            },
+            headers=self._rate_limit_headers(),
+        )
+
+    async def _stream_chat(self, request: web.Request, body: dict, content: str) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", **self._rate_limit_headers()})
+        await response.prepare(request)
+        words = content.split(" ")
+        deltas = [{"role": "assistant"}] + [{"content": word if idx == 0 else " " + word} for idx, word in enumerate(words)]
+        for idx, delta in enumerate(deltas):
+            if idx > 1:
+                await asyncio.sleep(self.chunk_latency)
+            event = {
+                "id": f"chatcmpl-{self.requests['chat/completions']}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def embeddings(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        error = await self._handle("embeddings")
+        if error is not None:
+            return error
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        return web.json_response(
+            {
+                "object": "list",
+                "model": body.get("model"),
+                "data": [
+                    {"object": "embedding", "index": idx, "embedding": fake_embedding(text, self.embedding_dim)}
+                    for idx, text in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            },
+            headers=self._rate_limit_headers(),
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI API server.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering each request.")
+    parser.add_argument("--embedding-dim", type=int, default=EMBEDDING_DIM)
+    parser.add_argument("--fail-every", type=int, default=None, help="Answer every n-th request with a 429.")
+    parser.add_argument("--rpm", type=int, default=None, help="Enforce a requests-per-minute limit.")
+    parser.add_argument("--chunk-latency", type=float, default=0.0, help="Seconds between streamed chunks.")
+    args = parser.parse_args()
+    server = FakeOpenAIServer(args.latency, args.embedding_dim, args.fail_every, args.rpm, args.chunk_latency)
+    web.run_app(server.app(), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
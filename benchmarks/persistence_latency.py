@@ -0,0 +1,121 @@
+"""
+Per-turn persistence latency: one connection per row (the old Memory), row-at-a-time inserts on the
+pooled WAL connection, and the batched UnitOfWork that Memory.add_interaction uses.
+
+    python -m benchmarks.persistence_latency --messages 100000 --turns 200
+"""
+from datetime import datetime
+from pathlib import Path
+import argparse
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+
+from llm_client.agent.memory.connection_pool import SqliteConnectionPool
+from llm_client.agent.memory.unit_of_work import UnitOfWork
+from llm_client.agent.memory.sql_backed_memory_objects import SqlMessage, SqlInteraction, Vector
+from llm_client.types.openai import Role
+from benchmarks.synthetic import populate, random_embeddings
+
+
+def make_turn(rng: np.random.Generator, dim: int, system_message_count: int):
+    embeddings = random_embeddings(rng, 2 + system_message_count, dim)
+    messages = [
+        SqlMessage(role=Role.User, text="What did we talk about?", embedding=Vector(data=embeddings[0].tolist())),
+        SqlMessage(role=Role.Assistant, text="We talked about it.", embedding=Vector(data=embeddings[1].tolist())),
+    ]
+    messages += [
+        SqlMessage(role=Role.System, text=f"System message {idx}", embedding=Vector(data=embeddings[2 + idx].tolist()))
+        for idx in range(system_message_count)
+    ]
+    interaction = SqlInteraction(
+        created_at=datetime.utcnow(),
+        user_message_id=messages[0].uid,
+        response_message_id=messages[1].uid,
+        system_message_ids=[message.uid for message in messages[2:]],
+        relevant_interaction_ids=[],
+        recent_interaction_ids=[],
+    )
+    return messages, interaction
+
+
+def persist_per_row_connections(db_path: str, messages: list[SqlMessage], interaction: SqlInteraction):
+    for message in messages:
+        with sqlite3.connect(db_path) as conn:
+            message.save_to_sql(conn)
+    with sqlite3.connect(db_path) as conn:
+        interaction.save_to_sql(conn)
+
+
+def persist_pooled(pool: SqliteConnectionPool, messages: list[SqlMessage], interaction: SqlInteraction):
+    with pool.write() as conn:
+        for message in messages:
+            message.save_to_sql(conn)
+        interaction.save_to_sql(conn)
+
+
+def persist_unit_of_work(pool: SqliteConnectionPool, messages: list[SqlMessage], interaction: SqlInteraction):
+    unit = UnitOfWork()
+    for message in messages:
+        unit.add_message(message)
+    unit.add_interaction(interaction)
+    with pool.write() as conn:
+        unit.flush(conn)
+
+
+def report(name: str, timings: list[float]):
+    timings_ms = np.array(timings) * 1000
+    print(
+        f"{name:<24} mean {timings_ms.mean():8.3f} ms"
+        f"  p50 {np.percentile(timings_ms, 50):8.3f} ms"
+        f"  p99 {np.percentile(timings_ms, 99):8.3f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--system-messages", type=int, default=6)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = str(Path(tmp_dir) / "memory.db")
+        print(f"Populating {db_path} with {args.messages} messages...")
+        populate(db_path, args.messages, dim=args.dim)
+
+        before = []
+        for _ in range(args.turns):
+            messages, interaction = make_turn(rng, args.dim, args.system_messages)
+            start = time.perf_counter()
+            persist_per_row_connections(db_path, messages, interaction)
+            before.append(time.perf_counter() - start)
+
+        pool = SqliteConnectionPool(db_path)
+        after = []
+        for _ in range(args.turns):
+            messages, interaction = make_turn(rng, args.dim, args.system_messages)
+            start = time.perf_counter()
+            persist_pooled(pool, messages, interaction)
+            after.append(time.perf_counter() - start)
+
+        batched = []
+        for _ in range(args.turns):
+            messages, interaction = make_turn(rng, args.dim, args.system_messages)
+            start = time.perf_counter()
+            persist_unit_of_work(pool, messages, interaction)
+            batched.append(time.perf_counter() - start)
+        pool.close()
+
+    print(f"Per-turn persistence latency, {args.turns} turns on {args.messages} messages:")
+    report("connection per row", before)
+    report("pooled WAL connection", after)
+    report("batched unit of work", batched)
+
+
+if __name__ == "__main__":
+    main()
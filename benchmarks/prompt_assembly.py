@@ -0,0 +1,97 @@
+"""
+Time to assemble one agent prompt: the system messages, the user message, 5 relevant and 5 recent
+memories. "cold" clears the token count LRU and the counts stored with messages before every prompt,
+which is what each turn used to cost; "warm" is a turn whose texts were all counted before.
+
+    python -m benchmarks.prompt_assembly --turns 1000
+"""
+from datetime import datetime, timedelta
+import argparse
+import time
+
+import numpy as np
+
+from llm_client.agent.agent import Agent
+from llm_client.agent.memory.remembered_interaction import RememberedInteraction
+from llm_client.agent.memory.sql_backed_memory_objects import SqlMessage, Vector
+from llm_client.agent.prompt import Prompt
+from llm_client.token_counter import TOKEN_COUNT_MODEL, _count_encoded_tokens, count_tokens
+from llm_client.types.openai import Role
+
+WORDS = (
+    "the agent memory remembers every conversation and recalls related interactions when the user asks "
+    "about projects deadlines ideas plans code reviews meetings notes summaries questions answers"
+).split()
+
+
+def sentence(rng: np.random.Generator, n_words: int) -> str:
+    return " ".join(rng.choice(WORDS, size=n_words))
+
+
+def make_message(role: Role, text: str) -> SqlMessage:
+    return SqlMessage.construct(role=role, text=text, embedding=Vector.construct(data=[]), token_count=None)
+
+
+def make_turn(rng: np.random.Generator, n_memories: int):
+    system_messages = [make_message(Role.System, text) for text in Agent.default_system_prompts]
+    user_message = make_message(Role.User, sentence(rng, 30))
+    start = datetime(2023, 1, 1)
+    memories = [
+        RememberedInteraction(
+            uid=str(idx),
+            created_at=start + timedelta(minutes=idx),
+            user_message=sentence(rng, 30),
+            response_message=sentence(rng, 80),
+        )
+        for idx in range(2 * n_memories)
+    ]
+    return system_messages, user_message, memories[:n_memories], memories[n_memories:]
+
+
+def build_prompt(system_messages, user_message, relevant, recent) -> Prompt:
+    prompt = Prompt()
+    prompt.token_limit = 100_000
+    for message in system_messages:
+        prompt.add_system_message(message)
+    prompt.add_user_message(user_message)
+    for memory in relevant:
+        prompt.add_relevant_memory(memory)
+    for memory in recent:
+        prompt.add_recent_memory(memory)
+    return prompt
+
+
+def time_turns(turns, cold: bool) -> float:
+    elapsed = 0.0
+    for system_messages, user_message, relevant, recent in turns:
+        if cold:
+            _count_encoded_tokens.cache_clear()
+            for message in system_messages + [user_message]:
+                message.token_count = None
+        else:
+            for message in system_messages + [user_message]:
+                message.token_count = count_tokens(message.text, TOKEN_COUNT_MODEL)
+            build_prompt(system_messages, user_message, relevant, recent)
+        start = time.perf_counter()
+        build_prompt(system_messages, user_message, relevant, recent)
+        elapsed += time.perf_counter() - start
+    return elapsed / len(turns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--memories", type=int, default=5, help="Relevant memories, and again recent memories.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    turns = [make_turn(rng, args.memories) for _ in range(args.turns)]
+    cold = time_turns(turns, cold=True)
+    warm = time_turns(turns, cold=False)
+    print(f"{'prompt':>20} {'cold':>12} {'warm':>12}")
+    print(f"{f'{args.memories}+{args.memories} memories':>20} {cold * 1e6:>10.1f}us {warm * 1e6:>10.1f}us")
+
+
+if __name__ == "__main__":
+    main()
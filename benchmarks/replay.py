@@ -0,0 +1,142 @@
+"""
+Per-turn agent latency as memory grows. Replays a transcript through `Agent.take_turn`, the turn
+run by `run_user_loop`, against throwaway databases of --sizes synthetic interactions, and writes
+the time spent in each stage (embedding, retrieval, prompt, completion, persist) to a JSON report
+that can be diffed between commits.
+
+The OpenAI API is replaced by the fake server in `benchmarks/fake_openai_server.py`, answering after
+--latency seconds. To plug in another backend, run one that speaks the OpenAI API and pass
+--api-base. A million interactions at --dim 1536 is 12 GB of embeddings; use a smaller --dim to go
+that far.
+
+    python -m benchmarks.replay --sizes 1000 10000 100000 --turns 50 --output replay.json
+    python -m benchmarks.replay --transcript chat.txt --sizes 1000000 --dim 256
+
+A transcript is a text file with one user message per line, or a .jsonl file of chat messages
+({"role": "user", "content": ...}) whose user messages are replayed.
+"""
+from pathlib import Path
+from typing import Optional
+import argparse
+import json
+import logging
+import tempfile
+import time
+
+import numpy as np
+import openai
+
+from llm_client.agent.agent import TURN_STAGES, Agent
+from llm_client.embedding_cache import EmbeddingCache
+from llm_client.logs import logger
+from benchmarks.fake_openai_server import FakeOpenAIServer
+from benchmarks.synthetic import populate
+
+
+def load_transcript(path: Optional[str], turns: int) -> list[str]:
+    """`turns` user messages from the transcript, repeated as needed and numbered so each one is new to memory."""
+    if path is None:
+        messages = [
+            "What did we decide about the project deadline?",
+            "Summarize the notes from the last code review.",
+            "Which ideas did I mention for the next release?",
+        ]
+    elif path.endswith(".jsonl"):
+        with open(path) as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        messages = [line["content"] for line in lines if line.get("role", "user") == "user"]
+    else:
+        with open(path) as f:
+            messages = [line.strip() for line in f if line.strip()]
+    if len(messages) == 0:
+        raise ValueError(f"No user messages in {path}.")
+    return [f"{messages[idx % len(messages)]} ({idx})" for idx in range(turns)]
+
+
+def summarize(timings: list[float]) -> dict[str, float]:
+    timings_ms = np.array(timings) * 1000
+    return {
+        "mean_ms": round(float(timings_ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(timings_ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(timings_ms, 99)), 3),
+    }
+
+
+def replay(db_path: str, messages: list[str], warmup: int, model: str) -> dict:
+    start = time.perf_counter()
+    agent = Agent(model, 0.7, db_path)
+    load_seconds = time.perf_counter() - start
+    agent.configure("Replay", "Answers replayed questions.", ["Answer briefly."])
+
+    stages: dict[str, list[float]] = {stage: [] for stage in TURN_STAGES}
+    turns = []
+    try:
+        for idx, message in enumerate(messages):
+            start = time.perf_counter()
+            agent.take_turn(message)
+            # Count the background write in the turn, as the next turn would wait for it.
+            agent.wait_for_persistence()
+            elapsed = time.perf_counter() - start
+            if idx < warmup:
+                continue
+            turns.append(elapsed)
+            for stage in TURN_STAGES:
+                stages[stage].append(agent.turn_timings.get(stage, 0.0))
+    finally:
+        agent.close()
+    return {
+        "load_seconds": round(load_seconds, 3),
+        "turns": len(turns),
+        "turn": summarize(turns),
+        "stages": {stage: summarize(timings) for stage, timings in stages.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000], help="Interactions.")
+    parser.add_argument("--transcript", default=None)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=2, help="Leading turns left out of the report.")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds the fake API takes per request.")
+    parser.add_argument("--chunk-latency", type=float, default=0.0, help="Seconds between streamed reply chunks.")
+    parser.add_argument("--api-base", default=None, help="Replay against this OpenAI-compatible API instead.")
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--output", default="replay-report.json")
+    args = parser.parse_args()
+
+    messages = load_transcript(args.transcript, args.warmup + args.turns)
+    if args.api_base is None:
+        fake_api = FakeOpenAIServer(latency=args.latency, embedding_dim=args.dim, chunk_latency=args.chunk_latency)
+        fake_api.start_in_thread()
+        openai.api_base = fake_api.api_base
+        openai.api_key = openai.api_key or "sk-fake"
+    else:
+        openai.api_base = args.api_base
+    # Prompts and replies would otherwise be printed; replies still go to the transcript log.
+    logger.set_level(logging.WARNING)
+    logger.streaming_logger.setLevel(logging.WARNING)
+    # Every size replays the same messages, so cached embeddings would hide the embedding requests.
+    EmbeddingCache(path="")
+
+    report = {"config": {key: value for key, value in vars(args).items() if key != "output"}, "results": []}
+    print(f"{'interactions':>12} {'turn p50':>10} " + " ".join(f"{stage:>10}" for stage in TURN_STAGES))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in args.sizes:
+            db_path = str(Path(tmp_dir) / f"memory-{size}.db")
+            populate(db_path, 2 * size, dim=args.dim)
+            result = {"interactions": size, **replay(db_path, messages, args.warmup, args.model)}
+            report["results"].append(result)
+            print(
+                f"{size:>12} {result['turn']['p50_ms']:>7.1f} ms "
+                + " ".join(f"{result['stages'][stage]['p50_ms']:>7.1f} ms" for stage in TURN_STAGES)
+            )
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
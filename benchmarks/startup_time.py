@@ -0,0 +1,60 @@
+"""
+Memory startup time on synthetic databases: the per-row `SqlMessage.load_all` path, the bulk loader
+on first start (which also writes the embedding sidecars), and a restart that maps the sidecars.
+
+    python -m benchmarks.startup_time --sizes 10000 100000 1000000
+"""
+from pathlib import Path
+import argparse
+import sqlite3
+import tempfile
+import time
+
+from llm_client.agent.memory.memory import Memory
+from llm_client.agent.memory.message_store import MessageStore
+from llm_client.agent.memory.sql_backed_memory_objects import SqlMessage
+from benchmarks.synthetic import populate
+
+
+def load_per_row(db_path: str) -> float:
+    start = time.perf_counter()
+    message_store = MessageStore()
+    with sqlite3.connect(db_path) as conn:
+        for message in SqlMessage.load_all(conn):
+            message_store.add_message(message)
+    return time.perf_counter() - start
+
+
+def load_bulk(db_path: str) -> float:
+    start = time.perf_counter()
+    memory = Memory(db_path)
+    elapsed = time.perf_counter() - start
+    memory.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument(
+        "--per-row-limit",
+        type=int,
+        default=100_000,
+        help="Skip the per-row loader above this many messages, it takes too long to be useful.",
+    )
+    args = parser.parse_args()
+
+    print(f"{'messages':>10} {'per-row load':>14} {'first start':>14} {'restart':>14}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = str(Path(tmp_dir) / "memory.db")
+            populate(db_path, size, dim=args.dim)
+            per_row = f"{load_per_row(db_path):13.2f}s" if size <= args.per_row_limit else f"{'skipped':>14}"
+            first_start = load_bulk(db_path)
+            restart = load_bulk(db_path)
+            print(f"{size:>10} {per_row} {first_start:13.2f}s {restart:13.2f}s")
+
+
+if __name__ == "__main__":
+    main()
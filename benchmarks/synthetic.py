@@ -0,0 +1,268 @@
+"""
+Fill a new memory.db with synthetic rows, bypassing the embeddings API.
+
+Writes alternating user/assistant messages with unit-norm embeddings (random, or clustered around
+topic centres like real embeddings) and word-salad text of realistic lengths. It pairs them into
+interactions, and fills the three link tables: every interaction links the shared system messages,
+some random earlier interactions as relevant, and the interactions just before it as recent.
+Rows are written in bulk, one transaction per batch, with ids that sort in insertion order so the
+primary key indexes are only ever appended to. The full-text index is built once at the end.
+
+    python -m benchmarks.synthetic memory.db --interactions 10000000 --dim 256 --embeddings clustered
+"""
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Optional
+import argparse
+import sqlite3
+import time
+
+import numpy as np
+
+from llm_client.agent.memory.sql_backed_memory_objects import (
+    INSERT_INTERACTION_SQL,
+    INSERT_RECENT_INTERACTION_LINK_SQL,
+    INSERT_RELEVANT_INTERACTION_LINK_SQL,
+    create_memory_tables,
+    create_message_search_index,
+)
+
+WORDS = (
+    "the a an and or but if then so because when while after before about above across against along among "
+    "around at by for from in into near of off on onto over through to toward under until up with without "
+    "i you he she it we they me him her us them my your his its our their this that these those what which "
+    "who how why where is are was were be been being have has had do does did can could will would should "
+    "may might must agent memory project deadline meeting notes summary question answer idea plan code "
+    "review test release bug feature design document email report customer team manager schedule budget "
+    "data model prompt token embedding search result error fix change request update status week month "
+    "today tomorrow yesterday remember recall think know want need like make take give find tell ask work "
+    "call try use help show start stop keep let begin seem talk turn move live believe hold bring happen "
+    "write provide sit stand lose pay meet include continue set learn lead understand watch follow create "
+    "speak read allow add spend grow open walk win offer consider appear buy wait serve die send expect "
+    "build stay fall cut reach kill remain suggest raise pass sell require decide return explain hope "
+    "develop carry break receive agree support hit produce eat cover catch draw choose important new good "
+    "first last long great little own other old right big high different small large next early young few "
+    "public bad same able"
+).split()
+
+# Mean length, in words, of the messages written by each role.
+MEAN_WORDS = {"user": 25, "assistant": 90}
+SYSTEM_PROMPTS = [
+    "Think carefully about your responses.",
+    "Work towards the enumerated system objectives.",
+    "Use system messages that start with MemoryLog- as input.",
+    "Use MemoryLog- messages to understand the context of the current message.",
+    "MemoryLog- messages are previous messages in our current conversation.",
+    "You have access to previous conversations by reading the MemoryLog- messages",
+]
+INSERT_SYNTHETIC_MESSAGE_SQL = (
+    "INSERT INTO messages (id, timestamp, role, content, embedding, token_count) VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+
+def random_embeddings(rng: np.random.Generator, n: int, dim: int) -> np.ndarray:
+    embeddings = rng.standard_normal((n, dim), dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings
+
+
+def clustered_embeddings(
+    rng: np.random.Generator,
+    n: int,
+    dim: int,
+    n_clusters: int = 256,
+    spread: float = 0.5,
+    centres: Optional[np.ndarray] = None,
+):
+    """
+    Unit vectors scattered around random topic centres, closer to real embeddings than pure noise.
+    Pass `centres` to draw batches around the same topics.
+    """
+    if centres is None:
+        centres = random_embeddings(rng, n_clusters, dim)
+    embeddings = centres[rng.integers(0, len(centres), size=n)]
+    embeddings += spread * random_embeddings(rng, n, dim)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings
+
+
+class TextSampler:
+    """Message texts cut from one long random word stream, with log-normally distributed lengths."""
+
+    def __init__(self, rng: np.random.Generator, corpus_words: int = 1 << 20, max_words: int = 1000):
+        words = rng.choice(WORDS, size=corpus_words)
+        self.corpus = " ".join(words)
+        # Character offset of every word, and one past the end of the corpus.
+        self.offsets = np.concatenate([[0], np.cumsum(np.char.str_len(words) + 1)])
+        self.corpus_words = corpus_words
+        self.max_words = max_words
+
+    def sample(self, rng: np.random.Generator, mean_words: np.ndarray) -> tuple[list[str], np.ndarray]:
+        """One text per entry of `mean_words`, and its length in words."""
+        n_words = rng.lognormal(np.log(mean_words), 0.6).astype(np.int64)
+        n_words = np.clip(n_words, 1, self.max_words)
+        first = rng.integers(0, self.corpus_words - n_words)
+        begins = self.offsets[first].tolist()
+        ends = (self.offsets[first + n_words] - 1).tolist()
+        return [self.corpus[begin:end] for begin, end in zip(begins, ends)], n_words
+
+
+def synthetic_ids(kind: int, indexes: Iterable[int], seed: int) -> list[str]:
+    """32 hex digits like `uuid4().hex`, increasing with the index so inserts append to the index."""
+    prefix = f"{seed & 0xFFFFFFFF:08x}{kind:02x}"
+    return [f"{prefix}{index:022x}" for index in indexes]
+
+
+MESSAGE, INTERACTION, SYSTEM_MESSAGE = range(3)
+
+
+def populate(
+    db_path: str,
+    n_messages: int,
+    dim: int = 1536,
+    seed: int = 0,
+    batch_size: int = 10_000,
+    embeddings: str = "random",
+    relevant_links: int = 3,
+    recent_links: int = 3,
+):
+    """
+    Write `n_messages` alternating user/assistant messages, paired into interactions, into a new
+    database. `embeddings` is "random" or "clustered".
+    """
+    rng = np.random.default_rng(seed)
+    centres = random_embeddings(rng, 256, dim) if embeddings == "clustered" else None
+    sampler = TextSampler(rng)
+    start = np.datetime64(datetime(2023, 1, 1), "s")
+    batch_size += batch_size % 2  # Keep each user message in the same batch as its reply.
+
+    conn = sqlite3.connect(db_path)
+    # The database is rebuilt from scratch if generating it fails, so skip the rollback journal.
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-262144")
+    try:
+        with conn:
+            # Indexing the text once at the end is several times faster than through the insert triggers.
+            create_memory_tables(conn, search_index=False)
+            system_ids = synthetic_ids(SYSTEM_MESSAGE, range(len(SYSTEM_PROMPTS)), seed)
+            system_embeddings = random_embeddings(rng, len(SYSTEM_PROMPTS), dim)
+            conn.executemany(
+                INSERT_SYNTHETIC_MESSAGE_SQL,
+                [
+                    (uid, str(start.astype(datetime)), "system", text, embedding.tobytes(), len(text.split()) + 1)
+                    for uid, text, embedding in zip(system_ids, SYSTEM_PROMPTS, system_embeddings)
+                ],
+            )
+
+        for offset in range(0, n_messages, batch_size):
+            count = min(batch_size, n_messages - offset)
+            positions = np.arange(offset, offset + count)
+            is_user = positions % 2 == 0
+            roles = np.where(is_user, "user", "assistant").tolist()
+            timestamps = np.char.replace((start + positions).astype(str), "T", " ").tolist()
+            texts, n_words = sampler.sample(
+                rng, np.where(is_user, MEAN_WORDS["user"], MEAN_WORDS["assistant"]).astype(np.float64)
+            )
+            # Roughly 4 tokens for every 3 words of English; stored so loading doesn't tokenize every row.
+            token_counts = (n_words + n_words // 3 + 1).tolist()
+            if centres is not None:
+                vectors = clustered_embeddings(rng, count, dim, centres=centres)
+            else:
+                vectors = random_embeddings(rng, count, dim)
+            message_ids = synthetic_ids(MESSAGE, positions.tolist(), seed)
+
+            # An odd last message has no reply, so it doesn't start an interaction.
+            interaction_indexes = positions[is_user & (positions + 1 < n_messages)] // 2
+            interaction_ids = synthetic_ids(INTERACTION, interaction_indexes.tolist(), seed)
+            with conn:
+                conn.executemany(
+                    INSERT_SYNTHETIC_MESSAGE_SQL,
+                    zip(message_ids, timestamps, roles, texts, (vector.tobytes() for vector in vectors), token_counts),
+                )
+                conn.executemany(
+                    INSERT_INTERACTION_SQL,
+                    zip(timestamps[::2], interaction_ids, message_ids[::2], message_ids[1::2]),
+                )
+                if len(interaction_ids) > 0:
+                    # Pair the batch's interactions with the system messages inside SQLite.
+                    conn.execute(
+                        "INSERT INTO interaction_system_messages (interaction_id, system_message_id)"
+                        " SELECT i.id, m.id FROM interactions i, messages m"
+                        " WHERE i.id BETWEEN ? AND ? AND m.id BETWEEN ? AND ?",
+                        (interaction_ids[0], interaction_ids[-1], system_ids[0], system_ids[-1]),
+                    )
+                conn.executemany(
+                    INSERT_RELEVANT_INTERACTION_LINK_SQL,
+                    relevant_link_rows(rng, interaction_indexes, interaction_ids, relevant_links, seed),
+                )
+                conn.executemany(
+                    INSERT_RECENT_INTERACTION_LINK_SQL,
+                    recent_link_rows(interaction_indexes, interaction_ids, recent_links, seed),
+                )
+        with conn:
+            create_message_search_index(conn)
+    finally:
+        conn.close()
+
+
+def relevant_link_rows(
+    rng: np.random.Generator, indexes: np.ndarray, ids: list[str], links: int, seed: int
+) -> list[tuple[str, str]]:
+    """Up to `links` random earlier interactions for each interaction."""
+    related = (rng.random((len(indexes), links)) * indexes[:, None]).astype(np.int64)
+    related_ids = synthetic_ids(INTERACTION, related.ravel().tolist(), seed)
+    return [
+        (uid, related_ids[row * links + link])
+        for row, (uid, idx) in enumerate(zip(ids, indexes.tolist()))
+        for link in range(min(idx, links))
+    ]
+
+
+def recent_link_rows(indexes: np.ndarray, ids: list[str], links: int, seed: int) -> list[tuple[str, str]]:
+    """The `links` interactions just before each interaction."""
+    if len(indexes) == 0:
+        return []
+    first = max(int(indexes[0]) - links, 0)
+    window = synthetic_ids(INTERACTION, range(first, int(indexes[-1])), seed)
+    return [
+        (uid, window[related_idx - first])
+        for uid, idx in zip(ids, indexes.tolist())
+        for related_idx in range(idx - 1, max(idx - links, 0) - 1, -1)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("db_file", help="Database to create; it must not exist yet.")
+    parser.add_argument("--interactions", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--embeddings", choices=["random", "clustered"], default="clustered")
+    parser.add_argument("--relevant-links", type=int, default=3, help="Relevant interactions linked per interaction.")
+    parser.add_argument("--recent-links", type=int, default=3, help="Recent interactions linked per interaction.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=50_000, help="Messages written per transaction.")
+    args = parser.parse_args()
+    if Path(args.db_file).exists():
+        parser.error(f"{args.db_file} already exists.")
+
+    start = time.perf_counter()
+    populate(
+        args.db_file,
+        2 * args.interactions,
+        dim=args.dim,
+        seed=args.seed,
+        batch_size=args.batch_size,
+        embeddings=args.embeddings,
+        relevant_links=args.relevant_links,
+        recent_links=args.recent_links,
+    )
+    elapsed = time.perf_counter() - start
+    print(
+        f"Wrote {2 * args.interactions} messages and {args.interactions} interactions to {args.db_file}"
+        f" in {elapsed:.1f}s ({2 * args.interactions / elapsed:,.0f} messages/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
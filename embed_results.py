@@ -1,18 +1,21 @@
 import json
 
-from llm_client.llm_utils import create_embedding_with_ada
+from llm_client.llm_utils import create_embeddings
 
 
 def main():
     with open("results.json", "r") as _f:
         results = json.loads(_f.read())
 
+    texts = [text for result in results for text in (result["query"], result["response"])]
+    text_embeddings = create_embeddings(texts)
+
     embeddings = []
-    for result in results:
+    for idx in range(len(results)):
         embeddings.append(
             {
-                "query": create_embedding_with_ada(result["query"]),
-                "response": create_embedding_with_ada(result["response"]),
+                "query": text_embeddings[2 * idx],
+                "response": text_embeddings[2 * idx + 1],
             }
         )
 
@@ -1,14 +1,37 @@
-import json
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Iterator, Optional
+import json
+import time
 
 import logging
+import numpy as np
 from llm_client.agent.memory.memory import Memory
-from llm_client.agent.prompt import Prompt, ExceededTokenLimit
-from llm_client.llm_utils import create_chat_completion
+from llm_client.agent.memory.sql_backed_memory_objects import SqlMessage
+from llm_client.agent.prompt import Prompt, ExceededTokenLimit, MemoryCandidate, SystemPrefix
+from llm_client.llm_utils import create_chat_completion_stream
 from llm_client.types.openai import Role
 from llm_client.logs import logger, print_assistant_thoughts
 
 
+class PersistenceError(Exception):
+    """A finished turn could not be stored in memory."""
+
+
+# The stages of `Agent.take_turn`, as recorded in `Agent.turn_timings`.
+TURN_STAGES = ("embedding", "retrieval", "prompt", "completion", "persist")
+
+
+@contextmanager
+def _timed(timings: dict[str, float], stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
 class Agent:
     default_system_prompts = [
         "Think carefully about your responses.",
@@ -19,16 +42,49 @@ class Agent:
         "You have access to previous conversations by reading the MemoryLog- messages",
     ]
     savefile_path = Path("agent-config.json")
+    # Memories offered to the prompt packer, of each kind. Only the best subset that fits is used.
+    memory_candidates_per_kind = 10
 
-    def __init__(self, model: str, temperature, db_file: str):
-        self.memory = Memory(db_file)
+    def __init__(
+        self,
+        model: str,
+        temperature,
+        db_file: Optional[str] = None,
+        memory: Optional[Memory] = None,
+        executor: Optional[ThreadPoolExecutor] = None,
+        writer: Optional[ThreadPoolExecutor] = None,
+    ):
+        """
+        Args:
+            db_file: Database of the agent's own Memory, closed with the agent.
+            memory: A Memory shared with other agents instead, which the caller closes.
+            executor: Threads for the retrieval work within a turn. When omitted the agent starts two
+                of its own and shuts them down in `close`; otherwise the caller shuts it down.
+            writer: Like `executor`, for storing finished turns; the agent's own has one thread.
+        """
+        if (db_file is None) == (memory is None):
+            raise ValueError("Pass exactly one of db_file and memory.")
+        self._owns_memory = memory is None
+        self.memory = memory if memory is not None else Memory(db_file)
         self.model = model
         self.temperature = temperature
 
         self._name = ""
         self._description = ""
         self._objectives = []
+        self._system_prefix: Optional[SystemPrefix] = None
         self.alive = False
+        # Retrieval work that overlaps within a turn, and the write-behind of finished turns.
+        self._executor = executor or ThreadPoolExecutor(max_workers=2, thread_name_prefix="agent")
+        self._writer = writer or ThreadPoolExecutor(max_workers=1, thread_name_prefix="agent-persistence")
+        self._own_pools = [
+            pool for pool, given in ((self._executor, executor), (self._writer, writer)) if given is None
+        ]
+        self._persistence: Optional[Future] = None
+        # Seconds spent in each of TURN_STAGES by the latest turn. "embedding" is only the wait for the
+        # user message's embedding that retrieval didn't hide; "persist" is filled in by the
+        # background write, so read it after `wait_for_persistence`.
+        self.turn_timings: dict[str, float] = {}
 
     def load(self) -> bool:
         if not self.savefile_path.exists():
@@ -44,6 +100,7 @@ class Agent:
             self.temperature = agent_data["temperature"]
         except:
             return False
+        self.compile_system_prefix()
         return True
 
     def save(self):
@@ -81,53 +138,218 @@ class Agent:
             print()
             finished_input = input("Accept these changes? (y/n)")
         self.save()
+        self.compile_system_prefix()
+
+    def configure(self, name: str, description: str, objectives: list[str]):
+        """Configure the agent without prompting for it, as the agent server does for each session."""
+        self._name = name
+        self._description = description
+        self._objectives = list(objectives)
+        self.compile_system_prefix()
+
+    @property
+    def system_prompts(self) -> list[str]:
+        # General Instructions, then enumerate the objectives for objective orientation.
+        return self.default_system_prompts + [
+            f"Objective-{idx}: {objective}" for idx, objective in enumerate(self._objectives, start=1)
+        ]
+
+    def compile_system_prefix(self) -> SystemPrefix:
+        """Embed and count the system prompts once; every turn reuses the result until objectives change."""
+        self._system_prefix = SystemPrefix.compile(self.memory.get_messages(Role.System, self.system_prompts))
+        return self._system_prefix
+
+    @property
+    def system_prefix(self) -> SystemPrefix:
+        if self._system_prefix is None:
+            return self.compile_system_prefix()
+        return self._system_prefix
 
     def run_user_loop(self):
         self.alive = True
-        while self.alive:
-            prompt = Prompt()
-            # System Messaging.
-            # Build General Instructions.
-            for system_prompt in self.default_system_prompts:
-                prompt.add_system_message(self.memory.get_message(Role.System, system_prompt))
-
-            # Objective orientation.
-            # Enumerate the objectives.
-            for idx, objective in enumerate(self._objectives, start=1):
-                prompt.add_system_message(self.memory.get_message(Role.System, f"Objective-{idx}: {objective}"))
-
-            input_required = True
-            while input_required:
+        try:
+            while self.alive:
+                # The current ask.
+                user_msg = input("Message for the Agent:")
                 try:
-                    # The current ask.
-                    user_msg = input("Message for the Agent:")
-                    prompt.add_user_message(self.memory.get_message(Role.User, user_msg))
-                    input_required = False
+                    print()
+                    self.take_turn(user_msg)
+                    print()
                 except ExceededTokenLimit as err:
                     print(err)
                     print()
                     print("Please try a shorter message.")
+                except PersistenceError as err:
+                    logger.error("FAILED TO SAVE THE PREVIOUS INTERACTION", str(err.__cause__))
+                    print("Please send your message again.")
+        finally:
+            self.close()
 
-            # Memory.
-            # Pad the remaining token-space with relevant memory.
-            try:
-                for sql_interaction in self.memory.k_most_similar_inputs(prompt.user_message.text, 5):
-                    remembered_interaction = self.memory.render_prior_interaction(sql_interaction)
-                    prompt.add_relevant_memory(remembered_interaction)
+    def take_turn(self, user_text: str) -> str:
+        """
+        Answer one user message, printing the reply as it streams in.
 
-                for sql_interaction in self.memory.k_most_recent(5):
-                    remembered_interaction = self.memory.render_prior_interaction(sql_interaction)
-                    prompt.add_recent_memory(remembered_interaction)
+        The user message is embedded while recent memories and its keyword matches are gathered, and
+        its embedding doubles as the similarity query. If embedding it fails, the turn goes ahead
+        with the keyword matches and recent memories alone. The reply's embedding (and a retry of the
+        user message's) and the database write happen in the background after the reply has been
+        shown; the next turn waits for them first, so a failure surfaces as a `PersistenceError` there.
+        """
+        self.wait_for_persistence()
+        timings = self.turn_timings = {}
+        user_message = self._executor.submit(self.memory.get_message, Role.User, user_text)
+        with _timed(timings, "retrieval"):
+            recent = self.recent_memory_candidates()
+            lexical = self.memory.k_most_similar_lexical(user_text, [Role.User], self.memory_candidates_per_kind)
+        with _timed(timings, "embedding"):
+            try:
+                user_message = user_message.result()
+            except Exception as err:
+                logger.warn(f"Could not embed the message, answering without similar memories: {err}")
+                user_message = self.memory.unembedded_message(Role.User, user_text)
+        with _timed(timings, "retrieval"):
+            relevant = self.relevant_memory_candidates(user_message, lexical)
+        with _timed(timings, "prompt"):
+            prompt = self.build_prompt(user_message, recent, relevant)
 
-            except ExceededTokenLimit:
-                print("Message full.")
+        logger.debug(json.dumps(prompt.chat))
+        # Print the reply as it is generated; it is only remembered once it is complete.
+        with _timed(timings, "completion"):
+            response = logger.stream_log(
+                create_chat_completion_stream(prompt.chat, model=self.model, temperature=self.temperature)
+            )
+        self._persistence = self._writer.submit(self._persist, timings, prompt, response)
+        self._persistence.add_done_callback(self._report_persistence_failure)
+        return response
 
-            logger.debug(json.dumps(prompt.chat))
-            response = create_chat_completion(prompt.chat, model=self.model, temperature=self.temperature)
+    def _persist(self, timings: dict[str, float], prompt: Prompt, response: str):
+        with _timed(timings, "persist"):
+            if prompt.user_message.embedding is None:
+                prompt.user_message = self.memory.get_message(Role.User, prompt.user_message.text)
             self.memory.add_interaction(prompt, response)
-            print()
-            logger.typewriter_log(response)
-            print()
+
+    def build_prompt(
+        self,
+        user_message: SqlMessage,
+        recent: Optional[list[MemoryCandidate]] = None,
+        relevant: Optional[list[MemoryCandidate]] = None,
+    ) -> Prompt:
+        """
+        The prompt for `user_message`: the system prefix, the message itself, and as much relevant
+        and recent memory as fits. Pass `recent` or `relevant` when those candidates were gathered
+        already.
+        """
+        prompt = Prompt.for_model(self.model)
+        # System Messaging.
+        prompt.add_system_prefix(self.system_prefix)
+        prompt.add_user_message(user_message)
+
+        # Memory.
+        # Pad the remaining token-space with the most useful mix of relevant and recent memory.
+        if recent is None:
+            recent = self.recent_memory_candidates()
+        if relevant is None:
+            relevant = self.relevant_memory_candidates(user_message)
+        if user_message.embedding is None:
+            # Nothing to re-rank by; the keyword and recency ranks stand.
+            prompt.add_memories(relevant + recent)
+        else:
+            prompt.add_memories(self.rank_memory_candidates(user_message, relevant + recent))
+        return prompt
+
+    def wait_for_persistence(self):
+        """Block until the previous turn is stored, raising `PersistenceError` if storing it failed."""
+        persistence, self._persistence = self._persistence, None
+        if persistence is not None and persistence.exception() is not None:
+            raise PersistenceError("The previous interaction was not saved.") from persistence.exception()
+
+    @staticmethod
+    def _report_persistence_failure(persistence: Future):
+        if persistence.exception() is not None:
+            logger.error("FAILED TO SAVE INTERACTION", str(persistence.exception()))
+
+    def close(self):
+        try:
+            self.wait_for_persistence()
+        finally:
+            for pool in self._own_pools:
+                pool.shutdown()
+            if self._owns_memory:
+                self.memory.close()
+
+    def memory_candidates(self, user_text: str) -> list[MemoryCandidate]:
+        """Relevant and recent memories in one ranked list, for `Prompt.add_memories`."""
+        user_message = self.memory.get_message(Role.User, user_text)
+        return self.rank_memory_candidates(
+            user_message, self.relevant_memory_candidates(user_message) + self.recent_memory_candidates()
+        )
+
+    def rank_memory_candidates(
+        self, user_message: SqlMessage, candidates: list[MemoryCandidate]
+    ) -> list[MemoryCandidate]:
+        """
+        Merge candidates from the separate searches into one list, best first, re-scored by
+        `Memory.rank_interactions` on similarity, recency and diversity. An interaction found both as
+        relevant and as recent is kept once, as relevant.
+        """
+        by_uid: dict[str, MemoryCandidate] = {}
+        for candidate in candidates:
+            known = by_uid.get(candidate.interaction.uid)
+            if known is None or (candidate.relevant and not known.relevant):
+                by_uid[candidate.interaction.uid] = candidate
+        ranked = self.memory.rank_interactions(by_uid, user_message.embedding.data)
+        return [
+            MemoryCandidate(
+                interaction=by_uid[interaction.uid].interaction,
+                relevant=by_uid[interaction.uid].relevant,
+                score=score,
+            )
+            for interaction, score in ranked
+        ]
+
+    def relevant_memory_candidates(
+        self, user_message: SqlMessage, lexical: Optional[list[tuple[SqlMessage, float]]] = None
+    ) -> list[MemoryCandidate]:
+        """
+        Prior interactions picked by hybrid embedding and keyword search, or by keywords alone when
+        `user_message` has no embedding. Pass `lexical` when the keyword matches were gathered already.
+        """
+        if user_message.embedding is None:
+            return self.lexical_memory_candidates(user_message.text, lexical)
+        similar = self.memory.k_most_similar_interactions_hybrid(
+            user_message.text, [Role.User], self.memory_candidates_per_kind, user_message.embedding.data, lexical
+        )
+        query = np.asarray(user_message.embedding.data, dtype=np.float32)
+        candidates = []
+        for interaction, _ in similar:
+            remembered = self.memory.message_store.lookup_by_id(interaction.user_message_id)
+            # Scored by cosine similarity; fused ranks aren't comparable across queries.
+            score = float(np.dot(remembered.embedding.data, query))
+            interaction = self.memory.render_prior_interaction(interaction)
+            candidates.append(MemoryCandidate(interaction=interaction, relevant=True, score=score))
+        return candidates
+
+    def lexical_memory_candidates(
+        self, user_text: str, lexical: Optional[list[tuple[SqlMessage, float]]] = None
+    ) -> list[MemoryCandidate]:
+        """Prior interactions whose user message best matches the words of `user_text`, scored by rank."""
+        matches = self.memory.k_most_similar_interactions_lexical(
+            user_text, [Role.User], self.memory_candidates_per_kind, lexical
+        )
+        return [
+            MemoryCandidate(
+                interaction=self.memory.render_prior_interaction(interaction), relevant=True, score=1 / (rank + 1)
+            )
+            for rank, (interaction, _) in enumerate(matches)
+        ]
+
+    def recent_memory_candidates(self) -> list[MemoryCandidate]:
+        return [
+            MemoryCandidate(
+                interaction=self.memory.render_prior_interaction(interaction), relevant=False, score=1 / (rank + 2)
+            )
+            for rank, interaction in enumerate(self.memory.k_most_recent(self.memory_candidates_per_kind))
+        ]
 
     def __str__(self):
         return f"{self._name}\n{self._description}\n{self._objectives}"
@@ -0,0 +1,82 @@
+"""Long-lived SQLite connections for the agent memory database."""
+from contextlib import contextmanager
+from typing import Iterator, Optional
+import threading
+import sqlite3
+
+
+DEFAULT_PRAGMAS: dict[str, str | int] = {
+    "journal_mode": "WAL",
+    # WAL + NORMAL only fsyncs on checkpoint, never on every commit.
+    "synchronous": "NORMAL",
+    # Negative values are KiB, so this is ~64MB of page cache per connection.
+    "cache_size": -64000,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+
+class SqliteConnectionPool:
+    """
+    Owns one writer connection and one reader connection per thread.
+
+    All writes go through `write()`, which serializes writers and wraps the block in a single
+    transaction. Nested `write()` calls on the same thread join the outer transaction, so a whole
+    agent turn commits once. Readers get their own connection and, thanks to WAL, never block
+    on the writer. An in-memory database exists only inside the connection that opened it, so for
+    ":memory:" readers share the writer connection instead, one at a time.
+    """
+
+    def __init__(self, db_path: str, pragmas: Optional[dict[str, str | int]] = None):
+        self.db_path = db_path
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        self.in_memory = db_path in (":memory:", "")
+        self._writer = self._connect()
+        self._local = threading.local()
+        self._readers: list[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        with self._write_lock:
+            outermost = self._write_depth == 0
+            self._write_depth += 1
+            try:
+                if outermost:
+                    # The connection context manager commits on success and rolls back on error.
+                    with self._writer:
+                        yield self._writer
+                else:
+                    yield self._writer
+            finally:
+                self._write_depth -= 1
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        if self.in_memory:
+            with self._write_lock:
+                yield self._writer
+            return
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        yield conn
+
+    def close(self):
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        with self._write_lock:
+            self._writer.close()
@@ -0,0 +1,108 @@
+from typing import Optional
+
+import numpy as np
+
+
+class EmbeddingMatrix:
+    """
+    Contiguous float32 matrix of embeddings that grows by doubling, so appends are amortized O(1).
+
+    Row `i` of `matrix` is the embedding of the message with uid `row_to_uid[i]`.
+    """
+
+    # Whether `extend` on an empty matrix may take ownership of the caller's array.
+    adopts_buffers = True
+    # Whether growing copies the rows to a new buffer, so views of the old rows keep it alive.
+    copies_on_grow = True
+
+    def __init__(self, initial_capacity: int = 1024):
+        self.initial_capacity = initial_capacity
+        self.row_to_uid: list[str] = []
+        self.uid_to_row: dict[str, int] = {}
+        self._data: Optional[np.ndarray] = None
+        self._size = 0
+
+    @property
+    def dim(self) -> Optional[int]:
+        return None if self._data is None else self._data.shape[1]
+
+    @property
+    def capacity(self) -> int:
+        """Rows the current buffer holds before the next append grows it."""
+        return 0 if self._data is None else self._data.shape[0]
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """View of the filled rows. Only valid until the next append."""
+        if self._data is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._data[: self._size]
+
+    def append(self, uid: str, embedding) -> int:
+        if uid in self.uid_to_row:
+            return self.uid_to_row[uid]
+        vector = np.asarray(embedding, dtype=np.float32)
+        if self._data is None:
+            self._data = self._allocate(self.initial_capacity, vector.shape[0])
+        elif vector.shape[0] != self.dim:
+            raise ValueError(f"Embedding has {vector.shape[0]} dimensions, expected {self.dim}.")
+        if self._size == self._data.shape[0]:
+            self._grow(2 * self._data.shape[0])
+        row = self._size
+        self._data[row] = vector
+        self._size += 1
+        self.row_to_uid.append(uid)
+        self.uid_to_row[uid] = row
+        self._size_changed()
+        return row
+
+    def extend(self, uids: list[str], embeddings: np.ndarray):
+        """
+        Append many rows at once. An empty matrix adopts `embeddings` as its buffer without copying;
+        the buffer is only copied when a later append needs to grow it.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if len(uids) != embeddings.shape[0]:
+            raise ValueError(f"Got {len(uids)} uids for {embeddings.shape[0]} embeddings.")
+        if len(uids) == 0:
+            return
+        if any(uid in self.uid_to_row for uid in uids):
+            new_rows = [idx for idx, uid in enumerate(uids) if uid not in self.uid_to_row]
+            uids = [uids[idx] for idx in new_rows]
+            embeddings = embeddings[new_rows]
+        if self._size == 0 and self.adopts_buffers:
+            self._data = embeddings
+        else:
+            if self._data is None:
+                self._data = self._allocate(max(self.initial_capacity, embeddings.shape[0]), embeddings.shape[1])
+            if embeddings.shape[1] != self.dim:
+                raise ValueError(f"Embeddings have {embeddings.shape[1]} dimensions, expected {self.dim}.")
+            required = self._size + embeddings.shape[0]
+            if required > self._data.shape[0]:
+                self._grow(max(required, 2 * self._data.shape[0]))
+            self._data[self._size : required] = embeddings
+        start = self._size
+        self._size += embeddings.shape[0]
+        self.row_to_uid.extend(uids)
+        self.uid_to_row.update((uid, row) for row, uid in enumerate(uids, start=start))
+        self._size_changed()
+
+    def _allocate(self, capacity: int, dim: int) -> np.ndarray:
+        return np.empty((capacity, dim), dtype=np.float32)
+
+    def _grow(self, capacity: int):
+        data = self._allocate(capacity, self._data.shape[1])
+        data[: self._size] = self._data[: self._size]
+        self._data = data
+
+    def _size_changed(self):
+        """Hook for subclasses that persist the row count."""
+
+    def scores(self, query) -> np.ndarray:
+        """Dot product of every row against `query`, a single BLAS matrix-vector call."""
+        if self._size == 0:
+            return np.empty(0, dtype=np.float32)
+        return self.matrix @ np.asarray(query, dtype=np.float32)
+
+    def __len__(self):
+        return self._size
@@ -1,14 +1,27 @@
-from typing import Optional
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Iterable, Optional
 from llm_client.agent.memory.sql_backed_memory_objects import SqlInteraction
 from llm_client.agent.memory.message_store import MessageStore
 from llm_client.agent.memory.interaction import Interaction
 
 
 class InteractionStore:
+    """
+    Interactions by id, by user message, and in `created_at` order.
+
+    The time order is kept as it grows: new interactions are appended, an interaction older than
+    the newest is bisected into place, and a bulk load is sorted once. So the latest k, a time range
+    or a page costs O(k + log n) rather than a sort of everything.
+    """
+
     def __init__(self, message_store: MessageStore):
         self.message_store = message_store
         self.user_msg_id_to_interaction: dict[int, SqlInteraction] = {}
         self.id_to_interaction: dict[str, SqlInteraction] = {}
+        # Interactions oldest first, and their created_at values, in step, for bisecting.
+        self._time_ordered: list[SqlInteraction] = []
+        self._created_ats: list[datetime] = []
 
     def lookup_by_text(self, text: str) -> Optional[SqlInteraction]:
         user_message_id = self.message_store.lookup_by_text(text)
@@ -21,11 +34,63 @@ class InteractionStore:
         return self.id_to_interaction.get(interaction_id, None)
 
     def add_interaction(self, interaction: SqlInteraction):
+        self._discard_from_time_order(interaction.uid)
         self.user_msg_id_to_interaction[interaction.user_message_id] = interaction
         self.id_to_interaction[interaction.uid] = interaction
+        if len(self._created_ats) == 0 or interaction.created_at >= self._created_ats[-1]:
+            self._time_ordered.append(interaction)
+            self._created_ats.append(interaction.created_at)
+        else:
+            position = bisect_right(self._created_ats, interaction.created_at)
+            self._time_ordered.insert(position, interaction)
+            self._created_ats.insert(position, interaction.created_at)
+
+    def add_interactions(self, interactions: Iterable[SqlInteraction]):
+        """Bulk version of `add_interaction`, sorting once instead of bisecting each out-of-order row."""
+        for interaction in interactions:
+            self._discard_from_time_order(interaction.uid)
+            self.user_msg_id_to_interaction[interaction.user_message_id] = interaction
+            self.id_to_interaction[interaction.uid] = interaction
+            self._time_ordered.append(interaction)
+        # Stable, so interactions created at the same time keep the order they were added in.
+        self._time_ordered.sort(key=lambda interaction: interaction.created_at)
+        self._created_ats = [interaction.created_at for interaction in self._time_ordered]
+
+    def _discard_from_time_order(self, interaction_id: str):
+        known = self.id_to_interaction.get(interaction_id, None)
+        if known is None:
+            return
+        start = bisect_left(self._created_ats, known.created_at)
+        end = bisect_right(self._created_ats, known.created_at)
+        for position in range(start, end):
+            if self._time_ordered[position].uid == interaction_id:
+                del self._time_ordered[position]
+                del self._created_ats[position]
+                return
 
     def values(self) -> list[SqlInteraction]:
         return list(self.id_to_interaction.values())
 
     def time_sorted_interactions(self) -> list[SqlInteraction]:
-        return list(sorted(self.id_to_interaction.values(), key=lambda interaction: interaction.created_at))
+        """Every interaction, oldest first."""
+        return list(self._time_ordered)
+
+    def latest(self, k: int) -> list[SqlInteraction]:
+        """The `k` most recent interactions, newest first."""
+        if k <= 0:
+            return []
+        return self._time_ordered[: -k - 1 : -1]
+
+    def created_between(self, start: datetime, end: datetime) -> list[SqlInteraction]:
+        """Interactions created at or after `start` and before `end`, oldest first."""
+        return self._time_ordered[bisect_left(self._created_ats, start) : bisect_left(self._created_ats, end)]
+
+    def page(self, offset: int, limit: int, newest_first: bool = True) -> list[SqlInteraction]:
+        """`limit` interactions after skipping `offset`, counting from the newest by default."""
+        if newest_first:
+            end = len(self._time_ordered) - offset
+            return self._time_ordered[max(end - limit, 0) : max(end, 0)][::-1]
+        return self._time_ordered[offset : offset + limit]
+
+    def __len__(self):
+        return len(self._time_ordered)
@@ -0,0 +1,129 @@
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+import numpy as np
+
+from llm_client.agent.memory.embedding_matrix import EmbeddingMatrix
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class SidecarLockedError(RuntimeError):
+    """The embedding file is already open for appending, in this or another process."""
+
+
+class MappedEmbeddingMatrix(EmbeddingMatrix):
+    """
+    `EmbeddingMatrix` backed by an append-only, memory-mapped file.
+
+    The file is a 64 byte header (magic, dim, row count as uint64) followed by float32 rows. The
+    file is grown by doubling like the in-memory matrix, and the header's row count says how many
+    rows are valid. Restarted processes map the rows directly instead of decoding them, and every
+    process that maps the file shares the same page cache. Only one process may append to a file:
+    opening one takes an exclusive `flock` on it, held until `close`, and raises
+    `SidecarLockedError` if another process holds it.
+
+    The row for each message is recorded in `messages.embedding_row`; the BLOB in SQL stays the
+    source of truth and the file can always be rebuilt from it.
+    """
+
+    MAGIC = 0x31424D454D4C4C  # "LLMEMB1"
+    HEADER_SIZE = 64
+    adopts_buffers = False
+    # Old mappings are file-backed, so views of them cost page cache rather than a second copy.
+    copies_on_grow = False
+
+    def __init__(self, path: str | Path, initial_capacity: int = 1024):
+        super().__init__(initial_capacity)
+        self.path = Path(path)
+        self._lock_file: Optional[BinaryIO] = self._lock(self.path)
+        self._header: Optional[np.memmap] = None
+        if self.path.exists() and self.path.stat().st_size >= self.HEADER_SIZE:
+            self._map_header()
+            if self._header[0] != self.MAGIC:
+                raise ValueError(f"{self.path} is not an embedding file.")
+            if self.dim_on_disk > 0:
+                self._data = self._map_rows(self.dim_on_disk)
+
+    @staticmethod
+    def _lock(path: Path) -> Optional[BinaryIO]:
+        if fcntl is None:
+            return None
+        lock_file = open(path, "ab")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise SidecarLockedError(f"{path} is already open for writing.") from None
+        return lock_file
+
+    @property
+    def rows_on_disk(self) -> int:
+        """Number of valid rows in the file, which may be ahead of the rows attached to uids."""
+        return 0 if self._header is None else int(self._header[2])
+
+    @property
+    def dim_on_disk(self) -> int:
+        return 0 if self._header is None else int(self._header[1])
+
+    def attach(self, uids: list[str]):
+        """Bind the first `len(uids)` rows already in the file to `uids`, in order, without copying."""
+        if len(uids) != self.rows_on_disk:
+            raise ValueError(f"{self.path} holds {self.rows_on_disk} rows, got {len(uids)} uids.")
+        self.row_to_uid = list(uids)
+        self.uid_to_row = {uid: row for row, uid in enumerate(uids)}
+        self._size = len(uids)
+
+    def reset(self):
+        """Forget every row, keeping the file's capacity."""
+        self.row_to_uid = []
+        self.uid_to_row = {}
+        self._size = 0
+        if self._header is not None:
+            self._header[2] = 0
+
+    def _map_header(self):
+        self._header = np.memmap(self.path, dtype=np.uint64, mode="r+", shape=(self.HEADER_SIZE // 8,))
+
+    def _map_rows(self, dim: int) -> np.ndarray:
+        capacity = (self.path.stat().st_size - self.HEADER_SIZE) // (dim * 4)
+        return np.memmap(self.path, dtype=np.float32, mode="r+", offset=self.HEADER_SIZE, shape=(capacity, dim))
+
+    def _allocate(self, capacity: int, dim: int) -> np.ndarray:
+        if self.dim_on_disk not in (0, dim):
+            raise ValueError(f"{self.path} holds {self.dim_on_disk} dimensional embeddings, got {dim}.")
+        self._resize_file(capacity, dim)
+        if self._header is None:
+            self._map_header()
+        self._header[0] = self.MAGIC
+        self._header[1] = dim
+        return self._map_rows(dim)
+
+    def _grow(self, capacity: int):
+        # Rows already live in the file, so growing is a resize and a fresh mapping, never a copy.
+        self._data = self._allocate(capacity, self._data.shape[1])
+
+    def _resize_file(self, capacity: int, dim: int):
+        size = self.HEADER_SIZE + capacity * dim * 4
+        with open(self.path, "ab") as _f:
+            if _f.tell() < size:
+                _f.truncate(size)
+
+    def _size_changed(self):
+        self._header[2] = self._size
+
+    def flush(self):
+        if self._data is not None and isinstance(self._data, np.memmap):
+            self._data.flush()
+        if self._header is not None:
+            self._header.flush()
+
+    def close(self):
+        """Flush and release the file to other processes. Rows already mapped stay readable."""
+        self.flush()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
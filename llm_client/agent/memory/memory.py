@@ -1,5 +1,9 @@
-from typing import TypeAlias, Iterable
-from datetime import datetime
+from typing import Callable, TypeAlias, Iterable, Optional, Union
+from datetime import datetime, timedelta
+from pathlib import Path
+from concurrent.futures import Executor
+import asyncio
+import threading
 import operator
 
 from pydantic import BaseModel
@@ -7,43 +11,110 @@ import numpy as np
 import sqlite3
 
 from llm_client.agent.prompt import Prompt
-from llm_client.llm_utils import create_embedding_with_ada
+from llm_client.llm_utils import acreate_embeddings, create_embedding_with_ada, create_embeddings
+from llm_client.token_counter import TOKEN_COUNT_MODEL, count_tokens
 from llm_client.types.openai import Role, Message
 
-from llm_client.agent.memory.sql_backed_memory_objects import SqlMessage, SqlInteraction, Vector
+from llm_client.agent.memory.sql_backed_memory_objects import (
+    SqlMessage,
+    SqlInteraction,
+    Vector,
+    create_memory_tables,
+)
+from llm_client.agent.memory.connection_pool import SqliteConnectionPool
+from llm_client.agent.memory.rw_lock import ReadWriteLock
+from llm_client.agent.memory.unit_of_work import UnitOfWork
 from llm_client.agent.memory.message_store import MessageStore
+from llm_client.agent.memory.embedding_matrix import EmbeddingMatrix
+from llm_client.agent.memory.vector_index import VectorIndex, ExactIndex, top_k
 from llm_client.agent.memory.interaction_store import InteractionStore
 from llm_client.agent.memory.interaction import Interaction
 from llm_client.agent.memory.remembered_interaction import RememberedInteraction
 
 
 class Memory:
-    def __init__(self, database_file: str):
-        self.message_store = MessageStore()
+    """
+    The agent's long-term memory: SQL rows plus in-memory stores and search indexes over them.
+
+    One Memory can be shared by many sessions on different threads. Searches and lookups hold
+    `lock` for reading; `commit` serializes writers and holds it for writing only while it
+    publishes new rows to the in-memory stores, never during SQL or embedding requests.
+    """
+
+    def __init__(
+        self,
+        database_file: str,
+        index_factory: Callable[[EmbeddingMatrix], VectorIndex] = ExactIndex,
+        embedding_sidecar: bool = True,
+    ):
+        """
+        Args:
+            database_file: Path of the SQLite database.
+            index_factory: Builds the nearest-neighbour index for each role's embeddings. The exact
+                scan is the default; approximate indexes such as `IVFFlatIndex` trade recall for
+                latency and are opt-in.
+            embedding_sidecar: Keep embeddings in memory-mapped files next to the database
+                (`memory.user.embeddings`, ...) so restarts map them instead of decoding BLOBs.
+        """
+        sidecar_prefix = None
+        if embedding_sidecar and database_file != ":memory:":
+            sidecar_prefix = str(Path(database_file).with_suffix(""))
+        self._commit_lock = threading.Lock()
+        self.lock = ReadWriteLock()
+        self.message_store = MessageStore(index_factory, sidecar_prefix, self.lock)
         self.interaction_store = InteractionStore(self.message_store)
         self.db_path = database_file
+        self.pool = SqliteConnectionPool(database_file)
+        # Whether messages are indexed for `k_most_similar_lexical`; SQLite may lack FTS5.
+        self.has_text_search = False
         self._create_db_tables()
         self.load()
 
+    def close(self):
+        self.message_store.close()
+        self.pool.close()
+
     def load(self):
-        with sqlite3.connect(self.db_path) as conn:
-            sql_messages: list[SqlMessage] = SqlMessage.load_all(conn)
-            for message in sql_messages:
-                self.message_store.add_message(message)
-            sql_interactions: list[SqlInteraction] = SqlInteraction.load_all(conn)
-            for interaction in sql_interactions:
-                self.interaction_store.add_interaction(interaction)
+        with self.pool.read() as conn, self.lock.write():
+            loaded = False
+            if self.message_store.has_sidecars:
+                loaded = self.message_store.attach_messages(SqlMessage.load_all_without_embeddings(conn))
+            if not loaded:
+                # No sidecars yet, or they are out of step with the database: rebuild from the BLOBs.
+                sql_messages, embeddings = SqlMessage.load_all_bulk(conn)
+                self.message_store.reset_sidecars()
+                self.message_store.add_messages(sql_messages, embeddings)
+                if self.message_store.has_sidecars:
+                    self._save_embedding_rows(sql_messages)
+            self._save_token_counts(self.message_store.values())
+            self.interaction_store.add_interactions(SqlInteraction.load_all(conn))
 
-    def _create_db_tables(self):
-        with sqlite3.connect(self.db_path) as conn:
-            for table in SqlMessage.sql_tables():
-                cursor = conn.cursor()
-                cursor.execute(table)
+    def _save_embedding_rows(self, messages: list[SqlMessage]):
+        for message in messages:
+            message.embedding_row = self.message_store.embeddings[message.role].uid_to_row[message.uid]
+        self.message_store.flush()
+        with self.pool.write() as conn:
+            conn.executemany(
+                "UPDATE messages SET embedding_row = ? WHERE id = ?",
+                [(message.embedding_row, message.uid) for message in messages],
+            )
 
-            for table in SqlInteraction.sql_tables():
-                cursor = conn.cursor()
-                cursor.execute(table)
-            conn.commit()
+    def _save_token_counts(self, messages: list[SqlMessage]):
+        """Count tokens once for messages stored before counts were kept in the database."""
+        uncounted = [message for message in messages if message.token_count is None]
+        if len(uncounted) == 0:
+            return
+        for message in uncounted:
+            message.token_count = count_tokens(message.text, TOKEN_COUNT_MODEL)
+        with self.pool.write() as conn:
+            conn.executemany(
+                "UPDATE messages SET token_count = ? WHERE id = ?",
+                [(message.token_count, message.uid) for message in uncounted],
+            )
+
+    def _create_db_tables(self):
+        with self.pool.write() as conn:
+            self.has_text_search = create_memory_tables(conn)
 
     def get_message_id(self, role: Role, text: str):
         return self.get_message(role, text).uid
@@ -51,13 +122,67 @@ class Memory:
     def get_message(self, role: Role, text: str):
         sqlmessage: SqlMessage = self.message_store.lookup_by_text(role, text)
         if sqlmessage is None:
-            sqlmessage = SqlMessage(role=role.value, text=text, embedding=Vector(data=create_embedding_with_ada(text)))
+            sqlmessage = self._new_message(role, text, create_embedding_with_ada(text))
+        return sqlmessage
+
+    async def aget_message(self, role: Role, text: str) -> SqlMessage:
+        """`get_message` for code running on an event loop; the embedding request doesn't block it."""
+        sqlmessage: SqlMessage = self.message_store.lookup_by_text(role, text)
+        if sqlmessage is None:
+            sqlmessage = self._new_message(role, text, (await acreate_embeddings([text]))[0])
         return sqlmessage
 
+    @staticmethod
+    def _new_message(role: Role, text: str, embedding: list[float]) -> SqlMessage:
+        return SqlMessage(
+            role=role.value,
+            text=text,
+            # A float32 array, like loaded messages: a list of Python floats is 8x the size.
+            embedding=Vector.construct(data=np.asarray(embedding, dtype=np.float32)),
+            token_count=count_tokens(text, TOKEN_COUNT_MODEL),
+        )
+
+    @staticmethod
+    def unembedded_message(role: Role, text: str) -> SqlMessage:
+        """
+        A message whose embedding couldn't be fetched. It can go in a prompt and be matched by
+        keywords, but must be replaced through `get_message` before it is stored.
+        """
+        token_count = count_tokens(text, TOKEN_COUNT_MODEL)
+        return SqlMessage.construct(role=role, text=text, embedding=None, token_count=token_count)
+
+    def get_messages(self, role: Role, texts: list[str]) -> list[SqlMessage]:
+        """Batch version of `get_message`: every text new to the store is embedded in one request."""
+        messages = [self.message_store.lookup_by_text(role, text) for text in texts]
+        new_texts = list(dict.fromkeys(text for text, message in zip(texts, messages) if message is None))
+        new_messages = {
+            text: self._new_message(role, text, embedding)
+            for text, embedding in zip(new_texts, create_embeddings(new_texts))
+        }
+        return [message if message is not None else new_messages[text] for text, message in zip(texts, messages)]
+
     def add_interaction(self, prompt: Prompt, reply: str):
-        user_message_id = self._save_message(prompt.user_message)
-        response_message_id = self._save_message(self.get_message(Role.Assistant, reply))
-        system_message_ids = [self._save_message(message) for message in prompt.system_messages]
+        self.store_interaction(prompt, self.get_message(Role.Assistant, reply))
+
+    async def aadd_interaction(self, prompt: Prompt, reply: str, executor: Optional[Executor] = None):
+        """
+        `add_interaction` for code running on an event loop; the SQL write runs on a thread of
+        `executor`, or of the loop's default executor.
+        """
+        reply_message = await self.aget_message(Role.Assistant, reply)
+        await asyncio.get_running_loop().run_in_executor(executor, self.store_interaction, prompt, reply_message)
+
+    def store_interaction(self, prompt: Prompt, reply_message: SqlMessage):
+        """Commit the turn answered by `reply_message`, with any of its messages not yet stored."""
+        # Stage under the commit lock, so two sessions can't both store a system message new to both.
+        with self._commit_lock:
+            self._commit(self._stage_interaction(prompt, reply_message))
+
+    def _stage_interaction(self, prompt: Prompt, reply_message: SqlMessage) -> UnitOfWork:
+        unit = UnitOfWork()
+        user_message_id = self._stage_message(unit, prompt.user_message)
+        response_message_id = self._stage_message(unit, reply_message)
+        system_message_ids = [self._stage_message(unit, message) for message in prompt.system_messages]
         relevant_interaction_ids = [
             remembered_interaction.uid for remembered_interaction in prompt.relevant_interactions
         ]
@@ -70,7 +195,8 @@ class Memory:
             relevant_interaction_ids=relevant_interaction_ids,
             recent_interaction_ids=recent_interaction_ids,
         )
-        self._save_interaction(interaction)
+        unit.add_interaction(interaction)
+        return unit
 
     def get_remembered_interaction_from_id(self, interaction_id):
         interaction = self.interaction_store.lookup_by_id(interaction_id)
@@ -80,6 +206,10 @@ class Memory:
         )
 
     def render_prior_interaction(self, interaction: SqlInteraction) -> RememberedInteraction:
+        with self.lock.read():
+            return self._render_prior_interaction(interaction)
+
+    def _render_prior_interaction(self, interaction: SqlInteraction) -> RememberedInteraction:
         # system_msgs = [self.message_store.lookup_by_id(message_id) for message_id in interaction.system_message_ids]
         # relevant_rememberances = [
         #     self.get_remembered_interaction_from_id(interaction_id)
@@ -98,18 +228,37 @@ class Memory:
             response_message=self.message_store.lookup_by_id(interaction.response_message_id).text,
         )
 
-    def _save_message(self, message: SqlMessage) -> str:
-        if self.message_store.lookup_by_id(message.uid) is None:
-            with sqlite3.connect(self.db_path) as conn:
-                message.save_to_sql(conn)
-            self.message_store.add_message(message)
+    def _stage_message(self, unit: UnitOfWork, message: SqlMessage) -> str:
+        # Another session may have stored the same text since `message` was made; reuse its row.
+        stored = self.message_store.lookup_by_text(message.role, message.text)
+        if stored is not None:
+            return stored.uid
+        unit.add_message(message)
         return message.uid
 
-    def _save_interaction(self, interaction: SqlMessage) -> str:
-        if self.interaction_store.lookup_by_id(interaction.uid) is None:
-            with sqlite3.connect(self.db_path) as conn:
-                interaction.save_to_sql(conn)
-        self.interaction_store.add_interaction(interaction)
+    def commit(self, unit: UnitOfWork):
+        """Flush the staged rows in one transaction, then publish them to the in-memory stores."""
+        with self._commit_lock:
+            self._commit(unit)
+
+    def _commit(self, unit: UnitOfWork):
+        if len(unit) == 0:
+            return
+        # Rows are handed out in commit order, so the row recorded in SQL is the row the message
+        # is appended at once the transaction has committed. Only sidecar rows are recorded; rows
+        # of an in-RAM matrix mean nothing to the next process.
+        next_rows = {role: len(matrix) for role, matrix in self.message_store.embeddings.items()}
+        for message in unit.messages:
+            if self.message_store.has_sidecars:
+                message.embedding_row = next_rows[message.role]
+                next_rows[message.role] += 1
+        with self.pool.write() as conn:
+            unit.flush(conn)
+        with self.lock.write():
+            for message in unit.messages:
+                self.message_store.add_message(message)
+            for interaction in unit.interactions:
+                self.interaction_store.add_interaction(interaction)
 
     @property
     def messages(self) -> list[SqlMessage]:
@@ -138,27 +287,248 @@ class Memory:
 
         Returns: List[str]
         """
-        return self.k_most_similar_interactions(text, self.non_system_messages, k)
+        return self.k_most_similar_interactions(text, [Role.User, Role.Assistant], k)
 
     def k_most_similar_inputs(self, text: str, k: int) -> list[Interaction]:
-        return self.k_most_similar_interactions(text, self.user_messages, k)
+        return self.k_most_similar_interactions(text, [Role.User], k)
+
+    def k_most_similar_messages(self, text: str, roles: Iterable[Role], k: int) -> list[SqlMessage]:
+        return [message for message, _ in self.k_most_similar_messages_scored(text, roles, k)]
+
+    def k_most_similar_messages_scored(
+        self, text: str, roles: Iterable[Role], k: int, query_embedding: Optional[list[float]] = None
+    ) -> list[tuple[SqlMessage, float]]:
+        """
+        The `k` messages most similar to `text`, best first, with their cosine similarity. Pass
+        `query_embedding` when the embedding of `text` is already at hand to skip fetching it.
+        """
+        roles = list(roles)
+        if all(len(self.message_store.embeddings[role]) == 0 for role in roles):
+            return []
+        test_embedding = query_embedding if query_embedding is not None else create_embedding_with_ada(text)
+
+        with self.lock.read():
+            roles = [role for role in roles if len(self.message_store.embeddings[role]) > 0]
+            # What if scores were weighted by how frequent they appear as well?  What would that look like?
+            uids: list[str] = []
+            scores: list[np.ndarray] = []
+            for role in roles:
+                rows, role_scores = self.message_store.indexes[role].search(test_embedding, k)
+                row_to_uid = self.message_store.embeddings[role].row_to_uid
+                uids += [row_to_uid[row] for row in rows]
+                scores.append(role_scores)
+            all_scores = np.concatenate(scores)
+            return [
+                (self.message_store.lookup_by_id(uids[idx]), float(all_scores[idx])) for idx in top_k(all_scores, k)
+            ]
 
-    def k_most_similar_messages(self, text: str, messages: list[SqlMessage], k: int) -> list[SqlMessage]:
-        if len(messages) == 0:
+    def k_most_similar_batch(
+        self,
+        queries: Union[list[str], np.ndarray],
+        k: int,
+        roles: Iterable[Role] = (Role.User, Role.Assistant),
+        exact: bool = False,
+    ) -> list[list[tuple[SqlMessage, float]]]:
+        """
+        `k_most_similar_messages_scored` for many queries at once, for offline jobs such as
+        re-ranking a whole transcript or evaluating retrieval.
+
+        Args:
+            queries: Texts, embedded in as few requests as possible, or an (n, dim) array of embeddings.
+            k: Matches per query.
+            roles: Only search messages of these roles.
+            exact: Scan every row, with blocked matrix-matrix products, instead of the ANN indexes.
+                Use it for recall ground truth.
+
+        Returns: For each query, its `k` best messages, best first, with their cosine similarity.
+        """
+        roles = list(roles)
+        if len(queries) == 0:
             return []
-        test_embedding: list[float] = create_embedding_with_ada(text)
-        embeddings: list[list[float]] = [message.embedding.data for message in messages]
+        if isinstance(queries[0], str):
+            queries = create_embeddings(list(queries))
+        query_embeddings = np.asarray(queries, dtype=np.float32)
+
+        with self.lock.read():
+            per_role = []
+            for role in roles:
+                if len(self.message_store.embeddings[role]) == 0:
+                    continue
+                index = self.message_store.indexes[role]
+                if exact:
+                    index = ExactIndex(self.message_store.embeddings[role])
+                row_to_uid = self.message_store.embeddings[role].row_to_uid
+                per_role.append((row_to_uid, index.search_batch(query_embeddings, k)))
+            results = []
+            for query_idx in range(len(query_embeddings)):
+                uids: list[str] = []
+                scores: list[np.ndarray] = []
+                for row_to_uid, role_results in per_role:
+                    rows, role_scores = role_results[query_idx]
+                    uids += [row_to_uid[row] for row in rows]
+                    scores.append(role_scores)
+                all_scores = np.concatenate(scores) if len(scores) > 0 else np.empty(0, dtype=np.float32)
+                best = top_k(all_scores, k)
+                results.append([(self.message_store.lookup_by_id(uids[idx]), float(all_scores[idx])) for idx in best])
+            return results
+
+    def k_most_similar_lexical(self, text: str, roles: Iterable[Role], k: int) -> list[tuple[SqlMessage, float]]:
+        """
+        The `k` messages whose words best match `text` under BM25, best first, with their BM25 score.
+        Needs no embedding, so it can run while the query is still being embedded, or after embedding
+        it failed. Finds exact names and error codes that embeddings blur.
+        """
+        if not self.has_text_search:
+            return []
+        with self.pool.read() as conn:
+            matches = SqlMessage.search_text(conn, text, roles, k)
+        with self.lock.read():
+            found = [(self.message_store.lookup_by_id(uid), score) for uid, score in matches]
+        # A message committed by another session may not be published to the stores yet.
+        return [(message, score) for message, score in found if message is not None]
+
+    def k_most_similar_hybrid(
+        self,
+        text: str,
+        roles: Iterable[Role],
+        k: int,
+        query_embedding: Optional[list[float]] = None,
+        lexical: Optional[list[tuple[SqlMessage, float]]] = None,
+        rrf_k: int = 60,
+    ) -> list[tuple[SqlMessage, float]]:
+        """
+        The `k` best messages by reciprocal-rank fusion of the embedding and BM25 rankings: each
+        message scores the sum of 1 / (rrf_k + rank) over the rankings it appears in, so a message
+        near the top of either ranking does well, without having to calibrate cosine against BM25.
+
+        Pass `lexical`, from `k_most_similar_lexical`, when it was fetched while `text` was embedded.
+        """
+        roles = list(roles)
+        if lexical is None:
+            lexical = self.k_most_similar_lexical(text, roles, k)
+        semantic = self.k_most_similar_messages_scored(text, roles, k, query_embedding)
+        return reciprocal_rank_fusion([semantic, lexical], k, rrf_k)
+
+    def k_most_similar_interactions(self, text: str, roles: Iterable[Role], k: int) -> list[SqlInteraction]:
+        return [interaction for interaction, _ in self.k_most_similar_interactions_scored(text, roles, k)]
 
-        # What if scores were weighted by how frequent they appear as well?  What would that look like?
-        scores = np.dot(embeddings, test_embedding)
+    def k_most_similar_interactions_scored(
+        self, text: str, roles: Iterable[Role], k: int, query_embedding: Optional[list[float]] = None
+    ) -> list[tuple[SqlInteraction, float]]:
+        return [
+            (self.interaction_store.lookup_by_user_msg_id(message.uid), score)
+            for message, score in self.k_most_similar_messages_scored(text, roles, k, query_embedding)
+        ]
 
-        return [messages[idx] for idx in np.argsort(scores)[-k:][::-1]]
+    def k_most_similar_interactions_lexical(
+        self, text: str, roles: Iterable[Role], k: int, lexical: Optional[list[tuple[SqlMessage, float]]] = None
+    ) -> list[tuple[SqlInteraction, float]]:
+        if lexical is None:
+            lexical = self.k_most_similar_lexical(text, roles, k)
+        return [(self.interaction_store.lookup_by_user_msg_id(message.uid), score) for message, score in lexical]
 
-    def k_most_similar_interactions(self, text: str, messages: list[SqlMessage], k: int) -> list[SqlInteraction]:
+    def k_most_similar_interactions_hybrid(
+        self,
+        text: str,
+        roles: Iterable[Role],
+        k: int,
+        query_embedding: Optional[list[float]] = None,
+        lexical: Optional[list[tuple[SqlMessage, float]]] = None,
+    ) -> list[tuple[SqlInteraction, float]]:
         return [
-            self.interaction_store.lookup_by_user_msg_id(message.uid)
-            for message in self.k_most_similar_messages(text, messages, k)
+            (self.interaction_store.lookup_by_user_msg_id(message.uid), score)
+            for message, score in self.k_most_similar_hybrid(text, roles, k, query_embedding, lexical)
         ]
 
-    def k_most_recent(self, k: int):
-        return self.interaction_store.time_sorted_interactions()[:k:][::-1]
+    def rank_interactions(
+        self,
+        interaction_ids: Iterable[str],
+        query_embedding: list[float],
+        now: Optional[datetime] = None,
+        half_life: timedelta = timedelta(days=1),
+        recency_weight: float = 0.3,
+        diversity: float = 0.3,
+    ) -> list[tuple[SqlInteraction, float]]:
+        """
+        One ranked list, without duplicates, of interactions gathered by separate searches (similar,
+        recent, keyword). Each interaction's relevance mixes the cosine similarity of its user message
+        to the query, floored at zero, with exponential decay on its age:
+
+            relevance = (1 - recency_weight) * max(similarity, 0) + recency_weight * 0.5 ** (age / half_life)
+
+        They are then picked by maximal marginal relevance, each pick maximizing
+
+            relevance * (1 - diversity * (similarity to the closest interaction already picked))
+
+        so near-duplicates sink below distinct memories. Returns the interactions in pick order, with
+        the score they were picked at. Scores are never negative, so they can be packed as they are.
+        """
+        with self.lock.read():
+            interactions = [self.interaction_store.lookup_by_id(uid) for uid in dict.fromkeys(interaction_ids)]
+            interactions = [interaction for interaction in interactions if interaction is not None]
+            if len(interactions) == 0:
+                return []
+            matrix = self.message_store.embeddings[Role.User]
+            rows = [matrix.uid_to_row[interaction.user_message_id] for interaction in interactions]
+            # Fancy indexing copies, so the rows stay valid after the lock is released.
+            embeddings = matrix.matrix[rows]
+
+        created_ats = np.array([interaction.created_at for interaction in interactions], dtype="datetime64[us]")
+        now = np.datetime64(now if now is not None else datetime.utcnow(), "us")
+        ages = np.maximum((now - created_ats) / np.timedelta64(1, "s"), 0)
+        decay = 0.5 ** (ages / half_life.total_seconds())
+        similarity = embeddings @ np.asarray(query_embedding, dtype=np.float32)
+        relevance = (1 - recency_weight) * np.maximum(similarity, 0) + recency_weight * decay
+        order, scores = maximal_marginal_relevance(relevance, embeddings @ embeddings.T, diversity)
+        return [(interactions[idx], score) for idx, score in zip(order.tolist(), scores.tolist())]
+
+    def k_most_recent(self, k: int) -> list[SqlInteraction]:
+        """The `k` most recent interactions, newest first."""
+        with self.lock.read():
+            return self.interaction_store.latest(k)
+
+    def interactions_created_between(self, start: datetime, end: datetime) -> list[SqlInteraction]:
+        """
+        Interactions created at or after `start` and before `end`, oldest first. Read from the
+        database, so callers that only need an old stretch of history don't depend on what is in RAM.
+        """
+        with self.pool.read() as conn:
+            return SqlInteraction.load_created_between(conn, start, end)
+
+
+def reciprocal_rank_fusion(
+    rankings: list[list[tuple[SqlMessage, float]]], k: int, rrf_k: int = 60
+) -> list[tuple[SqlMessage, float]]:
+    """The `k` best messages over several best-first rankings, with their fused scores, best first."""
+    fused: dict[str, float] = {}
+    messages: dict[str, SqlMessage] = {}
+    for ranking in rankings:
+        for rank, (message, _) in enumerate(ranking):
+            fused[message.uid] = fused.get(message.uid, 0.0) + 1 / (rrf_k + rank + 1)
+            messages[message.uid] = message
+    best = sorted(fused, key=fused.get, reverse=True)[:k]
+    return [(messages[uid], fused[uid]) for uid in best]
+
+
+def maximal_marginal_relevance(
+    relevance: np.ndarray, pairwise_similarity: np.ndarray, diversity: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Greedy MMR order of every candidate, and the marginal score each was picked at. Diversity
+    discounts relevance by a factor rather than subtracting from it, so a candidate's score stays
+    between `(1 - diversity) * relevance` and `relevance`. Each step is a few array operations over
+    all candidates; the closest-pick similarities are kept up to date instead of being recomputed.
+    """
+    picked = np.zeros(len(relevance), dtype=bool)
+    closest = np.zeros(len(relevance))
+    order = np.empty(len(relevance), dtype=np.int64)
+    scores = np.empty(len(relevance))
+    for step in range(len(relevance)):
+        marginal = relevance * (1 - diversity * closest)
+        marginal[picked] = -np.inf
+        best = int(np.argmax(marginal))
+        order[step] = best
+        scores[step] = marginal[best]
+        picked[best] = True
+        closest = np.clip(np.maximum(closest, pairwise_similarity[best]), 0, 1)
+    return order, scores
@@ -1,12 +1,55 @@
-from typing import Optional
-from llm_client.agent.memory.sql_backed_memory_objects import SqlMessage
+from typing import Callable, Optional
+from itertools import groupby
+
+import numpy as np
+
+from llm_client.agent.memory.sql_backed_memory_objects import SqlMessage, Vector
+from llm_client.agent.memory.embedding_matrix import EmbeddingMatrix
+from llm_client.agent.memory.mapped_embedding_matrix import MappedEmbeddingMatrix, SidecarLockedError
+from llm_client.agent.memory.rw_lock import ReadWriteLock
+from llm_client.agent.memory.vector_index import VectorIndex, ExactIndex
+from llm_client.logs import logger
 from llm_client.types.openai import Role
 
 
 class MessageStore:
-    def __init__(self):
+    def __init__(
+        self,
+        index_factory: Callable[[EmbeddingMatrix], VectorIndex] = ExactIndex,
+        sidecar_prefix: Optional[str] = None,
+        lock: Optional[ReadWriteLock] = None,
+    ):
+        """
+        Args:
+            index_factory: Builds the nearest-neighbour index for each role's embedding matrix.
+            sidecar_prefix: When set, each role's embeddings live in a memory-mapped
+                `{sidecar_prefix}.{role}.embeddings` file instead of RAM, unless another process
+                already has the files open, in which case they are kept in RAM.
+            lock: The lock held for writing around every change to the store, handed to the indexes
+                so they can rebuild in the background and publish under it.
+        """
         self.hash_to_message: dict[Role, dict[int, SqlMessage]] = {Role.System: {}, Role.User: {}, Role.Assistant: {}}
         self.id_to_message: dict[str, SqlMessage] = {}
+        self.embeddings: dict[Role, EmbeddingMatrix] = self._open_embeddings(sidecar_prefix)
+        self.indexes: dict[Role, VectorIndex] = {role: index_factory(self.embeddings[role]) for role in Role}
+        for index in self.indexes.values():
+            index.lock = lock
+
+    @staticmethod
+    def _open_embeddings(sidecar_prefix: Optional[str]) -> dict[Role, EmbeddingMatrix]:
+        if sidecar_prefix is None:
+            return {role: EmbeddingMatrix() for role in Role}
+        opened: dict[Role, EmbeddingMatrix] = {}
+        try:
+            for role in Role:
+                opened[role] = MappedEmbeddingMatrix(f"{sidecar_prefix}.{role.value}.embeddings")
+        except SidecarLockedError as err:
+            # Appending next to the owner would overwrite its rows, so this process keeps its own copy.
+            logger.warn(f"{err} Keeping embeddings in memory instead.")
+            for matrix in opened.values():
+                matrix.close()
+            return {role: EmbeddingMatrix() for role in Role}
+        return opened
 
     def lookup_by_text(self, role: Role, text: str) -> Optional[SqlMessage]:
         return self.hash_to_message[role].get(hash(text), None)
@@ -17,7 +60,95 @@ class MessageStore:
     def add_message(self, message: SqlMessage):
         self.hash_to_message[message.role][hash(message)] = message
         self.id_to_message[message.uid] = message
-    
+        matrix = self.embeddings[message.role]
+        size, capacity = len(matrix), matrix.capacity
+        row = matrix.append(message.uid, message.embedding.data)
+        if len(matrix) > size:
+            self._bind_embeddings(message.role, size, capacity)
+            self.indexes[message.role].add(row)
+
+    def add_messages(self, messages: list[SqlMessage], embeddings: np.ndarray):
+        """
+        Bulk version of `add_message` for `SqlMessage.load_all_bulk` output: messages grouped by role,
+        with `embeddings` holding their vectors in the same order.
+        """
+        for message in messages:
+            self.hash_to_message[message.role][hash(message)] = message
+            self.id_to_message[message.uid] = message
+        start = 0
+        for role, group in groupby(messages, key=lambda message: message.role):
+            uids = [message.uid for message in group]
+            end = start + len(uids)
+            matrix = self.embeddings[role]
+            size, capacity = len(matrix), matrix.capacity
+            matrix.extend(uids, embeddings[start:end])
+            # Once a sidecar file has copied them, `embeddings` is no longer kept alive as a second copy.
+            self._bind_embeddings(role, size, capacity)
+            self.indexes[role].add_rows(range(size, len(matrix)))
+            start = end
+
+    def _bind_embeddings(self, role: Role, size: int, capacity: int):
+        """
+        Point the messages appended to the role's matrix since it held `size` rows in `capacity` at
+        their rows, so each embedding is stored once. If the matrix has since copied its rows to a
+        bigger buffer, every message is moved over, or the old buffer would stay alive.
+        """
+        matrix = self.embeddings[role]
+        if matrix.copies_on_grow and matrix.capacity != capacity:
+            size = 0
+        rows = matrix.matrix
+        for row in range(size, len(matrix)):
+            self.id_to_message[matrix.row_to_uid[row]].embedding = Vector.construct(data=rows[row])
+
+    @property
+    def has_sidecars(self) -> bool:
+        return all(isinstance(matrix, MappedEmbeddingMatrix) for matrix in self.embeddings.values())
+
+    def attach_messages(self, messages: list[SqlMessage]) -> bool:
+        """
+        Load messages whose embeddings are already in the sidecar files, without copying them.
+
+        Returns False, leaving the store untouched, unless every message has an `embedding_row` and
+        each role's rows are exactly the rows in its file.
+        """
+        if not self.has_sidecars:
+            return False
+        by_role: dict[Role, list[SqlMessage]] = {role: [] for role in Role}
+        for message in messages:
+            if message.embedding_row is None:
+                return False
+            by_role[message.role].append(message)
+        for role, role_messages in by_role.items():
+            rows = np.sort(np.fromiter((message.embedding_row for message in role_messages), dtype=np.int64))
+            if not np.array_equal(rows, np.arange(self.embeddings[role].rows_on_disk)):
+                return False
+
+        for role, role_messages in by_role.items():
+            role_messages.sort(key=lambda message: message.embedding_row)
+            matrix = self.embeddings[role]
+            matrix.attach([message.uid for message in role_messages])
+            for message, embedding in zip(role_messages, matrix.matrix):
+                message.embedding = Vector.construct(data=embedding)
+            self.indexes[role].add_rows(range(len(matrix)))
+        for message in messages:
+            self.hash_to_message[message.role][hash(message)] = message
+            self.id_to_message[message.uid] = message
+        return True
+
+    def reset_sidecars(self):
+        for matrix in self.embeddings.values():
+            if isinstance(matrix, MappedEmbeddingMatrix):
+                matrix.reset()
+
+    def flush(self):
+        for matrix in self.embeddings.values():
+            if isinstance(matrix, MappedEmbeddingMatrix):
+                matrix.flush()
+
+    def close(self):
+        for matrix in self.embeddings.values():
+            if isinstance(matrix, MappedEmbeddingMatrix):
+                matrix.close()
+
     def values(self) -> list[SqlMessage]:
         return list(self.id_to_message.values())
-    
\ No newline at end of file
@@ -0,0 +1,48 @@
+"""A readers-writer lock for the in-memory stores shared by concurrent agent sessions."""
+from contextlib import contextmanager
+from typing import Iterator
+import threading
+
+
+class ReadWriteLock:
+    """
+    Any number of concurrent readers, or a single writer.
+
+    Writers are preferred: once a writer is waiting, new readers queue behind it, so a steady stream
+    of searches can't starve a commit. Not reentrant; don't take `read()` inside `read()`.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        with self._condition:
+            while self._writer or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = False
+                self._condition.notify_all()
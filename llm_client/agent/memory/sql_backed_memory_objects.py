@@ -1,21 +1,94 @@
-from typing import Optional
+from itertools import groupby
+from operator import itemgetter
+from typing import Iterable, Optional
 from dateutil.parser import parse as parse_date_string
-import struct
 from uuid import uuid4
 from pydantic import BaseModel, Field
 from datetime import datetime
+import re
 import sqlite3
+import unicodedata
+
+import numpy as np
 
 from llm_client.types.openai import Role
 
 
+INSERT_MESSAGE_SQL = (
+    "INSERT INTO messages (id, timestamp, role, content, embedding, embedding_row, token_count)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?);"
+)
+INSERT_INTERACTION_SQL = (
+    "INSERT INTO interactions (created_at, id, user_message_id, response_message_id) VALUES (?, ?, ?, ?);"
+)
+INSERT_SYSTEM_MESSAGE_LINK_SQL = (
+    "INSERT INTO interaction_system_messages (interaction_id, system_message_id) VALUES (?, ?);"
+)
+INSERT_RELEVANT_INTERACTION_LINK_SQL = (
+    "INSERT INTO interaction_relevant_interactions (interaction_id, related_interaction_id) VALUES (?, ?);"
+)
+INSERT_RECENT_INTERACTION_LINK_SQL = (
+    "INSERT INTO interaction_recent_interactions (interaction_id, related_interaction_id) VALUES (?, ?);"
+)
+
+# Full-text index over messages.content, kept in step with the messages table by triggers. It is an
+# external-content table, so the text is stored once, in messages, and FTS5 only keeps the index.
+# Role is indexed too, so filtering by it is part of the match instead of a lookup per matching row.
+# Its rows are tied to the messages rowids, so after a VACUUM run
+# "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')".
+# Query words looked up in messages_fts_vocab per statement.
+FTS_VOCAB_LOOKUP_CHUNK = 500
+
+MESSAGE_SEARCH_TABLES = [
+    (
+        "CREATE VIRTUAL TABLE messages_fts USING fts5("
+        "   content, role, id UNINDEXED, content='messages', content_rowid='rowid'"
+        ")"
+    ),
+    # How many messages contain each word, for picking the rare words of a query.
+    "CREATE VIRTUAL TABLE messages_fts_vocab USING fts5vocab(messages_fts, 'col')",
+    (
+        "CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN"
+        "   INSERT INTO messages_fts (rowid, content, role, id) VALUES (new.rowid, new.content, new.role, new.id);"
+        " END"
+    ),
+    (
+        "CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN"
+        "   INSERT INTO messages_fts (messages_fts, rowid, content, role, id)"
+        "   VALUES ('delete', old.rowid, old.content, old.role, old.id);"
+        " END"
+    ),
+    (
+        "CREATE TRIGGER messages_fts_update AFTER UPDATE OF content, role ON messages BEGIN"
+        "   INSERT INTO messages_fts (messages_fts, rowid, content, role, id)"
+        "   VALUES ('delete', old.rowid, old.content, old.role, old.id);"
+        "   INSERT INTO messages_fts (rowid, content, role, id) VALUES (new.rowid, new.content, new.role, new.id);"
+        " END"
+    ),
+]
+
+
 def vector_to_blob(vector: list[float]) -> bytes:
-    return struct.pack(f"{len(vector)}f", *vector)
+    return np.asarray(vector, dtype=np.float32).tobytes()
 
 
 def blob_to_vector(blob_data: bytes) -> list[float]:
-    num_floats = len(blob_data) // 4
-    return list(struct.unpack(f"{num_floats}f", blob_data))
+    return np.frombuffer(blob_data, dtype=np.float32).tolist()
+
+
+def blobs_to_matrix(blobs: list[bytes]) -> np.ndarray:
+    """Decode equally sized embedding BLOBs into one (n, dim) float32 array without per-row unpacking."""
+    if len(blobs) == 0:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(blobs), -1)
+
+
+def parse_timestamps(timestamps: list[str]) -> list[datetime]:
+    """Parse SQLite DATETIME strings in one vectorized pass, falling back to dateutil for odd formats."""
+    try:
+        return np.array(timestamps, dtype="datetime64[us]").tolist()
+    except ValueError:
+        return [parse_date_string(timestamp) for timestamp in timestamps]
 
 
 class Vector(BaseModel):
@@ -36,6 +109,10 @@ class SqlMessage(BaseModel):
     embedding: Vector
     uid: str = Field(default_factory=lambda: uuid4().hex)
     created_at: datetime = Field(default_factory=lambda: datetime.utcnow())
+    # Row of this message's embedding in its role's embedding matrix and sidecar file.
+    embedding_row: Optional[int] = None
+    # Tokens in `text` under token_counter.TOKEN_COUNT_MODEL's encoding.
+    token_count: Optional[int] = None
 
     def __hash__(self):
         return hash(self.text)
@@ -80,13 +157,145 @@ class SqlMessage(BaseModel):
             )
         return messages
 
+    @classmethod
+    def load_all_bulk(cls, conn: sqlite3.Connection) -> tuple[list["SqlMessage"], np.ndarray]:
+        """
+        Fast startup path for `load_all`.
+
+        Embeddings are decoded straight into one float32 array, timestamps are parsed in bulk and
+        messages are built with `construct`, skipping per-row validation of data we wrote ourselves.
+        Rows are grouped by role so each role's embeddings are a contiguous slice of the array, and
+        each message's `embedding.data` is a view into it.
+        """
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, timestamp, role, content, embedding, token_count FROM messages")
+        rows = cursor.fetchall()
+        if len(rows) == 0:
+            return [], np.empty((0, 0), dtype=np.float32)
+        uids, timestamps, role_strs, texts, blobs, token_counts = zip(*rows)
+        del rows
+
+        order = np.argsort(np.array(role_strs), kind="stable")
+        embeddings = blobs_to_matrix(blobs)[order]
+        del blobs
+        created_ats = parse_timestamps(timestamps)
+        roles = {role.value: role for role in Role}
+
+        messages = [
+            cls.construct(
+                role=roles[role_strs[idx]],
+                text=texts[idx],
+                embedding=Vector.construct(data=embedding),
+                uid=uids[idx],
+                created_at=created_ats[idx],
+                token_count=token_counts[idx],
+            )
+            for idx, embedding in zip(order.tolist(), embeddings)
+        ]
+        return messages, embeddings
+
+    @classmethod
+    def load_all_without_embeddings(cls, conn: sqlite3.Connection) -> list["SqlMessage"]:
+        """
+        Like `load_all_bulk` but never reads the embedding BLOBs. `embedding` is left as None for
+        the caller to fill in from the embedding sidecar files.
+        """
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, timestamp, role, content, embedding_row, token_count FROM messages")
+        rows = cursor.fetchall()
+        if len(rows) == 0:
+            return []
+        uids, timestamps, role_strs, texts, embedding_rows, token_counts = zip(*rows)
+        del rows
+        created_ats = parse_timestamps(timestamps)
+        roles = {role.value: role for role in Role}
+        return [
+            cls.construct(
+                role=roles[role_str],
+                text=text,
+                embedding=None,
+                uid=uid,
+                created_at=created_at,
+                embedding_row=embedding_row,
+                token_count=token_count,
+            )
+            for uid, created_at, role_str, text, embedding_row, token_count in zip(
+                uids, created_ats, role_strs, texts, embedding_rows, token_counts
+            )
+        ]
+
+    def sql_row(self) -> tuple:
+        return (
+            self.uid,
+            self.created_at,
+            self.role.value,
+            self.text,
+            self.embedding.blob,
+            self.embedding_row,
+            self.token_count,
+        )
+
     def save_to_sql(self, conn: sqlite3.Connection):
         cursor = conn.cursor()
         # Insert a new row into the messages table
-        cursor.execute(
-            "INSERT INTO messages (id, timestamp, role, content, embedding) VALUES (?, ?, ?, ?, ?)",
-            (self.uid, self.created_at, self.role.value, self.text, self.embedding.blob),
-        )
+        cursor.execute(INSERT_MESSAGE_SQL, self.sql_row())
+
+    @classmethod
+    def search_text(
+        cls, conn: sqlite3.Connection, text: str, roles: Iterable[Role], k: int, max_postings: int = 20_000
+    ) -> list[tuple[str, float]]:
+        """
+        Ids of the `k` messages of `roles` that best match the words of `text` under BM25, best first,
+        with their BM25 score (higher is better). Needs the messages_fts index.
+
+        Every message containing a query word is scored, so words are used rarest first only while
+        the messages containing them add up to at most `max_postings`, and at least the rarest
+        word is always used. Common words ("the", "what") cost the most to score and barely move
+        BM25, while names and error codes are rare and always kept.
+        """
+        words = fts_words(text)
+        roles = [role.value for role in roles]
+        if len(words) == 0 or len(roles) == 0 or k <= 0:
+            return []
+        document_counts = {}
+        # One bound parameter per word, in chunks under SQLite's oldest SQLITE_MAX_VARIABLE_NUMBER (999).
+        for start in range(0, len(words), FTS_VOCAB_LOOKUP_CHUNK):
+            chunk = words[start : start + FTS_VOCAB_LOOKUP_CHUNK]
+            document_counts.update(
+                conn.execute(
+                    "SELECT term, doc FROM messages_fts_vocab"
+                    f" WHERE col = 'content' AND term IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+            )
+        query_words = []
+        postings = 0
+        for word in sorted(document_counts, key=document_counts.get):
+            if len(query_words) > 0 and postings + document_counts[word] > max_postings:
+                break
+            query_words.append(word)
+            postings += document_counts[word]
+        if len(query_words) == 0:
+            return []
+        # Quoted, so no word can be read as query syntax.
+        words_query = " OR ".join(f'"{word}"' for word in query_words)
+        query = f"content:({words_query}) AND role:({' OR '.join(roles)})"
+        # Weights zero the role and id columns, so only the content is scored.
+        rows = conn.execute(
+            "SELECT id, bm25(messages_fts, 1.0, 0.0, 0.0) AS score FROM messages_fts"
+            " WHERE messages_fts MATCH ? ORDER BY score LIMIT ?",
+            (query, k),
+        ).fetchall()
+        # SQLite's bm25 is negated so that ascending order is best first.
+        return [(uid, -score) for uid, score in rows]
+
+    @classmethod
+    def sql_migrations(cls) -> dict[str, str]:
+        """Columns added after the table was first released, keyed by column name."""
+        return {
+            "embedding_row": "ALTER TABLE messages ADD COLUMN embedding_row INTEGER",
+            "token_count": "ALTER TABLE messages ADD COLUMN token_count INTEGER",
+        }
 
     @classmethod
     def sql_tables(cls):
@@ -114,58 +323,60 @@ class SqlInteraction(BaseModel):
 
     @classmethod
     def load_all(cls, conn: sqlite3.Connection) -> list["SqlInteraction"]:
-        # Retrieve the row from the messages table with the given message_id
-        cursor = conn.cursor()
+        """
+        Every interaction with its linked ids, in id order.
 
+        The interactions and each link table are read once, all ordered by interaction id, and
+        merged in a single streaming pass, so loading is linear in the number of rows.
+        """
+        return cls._load(conn)
+
+    @classmethod
+    def load_created_between(cls, conn: sqlite3.Connection, start: datetime, end: datetime) -> list["SqlInteraction"]:
+        """Interactions created at or after `start` and before `end`, oldest first, via the created_at index."""
+        interactions = cls._load(conn, "created_at >= ? AND created_at < ?", (start, end))
+        interactions.sort(key=lambda interaction: interaction.created_at)
+        return interactions
+
+    @classmethod
+    def _load(cls, conn: sqlite3.Connection, where: str = "", params: tuple = ()) -> list["SqlInteraction"]:
+        """The interactions matching the SQL condition `where`, in id order, with their linked ids."""
+        condition = f" WHERE {where}" if where else ""
+        cursor = conn.cursor()
         cursor.execute(
-            (
-                "  SELECT"
-                "    i.created_at,"
-                "    i.id AS uid,"
-                "    i.user_message_id,"
-                "    i.response_message_id,"
-                "    GROUP_CONCAT(ism.system_message_id) AS system_message_ids,"
-                "    GROUP_CONCAT(irm.related_interaction_id) AS relevant_interaction_ids,"
-                "    GROUP_CONCAT(rrm.related_interaction_id) AS recent_interaction_ids"
-                "  FROM"
-                "    interactions i"
-                "    LEFT JOIN interaction_system_messages ism ON i.id = ism.interaction_id"
-                "    LEFT JOIN interaction_relevant_interactions irm ON i.id = irm.interaction_id"
-                "    LEFT JOIN interaction_recent_interactions rrm ON i.id = rrm.interaction_id"
-                "  GROUP BY"
-                "    i.id;"
-            )
+            f"SELECT created_at, id, user_message_id, response_message_id FROM interactions{condition} ORDER BY id",
+            params,
         )
-
-        interactions = []
         rows = cursor.fetchall()
-        for row in rows:
-            (
-                created_at,
-                uid,
-                user_message_id,
-                response_message_id,
-                system_message_ids_str,
-                relevant_interaction_ids,
-                recent_interaction_ids,
-            ) = row
-
-            interactions.append(
-                cls(
-                    created_at=created_at,
-                    uid=uid,
-                    user_message_id=user_message_id,
-                    response_message_id=response_message_id,
-                    system_message_ids=system_message_ids_str.split(",") if system_message_ids_str is not None else [],
-                    relevant_interaction_ids=relevant_interaction_ids.split(",")
-                    if relevant_interaction_ids is not None
-                    else [],
-                    recent_interaction_ids=recent_interaction_ids.split(",")
-                    if system_message_ids_str is not None
-                    else [],
-                )
+        if len(rows) == 0:
+            return []
+        created_ats, uids, user_message_ids, response_message_ids = zip(*rows)
+        del rows
+        created_ats = parse_timestamps(created_ats)
+
+        # Only the links of the interactions being loaded.
+        link_condition = f" WHERE interaction_id IN (SELECT id FROM interactions{condition})" if where else ""
+        system_links = _LinkGroups(conn, "interaction_system_messages", "system_message_id", link_condition, params)
+        relevant_links = _LinkGroups(
+            conn, "interaction_relevant_interactions", "related_interaction_id", link_condition, params
+        )
+        recent_links = _LinkGroups(
+            conn, "interaction_recent_interactions", "related_interaction_id", link_condition, params
+        )
+        return [
+            cls.construct(
+                created_at=created_at,
+                uid=uid,
+                user_message_id=user_message_id,
+                response_message_id=response_message_id,
+                system_message_ids=system_links.take(uid),
+                relevant_interaction_ids=relevant_links.take(uid),
+                recent_interaction_ids=recent_links.take(uid),
             )
-        return interactions
+            for created_at, uid, user_message_id, response_message_id in zip(
+                created_ats, uids, user_message_ids, response_message_ids
+            )
+        ]
 
     @classmethod
     def load_from_sql(cls, conn: sqlite3.Connection, interaction_uid: str) -> Optional["SqlInteraction"]:
@@ -213,35 +424,26 @@ class SqlInteraction(BaseModel):
             uid,
         )
 
-    def save_to_sql(self, conn: sqlite3.Connection):
-        cursor = conn.cursor()
-        # Insert a new row into the messages table
-        cursor.execute(
-            "INSERT INTO interactions (created_at, id, user_message_id, response_message_id) VALUES (?, ?, ?, ?);",
-            (self.created_at, self.uid, self.user_message_id, self.response_message_id),
-        )
+    def sql_row(self) -> tuple:
+        return (self.created_at, self.uid, self.user_message_id, self.response_message_id)
 
-        # Insert the relationships into the related_messages table
-        for related_message_id in self.relevant_interaction_ids:
-            cursor.execute(
-                "INSERT INTO interaction_relevant_interactions (interaction_id, related_interaction_id) VALUES (?, ?);",
-                (self.uid, related_message_id),
-            )
+    def system_message_link_rows(self) -> list[tuple[str, str]]:
+        return [(self.uid, system_message_id) for system_message_id in self.system_message_ids]
 
-        # Insert the relationships into the related_messages table
-        for related_message_id in self.recent_interaction_ids:
-            cursor.execute(
-                "INSERT INTO interaction_recent_interactions (interaction_id, related_interaction_id) VALUES (?, ?);",
-                (self.uid, related_message_id),
-            )
+    def relevant_interaction_link_rows(self) -> list[tuple[str, str]]:
+        return [(self.uid, related_interaction_id) for related_interaction_id in self.relevant_interaction_ids]
 
-        # Insert the relationships into the related_messages table
-        for system_message_id in self.system_message_ids:
-            cursor.execute(
-                "INSERT INTO interaction_system_messages (interaction_id, system_message_id) VALUES (?, ?);",
-                (self.uid, system_message_id),
-            )
-        conn.commit()
+    def recent_interaction_link_rows(self) -> list[tuple[str, str]]:
+        return [(self.uid, related_interaction_id) for related_interaction_id in self.recent_interaction_ids]
+
+    def save_to_sql(self, conn: sqlite3.Connection):
+        cursor = conn.cursor()
+        # Insert a new row into the interactions table
+        cursor.execute(INSERT_INTERACTION_SQL, self.sql_row())
+        # Insert the relationships into the link tables
+        cursor.executemany(INSERT_RELEVANT_INTERACTION_LINK_SQL, self.relevant_interaction_link_rows())
+        cursor.executemany(INSERT_RECENT_INTERACTION_LINK_SQL, self.recent_interaction_link_rows())
+        cursor.executemany(INSERT_SYSTEM_MESSAGE_LINK_SQL, self.system_message_link_rows())
 
     @classmethod
     def sql_tables(cls):
@@ -283,4 +485,82 @@ class SqlInteraction(BaseModel):
                 "    FOREIGN KEY (related_interaction_id) REFERENCES interactions (id) ON DELETE CASCADE"
                 ")"
             ),
+            # For time-range queries that don't go through the in-memory store.
+            "CREATE INDEX IF NOT EXISTS interactions_created_at ON interactions (created_at)",
+            # The loader reads each link table in interaction_id order; index so that is a scan, not a sort.
+            "CREATE INDEX IF NOT EXISTS interaction_system_messages_interaction_id"
+            " ON interaction_system_messages (interaction_id)",
+            "CREATE INDEX IF NOT EXISTS interaction_relevant_interactions_interaction_id"
+            " ON interaction_relevant_interactions (interaction_id)",
+            "CREATE INDEX IF NOT EXISTS interaction_recent_interactions_interaction_id"
+            " ON interaction_recent_interactions (interaction_id)",
         ]
+
+
+class _LinkGroups:
+    """
+    One link table's linked ids, grouped by interaction while streaming through it in interaction id
+    order. `take` must be called with increasing interaction ids.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, table: str, column: str, condition: str = "", params: tuple = ()):
+        rows = conn.execute(
+            f"SELECT interaction_id, {column} FROM {table}{condition} ORDER BY interaction_id, id", params
+        )
+        self._groups = groupby(rows, key=itemgetter(0))
+        self._next = next(self._groups, None)
+
+    def take(self, interaction_id: str) -> list[str]:
+        # Skip links whose interaction is gone.
+        while self._next is not None and self._next[0] < interaction_id:
+            self._next = next(self._groups, None)
+        if self._next is None or self._next[0] != interaction_id:
+            return []
+        linked = [row[1] for row in self._next[1]]
+        self._next = next(self._groups, None)
+        return linked
+
+
+def fts_words(text: str) -> list[str]:
+    """The distinct words of `text` as the messages_fts tokenizer splits them, lowercased and without diacritics."""
+    # unicode61 indexes "café" as "cafe". Composing again afterwards keeps scripts such as Hangul intact.
+    decomposed = unicodedata.normalize("NFD", text.lower())
+    folded = unicodedata.normalize("NFC", "".join(char for char in decomposed if not unicodedata.combining(char)))
+    return list(dict.fromkeys(re.findall(r"[^\W_]+", folded)))
+
+
+def create_memory_tables(conn: sqlite3.Connection, search_index: bool = True) -> bool:
+    """
+    Create the memory tables, and add any columns an older database is missing.
+
+    Returns whether the full-text index over messages exists. Pass `search_index=False` to leave it
+    to `create_message_search_index`, which indexes a bulk load faster than the triggers.
+    """
+    cursor = conn.cursor()
+    for table in SqlMessage.sql_tables() + SqlInteraction.sql_tables():
+        cursor.execute(table)
+
+    for table, model in (("messages", SqlMessage),):
+        columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+        for column, migration in model.sql_migrations().items():
+            if column not in columns:
+                cursor.execute(migration)
+    return create_message_search_index(conn) if search_index else False
+
+
+def create_message_search_index(conn: sqlite3.Connection) -> bool:
+    """
+    Create the full-text index over messages if it is missing, indexing every message already stored.
+    Returns False when SQLite was built without FTS5.
+    """
+    cursor = conn.cursor()
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone() is not None:
+        return True
+    try:
+        cursor.execute(MESSAGE_SEARCH_TABLES[0])
+    except sqlite3.OperationalError:
+        return False
+    for statement in MESSAGE_SEARCH_TABLES[1:]:
+        cursor.execute(statement)
+    cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+    return True
@@ -2,7 +2,7 @@ from typing import TypeAlias
 
 from pydantic import BaseModel
 
-from llm_client.llm_utils import create_embedding_with_ada
+from llm_client.llm_utils import create_embeddings
 
 Embedding = list[float]
 
@@ -17,9 +17,9 @@ class MemoryBlock(BaseModel):
 
     def __init__(self, user_input, assistant_output):
         conversation = f"user: {user_input}\n\nassistant: {assistant_output}"
-        input_embedding = create_embedding_with_ada(user_input)
-        output_embedding = create_embedding_with_ada(assistant_output)
-        conversation_embedding = create_embedding_with_ada(conversation_embedding)
+        input_embedding, output_embedding, conversation_embedding = create_embeddings(
+            [user_input, assistant_output, conversation]
+        )
         super().__init__(
             user_input=user_input,
             assistant_output=assistant_output,
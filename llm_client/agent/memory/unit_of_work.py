@@ -0,0 +1,55 @@
+import sqlite3
+
+from llm_client.agent.memory.sql_backed_memory_objects import (
+    SqlMessage,
+    SqlInteraction,
+    INSERT_MESSAGE_SQL,
+    INSERT_INTERACTION_SQL,
+    INSERT_SYSTEM_MESSAGE_LINK_SQL,
+    INSERT_RELEVANT_INTERACTION_LINK_SQL,
+    INSERT_RECENT_INTERACTION_LINK_SQL,
+)
+
+
+class UnitOfWork:
+    """
+    Stages every row produced by an agent turn and writes them in one transaction.
+
+    Rows are grouped by table so each table is written with a single `executemany`.
+    """
+
+    def __init__(self):
+        self.messages: list[SqlMessage] = []
+        self.interactions: list[SqlInteraction] = []
+        self._staged_message_ids: set[str] = set()
+
+    def add_message(self, message: SqlMessage) -> str:
+        if message.uid not in self._staged_message_ids:
+            self._staged_message_ids.add(message.uid)
+            self.messages.append(message)
+        return message.uid
+
+    def add_interaction(self, interaction: SqlInteraction) -> str:
+        self.interactions.append(interaction)
+        return interaction.uid
+
+    def flush(self, conn: sqlite3.Connection):
+        """Write the staged rows. The caller owns the transaction."""
+        cursor = conn.cursor()
+        cursor.executemany(INSERT_MESSAGE_SQL, [message.sql_row() for message in self.messages])
+        cursor.executemany(INSERT_INTERACTION_SQL, [interaction.sql_row() for interaction in self.interactions])
+        cursor.executemany(
+            INSERT_SYSTEM_MESSAGE_LINK_SQL,
+            [row for interaction in self.interactions for row in interaction.system_message_link_rows()],
+        )
+        cursor.executemany(
+            INSERT_RELEVANT_INTERACTION_LINK_SQL,
+            [row for interaction in self.interactions for row in interaction.relevant_interaction_link_rows()],
+        )
+        cursor.executemany(
+            INSERT_RECENT_INTERACTION_LINK_SQL,
+            [row for interaction in self.interactions for row in interaction.recent_interaction_link_rows()],
+        )
+
+    def __len__(self):
+        return len(self.messages) + len(self.interactions)
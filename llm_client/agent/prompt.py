@@ -1,10 +1,12 @@
-from typing import Any
+from typing import Any, Optional
 import logging
 
-import tiktoken
+import numpy as np
+from pydantic import BaseModel
 
 from llm_client.types.openai import Message
 from llm_client.config import Config
+from llm_client.token_counter import TOKEN_COUNT_MODEL, count_tokens, get_encoding
 from llm_client.agent.memory.sql_backed_memory_objects import SqlMessage
 from llm_client.agent.memory.remembered_interaction import RememberedInteraction
 
@@ -17,7 +19,9 @@ tokens_per_message = {"gpt-3.5-turbo": 4, "gpt-3.5-turbo-0301": 4, "gpt-4": 3, "
 tokens_per_name = {"gpt-3.5-turbo": -1, "gpt-3.5-turbo-0301": -1, "gpt-4": 1, "gpt-4-0314": 1}
 
 
-def count_message_tokens(message: Message, model: str = "gpt-3.5-turbo-0301") -> int:
+def count_message_tokens(
+    message: Message, model: str = "gpt-3.5-turbo-0301", content_tokens: Optional[int] = None
+) -> int:
     """
     Returns the number of tokens used by a list of messages.
 
@@ -25,6 +29,7 @@ def count_message_tokens(message: Message, model: str = "gpt-3.5-turbo-0301") ->
         messages (Message): A Message containing role and content.
         model (str): The name of the model to use for tokenization.
             Defaults to "gpt-3.5-turbo-0301".
+        content_tokens (int, optional): Token count of the content, when already known.
 
     Returns:
         int: The number of tokens used by the message.
@@ -36,12 +41,17 @@ def count_message_tokens(message: Message, model: str = "gpt-3.5-turbo-0301") ->
             " information on how messages are converted to tokens."
         )
 
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        logger.warn("Warning: model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
-    return tokens_per_message[model] + len(encoding.encode(message.content)) + len(encoding.encode(message.role))
+    if content_tokens is None:
+        content_tokens = count_tokens(message.content, model)
+    return tokens_per_message[model] + content_tokens + count_tokens(message.role, model)
+
+
+def count_sql_message_tokens(message: Message, sql_message: SqlMessage, model: str = "gpt-3.5-turbo-0301") -> int:
+    """`count_message_tokens`, reusing the token count stored with `sql_message` when the encodings match."""
+    content_tokens = None
+    if sql_message.token_count is not None and get_encoding(model).name == get_encoding(TOKEN_COUNT_MODEL).name:
+        content_tokens = sql_message.token_count
+    return count_message_tokens(message, model, content_tokens)
 
 
 def count_msg_dict(msg_dict: dict[str, list[Message]]):
@@ -53,9 +63,79 @@ class ExceededTokenLimit(Exception):
     pass
 
 
+class SystemPrefix(BaseModel):
+    """
+    The system messages an agent sends on every turn, compiled once: their chat messages, the
+    stored messages they came from and their total token count.
+    """
+
+    sql_messages: tuple[SqlMessage, ...]
+    messages: tuple[Message, ...]
+    token_count: int
+
+    class Config:
+        allow_mutation = False
+
+    @classmethod
+    def compile(cls, sql_messages: list[SqlMessage], model: str = "gpt-3.5-turbo-0301") -> "SystemPrefix":
+        messages = [Message(role="system", content=sql_message.text) for sql_message in sql_messages]
+        return cls(
+            sql_messages=tuple(sql_messages),
+            messages=tuple(messages),
+            token_count=sum(
+                count_sql_message_tokens(message, sql_message, model)
+                for message, sql_message in zip(messages, sql_messages)
+            ),
+        )
+
+    @property
+    def message_ids(self) -> list[str]:
+        return [sql_message.uid for sql_message in self.sql_messages]
+
+
+class MemoryCandidate(BaseModel):
+    """A prior interaction that could be remembered in the prompt, and how useful it would be."""
+
+    interaction: RememberedInteraction
+    # True for a memory found by similarity, False for one included because it is recent.
+    relevant: bool
+    score: float
+
+
+def pack_knapsack(costs: list[int], scores: list[float], budget: int) -> list[int]:
+    """
+    Indices, in order, of the subset with the highest total score whose total cost fits `budget`.
+
+    Solved exactly as a 0/1 knapsack over integer token costs, one numpy pass per item. Items with a
+    score of zero or less are never taken.
+    """
+    if budget <= 0 or len(costs) == 0:
+        return []
+    best = np.zeros(budget + 1)
+    taken = np.zeros((len(costs), budget + 1), dtype=bool)
+    for idx, (cost, score) in enumerate(zip(costs, scores)):
+        if score <= 0 or cost > budget:
+            continue
+        with_item = best[: budget + 1 - cost] + score
+        improved = with_item > best[cost:]
+        taken[idx, cost:] = improved
+        best[cost:] = np.where(improved, with_item, best[cost:])
+    chosen = []
+    remaining = budget
+    for idx in range(len(costs) - 1, -1, -1):
+        if taken[idx, remaining]:
+            chosen.append(idx)
+            remaining -= costs[idx]
+    return chosen[::-1]
+
+
 class Prompt:
     history_intro: str = "The following "
     token_limit = 1000
+    # Tokens left free for the reply when sizing a prompt to a model's context.
+    reply_token_reserve = 1000
+    # Tokens the memories may take in total, within `token_limit`. None leaves them only `token_limit`.
+    memory_token_budget: Optional[int] = None
 
     def __init__(self):
         self.user_message: SqlMessage = None
@@ -64,10 +144,29 @@ class Prompt:
         self.relevant_interactions: list[RememberedInteraction] = []
         self._messages: dict[str, list[Message]] = {}
         self._num_tokens = 0
+        self._memory_tokens = 0
+
+    @classmethod
+    def for_model(cls, model: str) -> "Prompt":
+        """
+        A prompt whose token limit is the model's context size from Config, less room for the reply,
+        with memories held to Config's MEMORY_TOKEN_BUDGET within that.
+        """
+        prompt = cls()
+        prompt.token_limit = cfg.get_token_limit(model) - cls.reply_token_reserve
+        prompt.memory_token_budget = cfg.memory_token_budget
+        return prompt
+
+    def _memory_room(self) -> int:
+        """Tokens still free for memories."""
+        room = self.token_limit - self._num_tokens
+        if self.memory_token_budget is not None:
+            room = min(room, self.memory_token_budget - self._memory_tokens)
+        return room
 
     def add_user_message(self, user_message: SqlMessage):
         next_message = Message(role="user", content=user_message.text)
-        token_size = count_message_tokens(next_message)
+        token_size = count_sql_message_tokens(next_message, user_message)
         new_token_count = self._num_tokens + token_size
         if new_token_count <= self.token_limit:
             self.user_message = user_message
@@ -78,46 +177,103 @@ class Prompt:
                 f"The message {user_message.text} has a token length of {token_size}. This exceeds the token limit by {new_token_count - self.token_limit}."
             )
 
-    def add_recent_memory(self, previous_interaction: RememberedInteraction):
+    @staticmethod
+    def recent_memory_message(previous_interaction: RememberedInteraction) -> Message:
         memory_msg = (
             f"MemoryLog-{previous_interaction.created_at}: "
             f'Remember when I said, "{previous_interaction.user_message}" you replied with "{previous_interaction.response_message}".'
         )
-        next_message = Message(role="user", content=memory_msg)
-        new_token_count = self._num_tokens + count_message_tokens(next_message)
-        if new_token_count <= self.token_limit:
+        return Message(role="user", content=memory_msg)
+
+    @staticmethod
+    def relevant_memory_message(previous_interaction: RememberedInteraction) -> Message:
+        memory_msg = (
+            f"MemoryLog-{previous_interaction.created_at}: "
+            f'We talked about something similar previously when I said, "{previous_interaction.user_message}" and you replied with "{previous_interaction.response_message}".'
+        )
+        return Message(role="user", content=memory_msg)
+
+    def add_memories(self, candidates: list[MemoryCandidate]) -> list[MemoryCandidate]:
+        """
+        Fill the tokens left for memories, what remains of `token_limit` but at most
+        `memory_token_budget` in all, with the subset of `candidates` that has the highest total
+        score, rather than stopping at the first one that doesn't fit. An interaction offered both
+        as relevant and as recent is only considered once, with its better score. Returns the
+        candidates that were added, in their original order.
+        """
+        unique: dict[str, MemoryCandidate] = {}
+        for candidate in candidates:
+            known = unique.get(candidate.interaction.uid)
+            if known is None or candidate.score > known.score:
+                unique[candidate.interaction.uid] = candidate
+        candidates = [candidate for candidate in candidates if unique[candidate.interaction.uid] is candidate]
+
+        messages = [
+            self.relevant_memory_message(candidate.interaction)
+            if candidate.relevant
+            else self.recent_memory_message(candidate.interaction)
+            for candidate in candidates
+        ]
+        costs = [count_message_tokens(message) for message in messages]
+        chosen = pack_knapsack(costs, [candidate.score for candidate in candidates], self._memory_room())
+        for idx in chosen:
+            candidate = candidates[idx]
+            if candidate.relevant:
+                self.relevant_interactions.append(candidate.interaction)
+                self._messages.setdefault("relevant_memory", []).append(messages[idx])
+            else:
+                self.recent_interactions.append(candidate.interaction)
+                self._messages.setdefault("recent_memory", []).append(messages[idx])
+            self._num_tokens += costs[idx]
+            self._memory_tokens += costs[idx]
+        return [candidates[idx] for idx in chosen]
+
+    def add_recent_memory(self, previous_interaction: RememberedInteraction):
+        next_message = self.recent_memory_message(previous_interaction)
+        token_size = count_message_tokens(next_message)
+        if token_size <= self._memory_room():
             self.recent_interactions.append(previous_interaction)
             self._messages.setdefault("recent_memory", []).append(next_message)
-            self._num_tokens = new_token_count
+            self._num_tokens += token_size
+            self._memory_tokens += token_size
         else:
             raise ExceededTokenLimit("Addition of message would exceed token limit.")
 
     def add_relevant_memory(self, previous_interaction: RememberedInteraction):
-        memory_msg = (
-            f"MemoryLog-{previous_interaction.created_at}: "
-            f'We talked about something similar previously when I said, "{previous_interaction.user_message}" and you replied with "{previous_interaction.response_message}".'
-        )
-        next_message = Message(role="user", content=memory_msg)
-        new_token_count = self._num_tokens + count_message_tokens(next_message)
-        if new_token_count <= self.token_limit:
+        next_message = self.relevant_memory_message(previous_interaction)
+        token_size = count_message_tokens(next_message)
+        if token_size <= self._memory_room():
             self.relevant_interactions.append(previous_interaction)
             self._messages.setdefault("relevant_memory", []).append(next_message)
-            self._num_tokens = new_token_count
+            self._num_tokens += token_size
+            self._memory_tokens += token_size
         else:
             raise ExceededTokenLimit("Addition of message would exceed token limit.")
 
     def add_system_message(self, system_message: SqlMessage):
         next_message = Message(role="system", content=system_message.text)
-        new_token_count = self._num_tokens + count_message_tokens(next_message)
+        new_token_count = self._num_tokens + count_sql_message_tokens(next_message, system_message)
         if new_token_count <= self.token_limit:
+            self.system_messages.append(system_message)
             self._messages.setdefault("system", []).append(next_message)
             self._num_tokens = new_token_count
         else:
             raise ExceededTokenLimit("Addition of message would exceed token limit.")
 
+    def add_system_prefix(self, prefix: SystemPrefix):
+        """Add a precompiled block of system messages without counting their tokens again."""
+        new_token_count = self._num_tokens + prefix.token_count
+        if new_token_count <= self.token_limit:
+            self.system_messages.extend(prefix.sql_messages)
+            self._messages.setdefault("system", []).extend(prefix.messages)
+            self._num_tokens = new_token_count
+        else:
+            raise ExceededTokenLimit("Addition of message would exceed token limit.")
+
     @property
     def chat(self):
-        messages: list[Message] = self._messages.get("system", [])
+        # Build a new list: extending the stored "system" list would grow it on every call.
+        messages: list[Message] = list(self._messages.get("system", []))
         messages += self._messages.get("relevant_memory", [])
         messages += self._messages.get("recent_memory", [])
         messages += self._messages.get("user", [])
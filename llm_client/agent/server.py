@@ -0,0 +1,226 @@
+"""
+Hosts many agent sessions in one process, all sharing one Memory: its embedding index, the token
+count caches, the SQLite connection pool and the HTTP client to the OpenAI API.
+
+Run it with `python main.py --serve --port 8080` (or `--unix /tmp/agent.sock`) and talk JSON to it:
+
+    POST   /sessions                {"name", "description", "objectives", "model", "temperature"}
+                                    -> {"session_id"}
+    POST   /sessions/{session_id}/turns   {"message"} -> {"reply"}
+    DELETE /sessions/{session_id}
+    GET    /health                  -> {"sessions", "messages", "interactions"}
+"""
+from __future__ import annotations
+
+import asyncio
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from aiohttp import web
+from openai.error import OpenAIError
+
+from llm_client.agent.agent import Agent, PersistenceError
+from llm_client.agent.memory.memory import Memory
+from llm_client.agent.prompt import ExceededTokenLimit
+from llm_client.async_llm_utils import AsyncLLMClient, acreate_chat_completion
+from llm_client.logs import logger
+from llm_client.types.openai import Role
+
+T = TypeVar("T")
+
+
+class AgentSession:
+    """
+    One conversation: an Agent on the shared Memory, taking one turn at a time.
+
+    Like `Agent.take_turn`, a finished turn is stored in the background and the next turn of the
+    session waits for it, so a failed write surfaces as a `PersistenceError` there.
+    """
+
+    def __init__(self, agent: Agent, executor: ThreadPoolExecutor, writer: ThreadPoolExecutor):
+        self.agent = agent
+        self._executor = executor
+        self._writer = writer
+        self._turn_lock = asyncio.Lock()
+        self._persistence: Optional[asyncio.Task] = None
+
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def take_turn(self, user_text: str) -> str:
+        async with self._turn_lock:
+            await self.wait_for_persistence()
+            memory = self.agent.memory
+            # Gather recent memories and keyword matches on worker threads while the user message is embedded.
+            recent = asyncio.ensure_future(self._run(self.agent.recent_memory_candidates))
+            lexical = asyncio.ensure_future(
+                self._run(memory.k_most_similar_lexical, user_text, [Role.User], self.agent.memory_candidates_per_kind)
+            )
+            try:
+                user_message = await memory.aget_message(Role.User, user_text)
+            finally:
+                recent_candidates, lexical_matches = await asyncio.gather(recent, lexical)
+            relevant_candidates = await self._run(self.agent.relevant_memory_candidates, user_message, lexical_matches)
+            prompt = await self._run(self.agent.build_prompt, user_message, recent_candidates, relevant_candidates)
+            reply = await acreate_chat_completion(
+                prompt.chat, model=self.agent.model, temperature=self.agent.temperature
+            )
+            self._persistence = asyncio.create_task(memory.aadd_interaction(prompt, reply, self._writer))
+            self._persistence.add_done_callback(self._report_persistence_failure)
+            return reply
+
+    async def wait_for_persistence(self):
+        """Wait until the previous turn is stored, raising `PersistenceError` if storing it failed."""
+        persistence, self._persistence = self._persistence, None
+        if persistence is None:
+            return
+        try:
+            await persistence
+        except Exception as e:
+            raise PersistenceError("The previous interaction was not saved.") from e
+
+    @staticmethod
+    def _report_persistence_failure(persistence: asyncio.Task):
+        if not persistence.cancelled() and persistence.exception() is not None:
+            logger.error("FAILED TO SAVE INTERACTION", str(persistence.exception()))
+
+    async def close(self):
+        try:
+            await self.wait_for_persistence()
+        finally:
+            self.agent.close()
+
+
+class AgentServer:
+    """The JSON-over-HTTP front end to the sessions sharing `memory`."""
+
+    def __init__(self, memory: Memory, model: str = "gpt-3.5-turbo", temperature: float = 0.7, max_workers: int = 8):
+        self.memory = memory
+        self.model = model
+        self.temperature = temperature
+        # Searches, prompt assembly and SQL writes run here so they don't stall the event loop.
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent-server")
+        # Stores finished turns; Memory serializes the writes anyway, so one thread is enough.
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="agent-server-persistence")
+        self.sessions: dict[str, AgentSession] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/health", self.health)
+        app.router.add_post("/sessions", self.create_session)
+        app.router.add_post("/sessions/{session_id}/turns", self.take_turn)
+        app.router.add_delete("/sessions/{session_id}", self.close_session)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080, unix_path: Optional[str] = None) -> str:
+        """Start serving in the running event loop, returning the address listened on."""
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        if unix_path is not None:
+            site = web.UnixSite(self._runner, unix_path)
+            await site.start()
+            return unix_path
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        for session_id in list(self.sessions):
+            await self.sessions.pop(session_id).close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        self._executor.shutdown()
+        self._writer.shutdown()
+        await AsyncLLMClient().aclose()
+
+    def _session(self, request: web.Request) -> AgentSession:
+        session = self.sessions.get(request.match_info["session_id"])
+        if session is None:
+            raise web.HTTPNotFound(text=_error_body("No such session."), content_type="application/json")
+        return session
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "sessions": len(self.sessions),
+                "messages": len(self.memory.message_store.id_to_message),
+                "interactions": len(self.memory.interaction_store.id_to_interaction),
+            }
+        )
+
+    async def create_session(self, request: web.Request) -> web.Response:
+        body = await _json_body(request)
+        agent = Agent(
+            body.get("model", self.model),
+            body.get("temperature", self.temperature),
+            memory=self.memory,
+            executor=self._executor,
+            writer=self._writer,
+        )
+        session = AgentSession(agent, self._executor, self._writer)
+        # Compiling the system prefix embeds the system prompts the first time they are seen.
+        await session._run(
+            agent.configure, body.get("name", ""), body.get("description", ""), body.get("objectives", [])
+        )
+        session_id = uuid.uuid4().hex
+        self.sessions[session_id] = session
+        return web.json_response({"session_id": session_id}, status=201)
+
+    async def take_turn(self, request: web.Request) -> web.Response:
+        session = self._session(request)
+        body = await _json_body(request)
+        if not isinstance(body.get("message"), str):
+            return web.json_response({"error": "Expected a JSON object with a string 'message'."}, status=400)
+        try:
+            reply = await session.take_turn(body["message"])
+        except ExceededTokenLimit as e:
+            return web.json_response({"error": str(e)}, status=413)
+        except PersistenceError as e:
+            return web.json_response({"error": f"{e} Please send your message again."}, status=503)
+        except OpenAIError as e:
+            return web.json_response({"error": str(e)}, status=502)
+        return web.json_response({"reply": reply})
+
+    async def close_session(self, request: web.Request) -> web.Response:
+        session = self._session(request)
+        del self.sessions[request.match_info["session_id"]]
+        await session.close()
+        return web.Response(status=204)
+
+
+async def _json_body(request: web.Request) -> dict[str, Any]:
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text=_error_body("Expected a JSON object."), content_type="application/json")
+    return body
+
+
+def _error_body(message: str) -> str:
+    return f'{{"error": "{message}"}}'
+
+
+async def serve(
+    db_file: str,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    unix_path: Optional[str] = None,
+    model: str = "gpt-3.5-turbo",
+    temperature: float = 0.7,
+):
+    """Serve agent sessions on `db_file` until cancelled."""
+    memory = Memory(db_file)
+    server = AgentServer(memory, model, temperature)
+    try:
+        address = await server.start(host, port, unix_path)
+        print(f"Serving agent sessions on {address}")
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+        memory.close()
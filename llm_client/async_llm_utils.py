@@ -0,0 +1,414 @@
+"""asyncio-native OpenAI client sharing pooled keep-alive HTTP sessions."""
+from __future__ import annotations
+
+import asyncio
+import atexit
+import json
+import threading
+import weakref
+from typing import Any, AsyncIterator, Coroutine, Iterator, List, Optional, TypeVar
+
+import aiohttp
+import openai
+from colorama import Fore, Style
+from openai.error import APIConnectionError, APIError, RateLimitError
+
+from llm_client.completion_cache import CompletionCache, completion_key
+from llm_client.config import Config
+from llm_client.embedding_cache import EmbeddingCache
+from llm_client.logs import logger
+from llm_client.rate_limiter import RateLimiter
+from llm_client.singleton import Singleton
+from llm_client.token_counter import count_message_tokens, count_string_tokens
+from llm_client.types.openai import Message
+
+CFG = Config()
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+# Limits of a single embeddings request.
+MAX_EMBEDDING_BATCH_SIZE = 2048
+MAX_EMBEDDING_BATCH_TOKENS = 8191 * 16
+
+T = TypeVar("T")
+
+
+class AsyncLLMClient(metaclass=Singleton):
+    """
+    Process-wide HTTP client for the OpenAI API.
+
+    Each event loop gets one aiohttp session whose connector keeps connections alive, and at most
+    `max_concurrency` requests are in flight per loop. Synchronous callers are served by a private
+    event loop running on a daemon thread, so they share one pool across calls too. Code that runs
+    its own loop should `await aclose()` before the loop ends.
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None, api_base: Optional[str] = None):
+        self.max_concurrency = max_concurrency or CFG.llm_max_concurrency
+        # Read openai.api_base lazily so tests can point the client at a fake server.
+        self._api_base = api_base
+        self._sessions: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession] = (
+            weakref.WeakKeyDictionary()
+        )
+        self._semaphores: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = (
+            weakref.WeakKeyDictionary()
+        )
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+
+    @property
+    def api_base(self) -> str:
+        return (self._api_base or openai.api_base).rstrip("/")
+
+    @api_base.setter
+    def api_base(self, value: Optional[str]):
+        self._api_base = value
+
+    def _session(self) -> tuple[aiohttp.ClientSession, asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+            session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=600))
+            self._sessions[loop] = session
+            self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return session, self._semaphores[loop]
+
+    def _url_and_headers(self, path: str, model: str) -> tuple[str, dict[str, str]]:
+        if CFG.use_azure:
+            deployment_id = CFG.get_azure_deployment_id_for_model(model)
+            url = f"{self.api_base}/openai/deployments/{deployment_id}/{path}?api-version={CFG.openai_api_version}"
+            return url, {"api-key": openai.api_key or ""}
+        return f"{self.api_base}/{path}", {"Authorization": f"Bearer {openai.api_key}"}
+
+    async def post(self, path: str, payload: dict[str, Any], tokens: int = 0) -> dict[str, Any]:
+        """
+        POST `payload` to the API, raising the same `openai.error` types as the SDK.
+
+        The request first waits for the rate limiter to admit `tokens` estimated tokens, so waiting
+        requests don't occupy a connection.
+        """
+        session, semaphore = self._session()
+        model = payload.get("model") or ""
+        url, headers = self._url_and_headers(path, model)
+        limiter = RateLimiter()
+        await limiter.acquire(model, tokens)
+        async with semaphore:
+            try:
+                async with session.post(url, json=payload, headers=headers) as response:
+                    body = await self._read_body(response)
+                    self._check(response, body, model)
+                    if not isinstance(body, dict):
+                        raise self._error(response.status, body, dict(response.headers))
+                    usage = body.get("usage") or {}
+                    if "total_tokens" in usage:
+                        limiter.settle(model, tokens, usage["total_tokens"])
+                    return body
+            except aiohttp.ClientError as e:
+                raise APIConnectionError(f"Error communicating with OpenAI: {e}") from e
+
+    async def stream(self, path: str, payload: dict[str, Any], tokens: int = 0) -> AsyncIterator[dict[str, Any]]:
+        """Like `post`, but yields the server-sent events of a `"stream": true` request as they arrive."""
+        session, semaphore = self._session()
+        model = payload.get("model") or ""
+        url, headers = self._url_and_headers(path, model)
+        await RateLimiter().acquire(model, tokens)
+        async with semaphore:
+            try:
+                async with session.post(url, json=payload, headers=headers) as response:
+                    body = await self._read_body(response) if response.status != 200 else None
+                    self._check(response, body, model)
+                    async for line in response.content:
+                        line = line.strip()
+                        if not line.startswith(b"data:"):
+                            continue
+                        data = line[len(b"data:") :].strip()
+                        if data == b"[DONE]":
+                            break
+                        yield json.loads(data)
+            except aiohttp.ClientError as e:
+                raise APIConnectionError(f"Error communicating with OpenAI: {e}") from e
+
+    @staticmethod
+    async def _read_body(response: aiohttp.ClientResponse) -> Any:
+        """The response's JSON, or its raw text when it isn't JSON, such as a gateway's HTML error page."""
+        text = await response.text(errors="replace")
+        try:
+            return json.loads(text)
+        except ValueError:
+            return text
+
+    def _check(self, response: aiohttp.ClientResponse, body: Any, model: str):
+        """Feed the response's rate-limit headers to the limiter and raise for error statuses."""
+        limiter = RateLimiter()
+        if response.status == 429:
+            limiter.rate_limited(model, response.headers)
+        elif response.status == 200:
+            limiter.observe(model, response.headers, succeeded=True)
+        if response.status != 200:
+            raise self._error(response.status, body, dict(response.headers))
+
+    @staticmethod
+    def _error(status: int, body: Any, headers: dict[str, str]) -> APIError:
+        message = body.get("error", {}).get("message", "") if isinstance(body, dict) else str(body)
+        error_class = RateLimitError if status == 429 else APIError
+        return error_class(message, http_body=str(body), http_status=status, json_body=body, headers=headers)
+
+    def run(self, coro: Coroutine[Any, Any, T]) -> T:
+        """Run `coro` to completion on the client's own event loop and return its result."""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="AsyncLLMClient", daemon=True).start()
+                atexit.register(self.close)
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def iterate(self, agen: AsyncIterator[T]) -> Iterator[T]:
+        """Drive an async iterator from synchronous code, one item at a time, on the client's event loop."""
+        try:
+            while True:
+                try:
+                    yield self.run(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run(agen.aclose())
+
+    async def aclose(self):
+        """Close the session belonging to the running loop."""
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+    def close(self):
+        """Close the pool used by synchronous callers and stop its event loop."""
+        with self._loop_lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self.aclose(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+
+
+def message_dicts(messages: List[Message]) -> list[dict[str, str]]:  # type: ignore
+    """Accept messages either as `Message` models or as plain dicts."""
+    return [message.dict() if isinstance(message, Message) else message for message in messages]
+
+
+def cached_completion(
+    messages: list[dict[str, str]], model: Optional[str], temperature: float, max_tokens: Optional[int]
+) -> tuple[str, Optional[str]]:
+    """The completion cache key for a request and its cached response, if any."""
+    key = completion_key(model, messages, temperature, max_tokens)
+    return key, CompletionCache().get(key)
+
+
+async def acreate_chat_completion(
+    messages: List[Message],  # type: ignore
+    model: Optional[str] = None,
+    temperature: float = CFG.temperature,
+    max_tokens: Optional[int] = None,
+    cache: bool = False,
+) -> str:
+    """Create a chat completion using the OpenAI API
+
+    Args:
+        messages (List[Message]): The messages to send to the chat completion
+        model (str, optional): The model to use. Defaults to None.
+        temperature (float, optional): The temperature to use. Defaults to 0.9.
+        max_tokens (int, optional): The max tokens to use. Defaults to None.
+        cache (bool, optional): Serve repeats of the same request from the completion cache. Defaults to False.
+
+    Returns:
+        str: The response from the chat completion
+    """
+    num_retries = 10
+    warned_user = False
+    if CFG.debug_mode:
+        print(
+            f"{Fore.GREEN}Creating chat completion with model {model}, temperature {temperature}, max_tokens {max_tokens}{Fore.RESET}"
+        )
+    payload = {
+        "model": model,
+        "messages": message_dicts(messages),
+        "temperature": temperature,
+    }
+    if max_tokens is not None:
+        payload["max_tokens"] = max_tokens
+    if cache:
+        key, cached = cached_completion(payload["messages"], model, temperature, max_tokens)
+        if cached is not None:
+            return cached
+    # The API counts max_tokens against the tokens-per-minute limit up front.
+    tokens = _estimate_prompt_tokens(payload["messages"], model) + (max_tokens or 0)
+    response = None
+    for attempt in range(num_retries):
+        backoff = 2 ** (attempt + 2)
+        try:
+            response = await AsyncLLMClient().post("chat/completions", payload, tokens)
+            break
+        except RateLimitError:
+            if CFG.debug_mode:
+                print(f"{Fore.RED}Error: ", f"Reached rate limit, passing...{Fore.RESET}")
+            if not warned_user:
+                logger.warn(
+                    f"Please double check that you have setup a {Fore.CYAN + Style.BRIGHT}PAID{Style.RESET_ALL} OpenAI API Account. "
+                    + f"You can read more here: {Fore.CYAN}https://github.com/Significant-Gravitas/Auto-GPT#openai-api-keys-configuration{Fore.RESET}"
+                )
+                warned_user = True
+            # The rate limiter holds the retry back until the API's reset time.
+            continue
+        except APIError as e:
+            if e.http_status != 502:
+                raise
+            if attempt == num_retries - 1:
+                raise
+        if CFG.debug_mode:
+            print(
+                f"{Fore.RED}Error: ",
+                f"API Bad gateway. Waiting {backoff} seconds...{Fore.RESET}",
+            )
+        await asyncio.sleep(backoff)
+    if response is None:
+        logger.typewriter_log(
+            "FAILED TO GET RESPONSE FROM OPENAI",
+            Fore.RED,
+            "Have failed to get a response from OpenAI's services. "
+            + f"Try running again, and if the problem the persists try running it with `{Fore.CYAN}--debug{Fore.RESET}`.",
+        )
+        logger.double_check()
+        if CFG.debug_mode:
+            raise RuntimeError(f"Failed to get response after {num_retries} retries")
+        else:
+            quit(1)
+    content = response["choices"][0]["message"]["content"]
+    if cache:
+        CompletionCache().put(key, model, content)
+    return content
+
+
+async def acreate_chat_completion_stream(
+    messages: List[Message],  # type: ignore
+    model: Optional[str] = None,
+    temperature: float = CFG.temperature,
+    max_tokens: Optional[int] = None,
+) -> AsyncIterator[str]:
+    """Stream a chat completion from the OpenAI API
+
+    Args:
+        messages (List[Message]): The messages to send to the chat completion
+        model (str, optional): The model to use. Defaults to None.
+        temperature (float, optional): The temperature to use. Defaults to 0.9.
+        max_tokens (int, optional): The max tokens to use. Defaults to None.
+
+    Yields:
+        str: Pieces of the response, as soon as the API produces them
+    """
+    num_retries = 10
+    payload = {
+        "model": model,
+        "messages": message_dicts(messages),
+        "temperature": temperature,
+        "stream": True,
+    }
+    if max_tokens is not None:
+        payload["max_tokens"] = max_tokens
+    prompt_tokens = _estimate_prompt_tokens(payload["messages"], model)
+    tokens = prompt_tokens + (max_tokens or 0)
+    for attempt in range(num_retries):
+        backoff = 2 ** (attempt + 2)
+        # Errors can only be retried before the first piece has been handed out.
+        chunks = 0
+        try:
+            async for event in AsyncLLMClient().stream("chat/completions", payload, tokens):
+                delta = event["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    chunks += 1
+                    yield delta
+            # Streams report no usage; the API sends about one token per chunk.
+            RateLimiter().settle(model or "", tokens, prompt_tokens + chunks)
+            return
+        except RateLimitError:
+            if chunks:
+                raise
+            continue
+        except APIError as e:
+            if chunks or e.http_status != 502 or attempt == num_retries - 1:
+                raise
+        if CFG.debug_mode:
+            print(
+                f"{Fore.RED}Error: ",
+                f"API Bad gateway. Waiting {backoff} seconds...{Fore.RESET}",
+            )
+        await asyncio.sleep(backoff)
+    raise RuntimeError(f"Failed to get response after {num_retries} retries")
+
+
+async def acreate_embeddings(texts: list[str]) -> list[list[float]]:
+    """Create embeddings for many texts in as few requests as possible
+
+    Cached texts are served from the embedding cache. The rest are deduplicated and sent in batches
+    bounded by MAX_EMBEDDING_BATCH_SIZE inputs and MAX_EMBEDDING_BATCH_TOKENS tokens, concurrently.
+
+    Args:
+        texts (list[str]): The texts to embed
+
+    Returns:
+        list[list[float]]: One embedding per text, in the order of `texts`
+    """
+    cache = EmbeddingCache()
+    embeddings = cache.get_many(EMBEDDING_MODEL, texts)
+    missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+    batches = list(_embedding_batches(missing))
+    requests = [_request_embeddings(batch, tokens) for batch, tokens in batches]
+    fetched: dict[str, list[float]] = {}
+    for (batch, _), batch_embeddings in zip(batches, await asyncio.gather(*requests)):
+        fetched.update(zip(batch, batch_embeddings))
+        cache.put_many(EMBEDDING_MODEL, batch, batch_embeddings)
+    return [embedding if embedding is not None else fetched[text] for text, embedding in zip(texts, embeddings)]
+
+
+def _estimate_prompt_tokens(messages: list[dict], model: Optional[str]) -> int:
+    try:
+        return count_message_tokens(messages, model)
+    except (NotImplementedError, KeyError):
+        # Unknown model: roughly four characters per token.
+        return sum(len(message["content"]) // 4 + 4 for message in messages) + 3
+
+
+def _embedding_batches(texts: list[str]) -> Iterator[tuple[list[str], int]]:
+    """Batches of texts with their token counts."""
+    batch: list[str] = []
+    batch_tokens = 0
+    for text in texts:
+        tokens = count_string_tokens(text, EMBEDDING_MODEL)
+        if batch and (len(batch) == MAX_EMBEDDING_BATCH_SIZE or batch_tokens + tokens > MAX_EMBEDDING_BATCH_TOKENS):
+            yield batch, batch_tokens
+            batch = []
+            batch_tokens = 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        yield batch, batch_tokens
+
+
+async def _request_embeddings(texts: list[str], tokens: int) -> list[list[float]]:
+    num_retries = 10
+    for attempt in range(num_retries):
+        backoff = 2 ** (attempt + 2)
+        try:
+            response = await AsyncLLMClient().post("embeddings", {"input": texts, "model": EMBEDDING_MODEL}, tokens)
+            return [item["embedding"] for item in sorted(response["data"], key=lambda item: item["index"])]
+        except RateLimitError:
+            continue
+        except APIError as e:
+            if e.http_status != 502:
+                raise
+            if attempt == num_retries - 1:
+                raise
+        if CFG.debug_mode:
+            print(
+                f"{Fore.RED}Error: ",
+                f"API Bad gateway. Waiting {backoff} seconds...{Fore.RESET}",
+            )
+        await asyncio.sleep(backoff)
+    raise RuntimeError(f"Failed to get embeddings after {num_retries} retries")
@@ -0,0 +1,128 @@
+"""Persistent cache of chat completions, for re-running the same prompts without re-paying for them."""
+from hashlib import sha256
+from typing import Any, Optional
+import json
+import sqlite3
+import threading
+import time
+
+from llm_client.config import Config
+from llm_client.singleton import Singleton
+
+
+def completion_key(
+    model: Optional[str], messages: list[dict[str, Any]], temperature: float, max_tokens: Optional[int]
+) -> str:
+    """Canonical hash of everything that determines a completion."""
+    request = {
+        "model": model,
+        "messages": [{"role": message["role"], "content": message["content"]} for message in messages],
+        "temperature": float(temperature),
+        "max_tokens": max_tokens,
+    }
+    return sha256(json.dumps(request, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+class CompletionCache(metaclass=Singleton):
+    """
+    SQLite-backed cache of completions keyed by `completion_key`.
+
+    Entries expire `ttl` seconds after they were stored and are evicted least-recently-used first
+    once the stored responses exceed `max_bytes`. The cache is off unless COMPLETION_CACHE_FILE
+    is set, and even then only serves callers that ask for it with `cache=True`.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = None, max_bytes: Optional[int] = None):
+        cfg = Config()
+        self.path = path if path is not None else cfg.completion_cache_file
+        self.ttl = ttl if ttl is not None else cfg.completion_cache_ttl
+        self.max_bytes = max_bytes if max_bytes is not None else cfg.completion_cache_max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._total_bytes = 0
+        if self.path:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "   key TEXT PRIMARY KEY,"
+                "   model TEXT,"
+                "   response TEXT NOT NULL,"
+                "   size INTEGER NOT NULL,"
+                "   created REAL NOT NULL,"
+                "   last_used REAL NOT NULL"
+                ")"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used)")
+            self._conn.commit()
+            self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+
+    @property
+    def enabled(self) -> bool:
+        return self._conn is not None
+
+    def get(self, key: str) -> Optional[str]:
+        """The cached response for `key`, or None if it is missing or expired."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        self.hits += 1
+        return row[0]
+
+    def put(self, key: str, model: Optional[str], response: str):
+        if not self.enabled:
+            return
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, model, response, size, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now),
+            )
+            # Replaced entries are double counted here; `_evict` recounts before deleting anything.
+            self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM completions WHERE created < ?", (now - self.ttl,))
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        while self._total_bytes > self.max_bytes:
+            # Drop the oldest ~10% per pass so eviction isn't paid on every insert.
+            count = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT key, size FROM completions ORDER BY last_used LIMIT ?", (max(1, count // 10),)
+            ).fetchall()
+            if not rows:
+                break
+            self._conn.executemany("DELETE FROM completions WHERE key = ?", [(key,) for key, _ in rows])
+            self._total_bytes -= sum(size for _, size in rows)
+
+    def clear(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM completions")
+            self._conn.commit()
+            self._total_bytes = 0
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
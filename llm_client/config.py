@@ -112,6 +112,20 @@ class Config:
         # Note that indexes must be created on db 0 in redis, this is not configurable.
 
         self.memory_backend = os.getenv("MEMORY_BACKEND", "local")
+        # Tokens of remembered interactions per prompt, capped by what the model's context leaves free.
+        self.memory_token_budget = int(os.getenv("MEMORY_TOKEN_BUDGET", 1000))
+
+        # Embeddings we've already paid for. Off unless EMBEDDING_CACHE_FILE is set.
+        self.embedding_cache_file = os.getenv("EMBEDDING_CACHE_FILE", "")
+        self.embedding_cache_max_bytes = int(os.getenv("EMBEDDING_CACHE_MAX_MB", 1024)) * 1024 * 1024
+        # Completions served from disk to callers that pass cache=True. Off unless COMPLETION_CACHE_FILE is set.
+        self.completion_cache_file = os.getenv("COMPLETION_CACHE_FILE", "")
+        self.completion_cache_ttl = float(os.getenv("COMPLETION_CACHE_TTL_HOURS", 24 * 7)) * 3600
+        self.completion_cache_max_bytes = int(os.getenv("COMPLETION_CACHE_MAX_MB", 256)) * 1024 * 1024
+        # Upper bound on concurrent OpenAI requests, and on pooled connections, per event loop.
+        self.llm_max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+        # SQLite file shared by processes that should split one rate limit, empty for per-process limits.
+        self.rate_limit_file = os.getenv("RATE_LIMIT_FILE", "")
         # Initialize the OpenAI API client
         openai.api_key = self.openai_api_key
 
@@ -145,6 +159,20 @@ class Config:
         else:
             return ""
 
+    def get_token_limit(self, model: str) -> int:
+        """
+        Returns the context size, in tokens, of the model specified.
+
+        Parameters:
+            model(str): The model to look up.
+
+        Returns:
+            The smart token limit for the smart model, otherwise the fast token limit.
+        """
+        if model == self.smart_llm_model:
+            return self.smart_token_limit
+        return self.fast_token_limit
+
     AZURE_CONFIG_FILE = os.path.join(os.path.dirname(__file__), "../..", "azure.yaml")
 
     def load_azure_config(self, config_file: str = AZURE_CONFIG_FILE) -> None:
@@ -0,0 +1,160 @@
+"""Persistent, content-addressed cache of embeddings we have already paid for."""
+from hashlib import sha256
+from typing import Optional
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from llm_client.config import Config
+from llm_client.singleton import Singleton
+
+
+def text_hash(text: str) -> str:
+    return sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache(metaclass=Singleton):
+    """
+    SQLite-backed cache of embeddings keyed by (model, sha256(text)).
+
+    Entries are evicted least-recently-used first once the stored vectors exceed `max_bytes`. Hits
+    don't write: their `last_used` times are buffered and written every `touch_batch_size` hits,
+    before an eviction and on `close`. One instance is shared by the whole process; the cache is
+    off unless EMBEDDING_CACHE_FILE is set.
+    """
+
+    touch_batch_size = 1000
+
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        cfg = Config()
+        self.path = path if path is not None else cfg.embedding_cache_file
+        self.max_bytes = max_bytes if max_bytes is not None else cfg.embedding_cache_max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._total_bytes = 0
+        self._touched: dict[tuple[str, str], float] = {}
+        if self.path:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "   model TEXT NOT NULL,"
+                "   text_hash TEXT NOT NULL,"
+                "   embedding BLOB NOT NULL,"
+                "   size INTEGER NOT NULL,"
+                "   last_used REAL NOT NULL,"
+                "   PRIMARY KEY (model, text_hash)"
+                ")"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self._conn.commit()
+            self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    @property
+    def enabled(self) -> bool:
+        return self._conn is not None
+
+    def get(self, model: str, text: str) -> Optional[list[float]]:
+        return self.get_many(model, [text])[0]
+
+    def get_many(self, model: str, texts: list[str]) -> list[Optional[list[float]]]:
+        """Cached embeddings for `texts`, in order, with None for every miss."""
+        if not self.enabled or len(texts) == 0:
+            return [None] * len(texts)
+        hashes = [text_hash(text) for text in texts]
+        found: dict[str, bytes] = {}
+        with self._lock:
+            # Stay well under SQLite's limit on bound parameters.
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start : start + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, embedding FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(chunk))})",
+                    [model, *chunk],
+                ).fetchall()
+                found.update(rows)
+            now = time.time()
+            for hash_ in found:
+                self._touched[(model, hash_)] = now
+            if len(self._touched) >= self.touch_batch_size:
+                self._flush_touched()
+                self._conn.commit()
+        results = [
+            np.frombuffer(found[hash_], dtype=np.float32).tolist() if hash_ in found else None for hash_ in hashes
+        ]
+        hits = sum(result is not None for result in results)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    def put(self, model: str, text: str, embedding: list[float]):
+        self.put_many(model, [text], [embedding])
+
+    def put_many(self, model: str, texts: list[str], embeddings: list[list[float]]):
+        if not self.enabled or len(texts) == 0:
+            return
+        now = time.time()
+        rows = []
+        for text, embedding in zip(texts, embeddings):
+            blob = np.asarray(embedding, dtype=np.float32).tobytes()
+            rows.append((model, text_hash(text), blob, len(blob), now))
+        with self._lock:
+            for row in rows:
+                self._touched.pop(row[:2], None)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, embedding, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            # Replaced entries are double counted here; `_evict` recounts before deleting anything.
+            self._total_bytes += sum(row[3] for row in rows)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _flush_touched(self):
+        """Write the buffered `last_used` times, leaving the commit to the caller."""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                [(last_used, model, hash_) for (model, hash_), last_used in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _evict(self):
+        self._flush_touched()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        while self._total_bytes > self.max_bytes:
+            # Drop the oldest ~10% per pass so eviction isn't paid on every insert.
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT model, text_hash, size FROM embeddings ORDER BY last_used LIMIT ?",
+                (max(1, count // 10),),
+            ).fetchall()
+            if not rows:
+                break
+            self._conn.executemany(
+                "DELETE FROM embeddings WHERE model = ? AND text_hash = ?", [(model, hash_) for model, hash_, _ in rows]
+            )
+            self._total_bytes -= sum(size for _, _, size in rows)
+
+    def clear(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._touched.clear()
+            self._total_bytes = 0
+
+    def close(self):
+        if self._conn is None:
+            return
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
+            self._conn = None
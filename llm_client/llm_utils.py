@@ -1,15 +1,21 @@
 from __future__ import annotations
 
-import time
-from typing import List, Optional
+from typing import Iterator, List, Optional
 
 import openai
-from colorama import Fore, Style
-from openai.error import APIError, RateLimitError
 
-import logging
-
-logger = logging.getLogger()
+from llm_client.async_llm_utils import (  # noqa: F401 - re-exported for existing importers
+    EMBEDDING_MODEL,
+    MAX_EMBEDDING_BATCH_SIZE,
+    MAX_EMBEDDING_BATCH_TOKENS,
+    AsyncLLMClient,
+    acreate_chat_completion,
+    acreate_chat_completion_stream,
+    acreate_embeddings,
+    cached_completion,
+    message_dicts,
+)
+from llm_client.completion_cache import CompletionCache
 from llm_client.config import Config
 from llm_client.types.openai import Message
 
@@ -48,104 +54,78 @@ def call_ai_function(function: str, args: list, description: str, model: str | N
         {"role": "user", "content": args},
     ]
 
-    return create_chat_completion(model=model, messages=messages, temperature=0)
+    return create_chat_completion(model=model, messages=messages, temperature=0, cache=True)
 
 
-# Overly simple abstraction until we create something better
-# simple retry mechanism when getting a rate error or a bad gateway
 def create_chat_completion(
     messages: List[Message],  # type: ignore
     model: Optional[str] = None,
     temperature: float = CFG.temperature,
     max_tokens: Optional[int] = None,
+    cache: bool = False,
 ) -> str:
     """Create a chat completion using the OpenAI API
 
+    Blocking wrapper around `acreate_chat_completion`; requests share the client's connection pool.
+
     Args:
         messages (List[Message]): The messages to send to the chat completion
         model (str, optional): The model to use. Defaults to None.
         temperature (float, optional): The temperature to use. Defaults to 0.9.
         max_tokens (int, optional): The max tokens to use. Defaults to None.
+        cache (bool, optional): Serve repeats of the same request from the completion cache. Defaults to False.
 
     Returns:
         str: The response from the chat completion
     """
-    num_retries = 10
-    warned_user = False
-    if CFG.debug_mode:
-        print(
-            f"{Fore.GREEN}Creating chat completion with model {model}, temperature {temperature}, max_tokens {max_tokens}{Fore.RESET}"
-        )
-    response = None
-    for attempt in range(num_retries):
-        backoff = 2 ** (attempt + 2)
-        try:
-            response = openai.ChatCompletion.create(
-                model=model,
-                messages=[message.dict() for message in messages],
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
-            break
-        except RateLimitError:
-            if CFG.debug_mode:
-                print(f"{Fore.RED}Error: ", f"Reached rate limit, passing...{Fore.RESET}")
-            if not warned_user:
-                logger.warn(
-                    f"Please double check that you have setup a {Fore.CYAN + Style.BRIGHT}PAID{Style.RESET_ALL} OpenAI API Account. "
-                    + f"You can read more here: {Fore.CYAN}https://github.com/Significant-Gravitas/Auto-GPT#openai-api-keys-configuration{Fore.RESET}"
-                )
-                warned_user = True
-        except APIError as e:
-            if e.http_status != 502:
-                raise
-            if attempt == num_retries - 1:
-                raise
-        if CFG.debug_mode:
-            print(
-                f"{Fore.RED}Error: ",
-                f"API Bad gateway. Waiting {backoff} seconds...{Fore.RESET}",
-            )
-        time.sleep(backoff)
-    if response is None:
-        logger.typewriter_log(
-            "FAILED TO GET RESPONSE FROM OPENAI",
-            Fore.RED,
-            "Have failed to get a response from OpenAI's services. "
-            + f"Try running again, and if the problem the persists try running it with `{Fore.CYAN}--debug{Fore.RESET}`.",
-        )
-        logger.double_check()
-        if CFG.debug_mode:
-            raise RuntimeError(f"Failed to get response after {num_retries} retries")
-        else:
-            quit(1)
-    resp = response.choices[0].message["content"]
-    return resp
+    if not cache:
+        return AsyncLLMClient().run(acreate_chat_completion(messages, model, temperature, max_tokens))
+    # Check the cache on this thread so hits skip the hop to the client's event loop.
+    messages = message_dicts(messages)
+    key, cached = cached_completion(messages, model, temperature, max_tokens)
+    if cached is not None:
+        return cached
+    content = AsyncLLMClient().run(acreate_chat_completion(messages, model, temperature, max_tokens))
+    CompletionCache().put(key, model, content)
+    return content
+
+
+def create_chat_completion_stream(
+    messages: List[Message],  # type: ignore
+    model: Optional[str] = None,
+    temperature: float = CFG.temperature,
+    max_tokens: Optional[int] = None,
+) -> Iterator[str]:
+    """Stream a chat completion using the OpenAI API
+
+    Blocking wrapper around `acreate_chat_completion_stream`.
+
+    Args:
+        messages (List[Message]): The messages to send to the chat completion
+        model (str, optional): The model to use. Defaults to None.
+        temperature (float, optional): The temperature to use. Defaults to 0.9.
+        max_tokens (int, optional): The max tokens to use. Defaults to None.
+
+    Yields:
+        str: Pieces of the response, as soon as the API produces them
+    """
+    return AsyncLLMClient().iterate(acreate_chat_completion_stream(messages, model, temperature, max_tokens))
 
 
 def create_embedding_with_ada(text) -> list:
-    """Create an embedding with text-ada-002 using the OpenAI SDK"""
-    num_retries = 10
-    for attempt in range(num_retries):
-        backoff = 2 ** (attempt + 2)
-        try:
-            if CFG.use_azure:
-                return openai.Embedding.create(
-                    input=[text],
-                    engine=CFG.get_azure_deployment_id_for_model("text-embedding-ada-002"),
-                )["data"][0]["embedding"]
-            else:
-                return openai.Embedding.create(input=[text], model="text-embedding-ada-002")["data"][0]["embedding"]
-        except RateLimitError:
-            pass
-        except APIError as e:
-            if e.http_status != 502:
-                raise
-            if attempt == num_retries - 1:
-                raise
-        if CFG.debug_mode:
-            print(
-                f"{Fore.RED}Error: ",
-                f"API Bad gateway. Waiting {backoff} seconds...{Fore.RESET}",
-            )
-        time.sleep(backoff)
+    """Create an embedding with text-ada-002, served from the embedding cache when possible"""
+    return create_embeddings([text])[0]
+
+
+def create_embeddings(texts: list[str]) -> list[list[float]]:
+    """Create embeddings for many texts in as few requests as possible
+
+    Blocking wrapper around `acreate_embeddings`.
+
+    Args:
+        texts (list[str]): The texts to embed
+
+    Returns:
+        list[list[float]]: One embedding per text, in the order of `texts`
+    """
+    return AsyncLLMClient().run(acreate_embeddings(texts))
@@ -7,6 +7,7 @@ import re
 import time
 import traceback
 from logging import LogRecord
+from typing import Iterable
 
 from colorama import Fore, Style
 
@@ -43,6 +44,11 @@ class Logger(metaclass=Singleton):
         self.console_handler.setLevel(logging.DEBUG)
         self.console_handler.setFormatter(console_formatter)
 
+        # Create a handler for console which prints streamed pieces as they arrive
+        self.streaming_console_handler = StreamingConsoleHandler()
+        self.streaming_console_handler.setLevel(logging.INFO)
+        self.streaming_console_handler.setFormatter(AutoGptFormatter("%(title_color)s%(message)s"))
+
         # Info handler in activity.log
         self.file_handler = logging.FileHandler(os.path.join(log_dir, log_file), "a", "utf-8")
         self.file_handler.setLevel(logging.DEBUG)
@@ -63,6 +69,16 @@ class Logger(metaclass=Singleton):
         self.typing_logger.addHandler(error_handler)
         self.typing_logger.setLevel(logging.DEBUG)
 
+        self.streaming_logger = logging.getLogger("STREAMER")
+        self.streaming_logger.addHandler(self.streaming_console_handler)
+        self.streaming_logger.setLevel(logging.DEBUG)
+
+        # Whole streamed messages, once they are complete
+        self.transcript_logger = logging.getLogger("TRANSCRIPT")
+        self.transcript_logger.addHandler(self.file_handler)
+        self.transcript_logger.addHandler(error_handler)
+        self.transcript_logger.setLevel(logging.DEBUG)
+
         self.logger = logging.getLogger("LOGGER")
         self.logger.addHandler(self.console_handler)
         self.logger.addHandler(self.file_handler)
@@ -85,6 +101,20 @@ class Logger(metaclass=Singleton):
 
         self.typing_logger.log(level, content, extra={"title": title, "color": title_color})
 
+    def stream_log(self, deltas: Iterable[str], title="", title_color="", level=logging.INFO) -> str:
+        """Print pieces of a message as they arrive, then log the whole message. Returns the message."""
+        if title:
+            self.streaming_logger.log(level, "", extra={"title": title, "color": title_color})
+        pieces = []
+        for delta in deltas:
+            pieces.append(delta)
+            self.streaming_logger.log(level, delta, extra={"title": ""})
+        self.streaming_logger.log(level, "\n", extra={"title": ""})
+        content = "".join(pieces)
+        send_chat_message_to_user(f"{title}. {content}")
+        self.transcript_logger.log(level, content, extra={"title": title, "color": title_color})
+        return content
+
     def debug(
         self,
         message,
@@ -153,6 +183,17 @@ class TypingConsoleHandler(logging.StreamHandler):
             self.handleError(record)
 
 
+class StreamingConsoleHandler(logging.StreamHandler):
+    """Prints each record as soon as it is emitted, without a trailing newline."""
+
+    def emit(self, record) -> None:
+        msg = self.format(record)
+        try:
+            print(msg, end="", flush=True)
+        except Exception:
+            self.handleError(record)
+
+
 class ConsoleHandler(logging.StreamHandler):
     def emit(self, record) -> None:
         msg = self.format(record)
@@ -0,0 +1,248 @@
+"""Client-side requests-per-minute and tokens-per-minute limits for the OpenAI API."""
+from __future__ import annotations
+
+import asyncio
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, astuple
+from typing import Mapping, Optional
+
+from llm_client.config import Config
+from llm_client.singleton import Singleton
+
+# (requests per minute, tokens per minute) assumed until the API tells us otherwise.
+DEFAULT_RATE_LIMITS: dict[str, tuple[float, float]] = {
+    "gpt-4": (200, 40_000),
+    "gpt-3.5-turbo": (3_500, 90_000),
+    "text-embedding-ada-002": (3_000, 1_000_000),
+}
+FALLBACK_RATE_LIMIT = (60, 40_000)
+# Seconds a 429 without a reset time blocks the model for, doubling with each consecutive 429.
+RATE_LIMIT_BACKOFF = 4.0
+MAX_RATE_LIMIT_BACKOFF = 120.0
+
+
+def default_rate_limit(model: str) -> tuple[float, float]:
+    for prefix, limits in DEFAULT_RATE_LIMITS.items():
+        if model.startswith(prefix):
+            return limits
+    return FALLBACK_RATE_LIMIT
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset_duration(value: str) -> Optional[float]:
+    """Seconds in an `x-ratelimit-reset-*` or `retry-after` value such as "6m0s", "20ms" or "1"."""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+@dataclass
+class _Bucket:
+    """Two token buckets, for requests and tokens, that refill continuously to one minute's limit."""
+
+    rpm: float
+    tpm: float
+    requests: float
+    tokens: float
+    updated: float
+    blocked_until: float = 0.0
+    # 429s since the last successful response.
+    consecutive_429s: int = 0
+
+    def refill(self, now: float):
+        elapsed = max(0.0, now - self.updated)
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+        self.updated = now
+
+    def wait_time(self, tokens: float, now: float) -> float:
+        """Seconds until a request of `tokens` tokens fits, or 0 if it fits now."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        # A request larger than a whole minute's budget waits for a full bucket, then overdraws it.
+        tokens = min(tokens, self.tpm)
+        return max(
+            (1 - self.requests) * 60 / self.rpm if self.requests < 1 else 0.0,
+            (tokens - self.tokens) * 60 / self.tpm if self.tokens < tokens else 0.0,
+        )
+
+
+class RateLimiter(metaclass=Singleton):
+    """
+    Admits OpenAI requests per model at the rate the account allows.
+
+    Each request is pre-charged with its estimated tokens before it is sent and waits, without
+    holding any lock, until both the request and the token bucket can cover it. Responses
+    correct the estimate and the limits: `x-ratelimit-*` headers replace the assumed limits and
+    remaining capacity, and a 429 empties the bucket until the reset time the API reports, or,
+    when it reports none, for a backoff that doubles with each consecutive 429.
+
+    State is per process by default. Set RATE_LIMIT_FILE to share one budget between processes
+    through a SQLite file.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path if path is not None else Config().rate_limit_file
+        self._lock = threading.Lock()
+        self._buckets: dict[str, _Bucket] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        if self.path:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits ("
+                "   model TEXT PRIMARY KEY,"
+                "   rpm REAL NOT NULL,"
+                "   tpm REAL NOT NULL,"
+                "   requests REAL NOT NULL,"
+                "   tokens REAL NOT NULL,"
+                "   updated REAL NOT NULL,"
+                "   blocked_until REAL NOT NULL,"
+                "   consecutive_429s INTEGER NOT NULL DEFAULT 0"
+                ")"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(rate_limits)")}
+            if "consecutive_429s" not in columns:
+                self._conn.execute("ALTER TABLE rate_limits ADD COLUMN consecutive_429s INTEGER NOT NULL DEFAULT 0")
+
+    def _update(self, model: str, change) -> float:
+        """Apply `change(bucket, now)` to the model's bucket atomically and return its result."""
+        with self._lock:
+            now = time.time()
+            if self._conn is None:
+                bucket = self._buckets.get(model)
+                if bucket is None:
+                    rpm, tpm = default_rate_limit(model)
+                    bucket = self._buckets[model] = _Bucket(rpm, tpm, rpm, tpm, now)
+                bucket.refill(now)
+                return change(bucket, now)
+            # BEGIN IMMEDIATE takes the write lock up front so two processes can't both spend the
+            # same capacity.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT rpm, tpm, requests, tokens, updated, blocked_until, consecutive_429s"
+                    " FROM rate_limits WHERE model = ?",
+                    (model,),
+                ).fetchone()
+                if row is None:
+                    rpm, tpm = default_rate_limit(model)
+                    bucket = _Bucket(rpm, tpm, rpm, tpm, now)
+                else:
+                    bucket = _Bucket(*row)
+                bucket.refill(now)
+                result = change(bucket, now)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rate_limits"
+                    " (rpm, tpm, requests, tokens, updated, blocked_until, consecutive_429s, model)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (*astuple(bucket), model),
+                )
+                self._conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def try_acquire(self, model: str, tokens: int) -> float:
+        """Charge one request of `tokens` tokens if it fits now and return 0, else the seconds to wait."""
+
+        def take(bucket: _Bucket, now: float) -> float:
+            wait = bucket.wait_time(tokens, now)
+            if wait == 0:
+                bucket.requests -= 1
+                bucket.tokens -= tokens
+            return wait
+
+        return self._update(model, take)
+
+    async def acquire(self, model: str, tokens: int):
+        """Wait until the model's limits admit a request of `tokens` tokens, then charge it."""
+        while (wait := self.try_acquire(model, tokens)) > 0:
+            await asyncio.sleep(wait)
+
+    def settle(self, model: str, charged_tokens: int, used_tokens: int):
+        """Refund or charge the difference between a request's estimate and its reported usage."""
+
+        def adjust(bucket: _Bucket, now: float):
+            bucket.tokens = min(bucket.tpm, bucket.tokens + charged_tokens - used_tokens)
+
+        self._update(model, adjust)
+
+    def observe(self, model: str, headers: Mapping[str, str], succeeded: bool = False):
+        """
+        Adopt the limits and remaining capacity reported in a response's rate-limit headers.
+        `succeeded` marks a successful response, which resets the backoff after 429s.
+        """
+        limits = _header_floats(headers, "x-ratelimit-limit-requests", "x-ratelimit-limit-tokens")
+        remaining = _header_floats(headers, "x-ratelimit-remaining-requests", "x-ratelimit-remaining-tokens")
+        if not succeeded and not any(limits) and not any(remaining):
+            return
+
+        def adopt(bucket: _Bucket, now: float):
+            if succeeded:
+                bucket.consecutive_429s = 0
+            if limits[0]:
+                bucket.rpm = limits[0]
+            if limits[1]:
+                bucket.tpm = limits[1]
+            # Other clients may share the account, so the server's count wins when it is lower.
+            if remaining[0] is not None:
+                bucket.requests = min(bucket.requests, remaining[0])
+            if remaining[1] is not None:
+                bucket.tokens = min(bucket.tokens, remaining[1])
+
+        self._update(model, adopt)
+
+    def rate_limited(self, model: str, headers: Mapping[str, str]):
+        """
+        Record a 429: nothing more is admitted for the model until the reported reset time, or for
+        an exponential backoff when the response reports none.
+        """
+        self.observe(model, headers)
+        delays = [
+            parse_reset_duration(headers[name])
+            for name in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+            if name in headers
+        ]
+        delays = [delay for delay in delays if delay is not None]
+
+        def block(bucket: _Bucket, now: float):
+            bucket.consecutive_429s += 1
+            bucket.requests = min(bucket.requests, 0)
+            bucket.tokens = min(bucket.tokens, 0)
+            if delays:
+                delay = max(delays)
+            else:
+                # The buckets refill within moments, so without a reset time retries would come back to back.
+                delay = min(RATE_LIMIT_BACKOFF * 2 ** (bucket.consecutive_429s - 1), MAX_RATE_LIMIT_BACKOFF)
+            bucket.blocked_until = max(bucket.blocked_until, now + delay)
+
+        self._update(model, block)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def _header_floats(headers: Mapping[str, str], *names: str) -> list[Optional[float]]:
+    values = []
+    for name in names:
+        try:
+            values.append(float(headers[name]))
+        except (KeyError, ValueError):
+            values.append(None)
+    return values
@@ -24,6 +24,9 @@ class ExperimentRunner:
         self.model = data.get("model", "gpt-3.5-turbo")
         self.temperature = data.get("temperature", 0.0)
         self.perturbations = data.get("perturbations", [])
+        # With `cache: true`, re-runs of unchanged perturbations are served from the completion cache,
+        # when configured. Off by default, since a cached reply replaces a fresh sample.
+        self.use_cache = data.get("cache", False)
 
         self.expected_result = data.get("expected_result", None)
         self.default_label = data.get("default_label", "")
@@ -64,7 +67,7 @@ class ExperimentRunner:
                 print("-----------------------")
                 print(self.to_str(query))
                 prompt = self.generate_query_prompt(query)
-                result = create_chat_completion(prompt, self.model, self.temperature)
+                result = create_chat_completion(prompt, self.model, self.temperature, cache=self.use_cache)
                 print(f"assistant: {result}")
                 print("-----------------------")
                 results.append(self.experiment_state(result))
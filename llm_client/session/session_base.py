@@ -5,12 +5,15 @@ from llm_client.llm_utils import create_chat_completion
 
 
 class SessionBase:
-    def __init__(self, llm_model: Optional[str] = None, temperature: Optional[float] = 0.7):
+    def __init__(self, llm_model: Optional[str] = None, temperature: Optional[float] = 0.7, use_cache: bool = False):
         self._system_prompt: list[str] = []
         self.query_template: str = "{}"
         self.query = ""
         self.model = llm_model or "gpt-3.5-turbo"
         self.temperature = temperature
+        # Opt-in: a cached reply replaces a fresh sample, which is only right for deterministic prompts.
+        # Repeats are only served from disk when COMPLETION_CACHE_FILE is configured.
+        self.use_cache = use_cache
 
     def add_system_prompt(self, system_prompt: str):
         self._system_prompt.append(system_prompt)
@@ -37,7 +40,7 @@ class SessionBase:
 
     def execute(self):
         prompt = self.generate_query_prompt()
-        return create_chat_completion(prompt, self.model, self.temperature)
+        return create_chat_completion(prompt, self.model, self.temperature, cache=self.use_cache)
 
     def __str__(self):
         prompt = "\n".join(f"system: {prompt}" for prompt in self._system_prompt)
@@ -1,6 +1,7 @@
 """Functions for counting the number of tokens in a message or string."""
 from __future__ import annotations
 import logging
+from functools import lru_cache
 
 from typing import List
 
@@ -10,6 +11,38 @@ from llm_client.types.openai import Message
 
 logger = logging.getLogger()
 
+# Token counts are memoized for this many distinct (text, encoding) pairs.
+TOKEN_COUNT_CACHE_SIZE = 65_536
+# Counts stored with messages in memory.db are under this model's encoding (cl100k_base, shared by
+# the chat and embedding models).
+TOKEN_COUNT_MODEL = "gpt-3.5-turbo"
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """The tokenizer for `model`, looked up once per process."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        logger.warn("Warning: model not found. Using cl100k_base encoding.")
+        return tiktoken.get_encoding("cl100k_base")
+
+
+@lru_cache(maxsize=TOKEN_COUNT_CACHE_SIZE)
+def _count_encoded_tokens(text: str, encoding_name: str) -> int:
+    # tiktoken keeps its own registry of encodings by name.
+    return len(tiktoken.get_encoding(encoding_name).encode(text))
+
+
+def count_tokens(text: str, model: str) -> int:
+    """
+    Returns the number of tokens in `text` for `model`.
+
+    Counts are kept in a bounded LRU keyed by text and encoding, so models sharing an encoding share
+    entries and a text seen on an earlier turn is not tokenized again.
+    """
+    return _count_encoded_tokens(text, get_encoding(model).name)
+
 
 def count_message_tokens(messages: List[Message], model: str = "gpt-3.5-turbo-0301") -> int:
     """
@@ -24,11 +57,6 @@ def count_message_tokens(messages: List[Message], model: str = "gpt-3.5-turbo-03
     Returns:
         int: The number of tokens used by the list of messages.
     """
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        logger.warn("Warning: model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
     if model == "gpt-3.5-turbo":
         # !Note: gpt-3.5-turbo may change over time.
         # Returning num tokens assuming gpt-3.5-turbo-0301.")
@@ -52,7 +80,7 @@ def count_message_tokens(messages: List[Message], model: str = "gpt-3.5-turbo-03
     for message in messages:
         num_tokens += tokens_per_message
         for key, value in message.items():
-            num_tokens += len(encoding.encode(value))
+            num_tokens += count_tokens(value, model)
             if key == "name":
                 num_tokens += tokens_per_name
     num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
@@ -70,5 +98,4 @@ def count_string_tokens(string: str, model_name: str) -> int:
     Returns:
         int: The number of tokens in the text string.
     """
-    encoding = tiktoken.encoding_for_model(model_name)
-    return len(encoding.encode(string))
+    return count_tokens(string, model_name)
@@ -1,4 +1,6 @@
 from typing import Any
+import argparse
+import asyncio
 import os
 import openai
 import subprocess
@@ -9,6 +11,7 @@ import csv
 
 from llm_client.config import Config
 from llm_client.agent import Agent
+from llm_client.agent.server import serve
 
 # from llm_client.llm_utils import create_chat_completion, create_embedding_with_ada
 # from llm_client.types.openai import Message, Role
@@ -38,6 +41,20 @@ def main():
     # parser.add_argument("experiment_file", type=str, help="The string input to print to console")
     # args = parser.parse_args()
 
+    parser = argparse.ArgumentParser(description="Talk to the agent, or serve many agent sessions at once.")
+    parser.add_argument("--serve", action="store_true", help="Serve agent sessions over HTTP instead of stdin.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--unix", default=None, help="Listen on this Unix socket instead of a TCP port.")
+    # Other arguments, like the experiment file in the README, are still ignored here.
+    args, _ = parser.parse_known_args()
+    if args.serve:
+        try:
+            asyncio.run(serve("memory.db", args.host, args.port, args.unix, model="gpt-4"))
+        except KeyboardInterrupt:
+            pass
+        return
+
     # agent = Agent("gpt-3.5-turbo", 0.7, "memory.db")
     agent = Agent("gpt-4", 0.7, "memory.db")
     if not agent.load():
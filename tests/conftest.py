@@ -0,0 +1,77 @@
+import os
+from datetime import datetime
+from hashlib import sha256
+from typing import Optional
+
+import numpy as np
+import pytest
+import tiktoken
+
+# Tests never write caches into the working directory.
+os.environ["EMBEDDING_CACHE_FILE"] = ""
+os.environ["COMPLETION_CACHE_FILE"] = ""
+os.environ["RATE_LIMIT_FILE"] = ""
+
+
+class _WhitespaceEncoding:
+    """Stands in for tiktoken's BPE files, which are downloaded on first use."""
+
+    name = "cl100k_base"
+
+    def encode(self, text: str) -> list[str]:
+        return text.split()
+
+
+tiktoken.encoding_for_model = lambda model: _WhitespaceEncoding()
+tiktoken.get_encoding = lambda name: _WhitespaceEncoding()
+
+from llm_client.agent.memory.memory import Memory  # noqa: E402
+from llm_client.agent.memory.sql_backed_memory_objects import SqlInteraction  # noqa: E402
+from llm_client.agent.memory.unit_of_work import UnitOfWork  # noqa: E402
+from llm_client.types.openai import Role  # noqa: E402
+
+DIM = 8
+
+
+def embed(text: str, dim: int = DIM) -> np.ndarray:
+    """A unit vector seeded by `text`, so the same text always gets the same embedding."""
+    rng = np.random.default_rng(int.from_bytes(sha256(text.encode("utf-8")).digest()[:8], "little"))
+    vector = rng.standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.fixture
+def memory_file(tmp_path) -> str:
+    return str(tmp_path / "memory.db")
+
+
+@pytest.fixture
+def memory(memory_file):
+    memory = Memory(memory_file)
+    yield memory
+    memory.close()
+
+
+@pytest.fixture
+def store_turn():
+    """Commits a user message and its reply, with embeddings from `embed`, as one interaction."""
+
+    def store(
+        memory: Memory, user_text: str, reply_text: str, created_at: Optional[datetime] = None
+    ) -> SqlInteraction:
+        unit = UnitOfWork()
+        user_message = memory._new_message(Role.User, user_text, embed(user_text))
+        reply_message = memory._new_message(Role.Assistant, reply_text, embed(reply_text))
+        interaction = SqlInteraction(
+            created_at=created_at or datetime.utcnow(),
+            user_message_id=memory._stage_message(unit, user_message),
+            response_message_id=memory._stage_message(unit, reply_message),
+            system_message_ids=[],
+            relevant_interaction_ids=[],
+            recent_interaction_ids=[],
+        )
+        unit.add_interaction(interaction)
+        memory.commit(unit)
+        return interaction
+
+    return store
@@ -0,0 +1,59 @@
+import pytest
+
+from llm_client.agent import agent as agent_module
+from llm_client.agent.agent import Agent
+from llm_client.agent.memory import memory as memory_module
+from llm_client.types.openai import Role
+
+from conftest import embed
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    """Embeds with `embed`; set `failures` to make that many single-text requests fail first."""
+
+    class Embeddings:
+        failures = 0
+
+        def one(self, text: str):
+            if self.failures > 0:
+                self.failures -= 1
+                raise RuntimeError("embeddings unavailable")
+            return embed(text)
+
+    fake = Embeddings()
+    monkeypatch.setattr(memory_module, "create_embedding_with_ada", fake.one)
+    monkeypatch.setattr(memory_module, "create_embeddings", lambda texts: [embed(text) for text in texts])
+    return fake
+
+
+@pytest.fixture
+def prompts(monkeypatch):
+    """Every chat sent to the model; the fake model echoes the last message."""
+    sent = []
+
+    def complete(chat, model, temperature):
+        sent.append(chat)
+        yield "Echo: " + chat[-1]["content"]
+
+    monkeypatch.setattr(agent_module, "create_chat_completion_stream", complete)
+    return sent
+
+
+def test_turn_falls_back_to_keyword_and_recent_memories_when_embedding_fails(
+    memory, store_turn, embeddings, prompts
+):
+    store_turn(memory, "the deployment to staging failed with error E1234", "Roll back the migration.")
+    agent = Agent("gpt-3.5-turbo", 0.0, memory=memory)
+    agent.configure("tester", "answers questions", [])
+
+    embeddings.failures = 1
+    assert agent.take_turn("what was error E1234 about") == "Echo: what was error E1234 about"
+    assert any("Roll back the migration." in message["content"] for message in prompts[-1])
+
+    # The write-behind job embeds the message again.
+    agent.wait_for_persistence()
+    stored = memory.message_store.lookup_by_text(Role.User, "what was error E1234 about")
+    assert stored is not None and stored.embedding is not None
+    assert len(memory.interactions) == 2
+    agent.close()
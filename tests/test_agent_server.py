@@ -0,0 +1,50 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+from benchmarks.fake_openai_server import FakeOpenAIServer
+from llm_client.agent.agent import Agent
+from llm_client.agent.server import AgentServer
+from llm_client.async_llm_utils import AsyncLLMClient
+
+
+def test_agent_shuts_down_only_its_own_pools(memory):
+    shared = ThreadPoolExecutor(max_workers=1)
+    agent = Agent("gpt-3.5-turbo", 0.0, memory=memory, executor=shared)
+    own_writer = agent._writer
+    agent.close()
+    assert shared.submit(lambda: 42).result() == 42
+    assert own_writer._shutdown
+    shared.shutdown()
+
+
+def test_sessions_run_on_the_server_pools(memory):
+    async def run():
+        fake_api = FakeOpenAIServer(embedding_dim=8)
+        await fake_api.start()
+        client = AsyncLLMClient()
+        client.api_base = fake_api.api_base
+        server = AgentServer(memory)
+        address = await server.start(port=0)
+        try:
+            async with aiohttp.ClientSession() as http:
+                for turn in range(2):
+                    async with http.post(f"{address}/sessions", json={"name": "tester"}) as response:
+                        session_id = (await response.json())["session_id"]
+                    agent = server.sessions[session_id].agent
+                    assert agent._executor is server._executor and agent._writer is server._writer
+                    turn_url = f"{address}/sessions/{session_id}/turns"
+                    async with http.post(turn_url, json={"message": f"hi {turn}"}) as response:
+                        assert (await response.json()) == {"reply": f"Echo: hi {turn}"}
+                    # Closing the session must leave the shared pools running for the next one.
+                    async with http.delete(f"{address}/sessions/{session_id}") as response:
+                        assert response.status == 204
+                async with http.get(f"{address}/health") as response:
+                    assert (await response.json())["interactions"] == 2
+        finally:
+            await server.stop()
+            client.api_base = None
+            await fake_api.stop()
+
+    asyncio.run(run())
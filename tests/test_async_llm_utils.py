@@ -0,0 +1,146 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from aiohttp import web
+from openai.error import APIError, RateLimitError
+
+from benchmarks.fake_openai_server import FakeOpenAIServer, fake_embedding
+from llm_client import async_llm_utils, llm_utils
+from llm_client.async_llm_utils import (
+    AsyncLLMClient,
+    acreate_chat_completion,
+    acreate_chat_completion_stream,
+    acreate_embeddings,
+)
+from llm_client.embedding_cache import EmbeddingCache
+from llm_client.rate_limiter import RateLimiter
+from llm_client.singleton import Singleton
+
+MESSAGES = [{"role": "user", "content": "hello there"}]
+
+
+@pytest.fixture(autouse=True)
+def fresh_limiter():
+    for cls in (RateLimiter, EmbeddingCache):
+        Singleton._instances.pop(cls, None)
+    yield
+    for cls in (RateLimiter, EmbeddingCache):
+        Singleton._instances.pop(cls, None)
+
+
+@pytest.fixture
+def threaded_server():
+    """A fake API on its own thread, for the blocking wrappers that run on the client's loop."""
+    server = FakeOpenAIServer(embedding_dim=8)
+    server.start_in_thread()
+    client = AsyncLLMClient()
+    client.api_base = server.api_base
+    yield server
+    client.api_base = None
+    client.close()
+    server.stop_in_thread()
+
+
+def run_against(server: FakeOpenAIServer, coro_factory):
+    async def run():
+        await server.start()
+        client = AsyncLLMClient()
+        client.api_base = server.api_base
+        try:
+            return await coro_factory()
+        finally:
+            client.api_base = None
+            await client.aclose()
+            await server.stop()
+
+    return asyncio.run(run())
+
+
+def test_exhausted_chat_retries_raise_runtime_error(monkeypatch):
+    monkeypatch.setattr(async_llm_utils.CFG, "debug_mode", True)
+    server = FakeOpenAIServer(fail_every=1)
+    messages = [{"role": "user", "content": "hello"}]
+    with pytest.raises(RuntimeError, match="Failed to get response after 10 retries"):
+        run_against(server, lambda: acreate_chat_completion(messages, model="gpt-3.5-turbo"))
+    assert server.requests["chat/completions"] == 10
+
+
+def test_chat_completion():
+    server = FakeOpenAIServer()
+    reply = run_against(server, lambda: acreate_chat_completion(MESSAGES, model="gpt-3.5-turbo"))
+    assert reply == "Echo: hello there"
+    assert server.requests["chat/completions"] == 1
+
+
+def test_chat_completion_stream():
+    async def collect():
+        return [piece async for piece in acreate_chat_completion_stream(MESSAGES, model="gpt-3.5-turbo")]
+
+    assert run_against(FakeOpenAIServer(), collect) == ["Echo:", " hello", " there"]
+
+
+def test_embeddings_come_back_in_input_order(monkeypatch):
+    monkeypatch.setattr(async_llm_utils, "MAX_EMBEDDING_BATCH_SIZE", 3)
+    server = FakeOpenAIServer(embedding_dim=8)
+    texts = [f"text {idx}" for idx in range(8)] + ["text 2", "text 5"]
+
+    embeddings = run_against(server, lambda: acreate_embeddings(texts))
+
+    np.testing.assert_allclose(embeddings, [fake_embedding(text, 8) for text in texts], rtol=1e-6)
+    # Eight distinct texts, three per request.
+    assert server.requests["embeddings"] == 3
+
+
+def _error_app(status: int, body: str, content_type: str) -> web.Application:
+    async def handler(request: web.Request) -> web.Response:
+        return web.Response(status=status, text=body, content_type=content_type)
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", handler)
+    return app
+
+
+@pytest.mark.parametrize(
+    "status, body, content_type, error_class, message",
+    [
+        (429, '{"error": {"message": "Slow down"}}', "application/json", RateLimitError, "Slow down"),
+        (400, '{"error": {"message": "Bad request"}}', "application/json", APIError, "Bad request"),
+        (502, "<html>Bad gateway</html>", "text/html", APIError, "<html>Bad gateway</html>"),
+        (200, "<html>Not JSON</html>", "text/html", APIError, "<html>Not JSON</html>"),
+    ],
+)
+def test_error_statuses_map_to_openai_errors(status, body, content_type, error_class, message):
+    async def post():
+        runner = web.AppRunner(_error_app(status, body, content_type))
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        client = AsyncLLMClient()
+        client.api_base = f"http://127.0.0.1:{runner.addresses[0][1]}/v1"
+        try:
+            await client.post("chat/completions", {"model": "gpt-3.5-turbo", "messages": MESSAGES})
+        finally:
+            client.api_base = None
+            await client.aclose()
+            await runner.cleanup()
+
+    with pytest.raises(error_class) as raised:
+        asyncio.run(post())
+    assert type(raised.value) is error_class
+    assert raised.value.http_status == status
+    assert str(raised.value) == message
+
+
+def test_blocking_wrappers(threaded_server):
+    assert llm_utils.create_chat_completion(MESSAGES, model="gpt-3.5-turbo") == "Echo: hello there"
+    assert list(llm_utils.create_chat_completion_stream(MESSAGES, model="gpt-3.5-turbo")) == [
+        "Echo:",
+        " hello",
+        " there",
+    ]
+    assert llm_utils.create_embedding_with_ada("hello") == pytest.approx(fake_embedding("hello", 8))
+    np.testing.assert_allclose(
+        llm_utils.create_embeddings(["a", "b"]), [fake_embedding("a", 8), fake_embedding("b", 8)], rtol=1e-6
+    )
+    assert threaded_server.requests == {"chat/completions": 2, "embeddings": 2}
@@ -0,0 +1,51 @@
+import threading
+
+from llm_client.agent.memory.connection_pool import SqliteConnectionPool
+from llm_client.agent.memory.memory import Memory
+from llm_client.types.openai import Role
+
+
+def _create_items(pool: SqliteConnectionPool):
+    with pool.write() as conn:
+        conn.execute("CREATE TABLE items (name TEXT)")
+        conn.execute("INSERT INTO items VALUES ('a')")
+
+
+def _read_items(pool: SqliteConnectionPool) -> list[tuple[str]]:
+    with pool.read() as conn:
+        return conn.execute("SELECT name FROM items").fetchall()
+
+
+def test_reader_on_another_thread_sees_committed_writes(tmp_path):
+    pool = SqliteConnectionPool(str(tmp_path / "pool.db"))
+    _create_items(pool)
+    seen = []
+    thread = threading.Thread(target=lambda: seen.extend(_read_items(pool)))
+    thread.start()
+    thread.join()
+    assert seen == [("a",)]
+    pool.close()
+
+
+def test_in_memory_readers_share_the_writer_database():
+    pool = SqliteConnectionPool(":memory:")
+    _create_items(pool)
+    assert _read_items(pool) == [("a",)]
+    seen = []
+    thread = threading.Thread(target=lambda: seen.extend(_read_items(pool)))
+    thread.start()
+    thread.join()
+    assert seen == [("a",)]
+    pool.close()
+
+
+def test_in_memory_memory_stores_and_reads_back_turns(store_turn):
+    memory = Memory(":memory:")
+    try:
+        interaction = store_turn(memory, "question", "answer")
+        assert not memory.message_store.has_sidecars
+        assert memory.message_store.lookup_by_text(Role.User, "question") is not None
+        stored = memory.interactions_created_between(interaction.created_at, interaction.created_at.max)
+        assert [stored_interaction.uid for stored_interaction in stored] == [interaction.uid]
+    finally:
+        memory.close()
@@ -0,0 +1,59 @@
+import sqlite3
+
+import pytest
+
+from llm_client.config import Config
+from llm_client.embedding_cache import EmbeddingCache, text_hash
+from llm_client.singleton import Singleton
+
+MODEL = "text-embedding-ada-002"
+
+
+@pytest.fixture
+def cache_file(tmp_path):
+    Singleton._instances.pop(EmbeddingCache, None)
+    yield str(tmp_path / "embedding_cache.db")
+    Singleton._instances.pop(EmbeddingCache, None)
+
+
+def _set_last_used(path: str, **last_used: float):
+    with sqlite3.connect(path) as conn:
+        conn.executemany(
+            "UPDATE embeddings SET last_used = ? WHERE text_hash = ?",
+            [(when, text_hash(text)) for text, when in last_used.items()],
+        )
+
+
+def _last_used(path: str, text: str) -> float:
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT last_used FROM embeddings WHERE text_hash = ?", (text_hash(text),)).fetchone()[0]
+
+
+def test_cache_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("EMBEDDING_CACHE_FILE")
+    assert Config().embedding_cache_file == ""
+
+
+def test_hits_update_last_used_in_batches(cache_file):
+    cache = EmbeddingCache(path=cache_file)
+    cache.touch_batch_size = 2
+    cache.put_many(MODEL, ["a", "b"], [[1.0], [2.0]])
+    _set_last_used(cache_file, a=0.0, b=0.0)
+
+    assert cache.get(MODEL, "a") == [1.0]
+    assert _last_used(cache_file, "a") == 0.0
+    cache.get(MODEL, "b")
+    assert _last_used(cache_file, "a") > 0.0 and _last_used(cache_file, "b") > 0.0
+    cache.close()
+
+
+def test_eviction_sees_buffered_hits(cache_file):
+    # Room for two four-byte vectors.
+    cache = EmbeddingCache(path=cache_file, max_bytes=8)
+    cache.put_many(MODEL, ["old", "new"], [[1.0], [2.0]])
+    _set_last_used(cache_file, old=1.0, new=2.0)
+    cache.get(MODEL, "old")
+    cache.put_many(MODEL, ["newest"], [[3.0]])
+    assert cache.get(MODEL, "old") == [1.0]
+    assert cache.get(MODEL, "new") is None
+    cache.close()
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from llm_client.agent.memory.embedding_matrix import EmbeddingMatrix
+
+
+def _rows(count: int, dim: int = 4, start: int = 0) -> np.ndarray:
+    return np.arange(start, start + count, dtype=np.float32)[:, None].repeat(dim, axis=1)
+
+
+def test_append_grows_by_doubling_and_keeps_rows():
+    matrix = EmbeddingMatrix(initial_capacity=2)
+    for idx, row in enumerate(_rows(5)):
+        assert matrix.append(f"m{idx}", row) == idx
+    assert len(matrix) == 5 and matrix.capacity == 8
+    np.testing.assert_array_equal(matrix.matrix, _rows(5))
+    assert matrix.row_to_uid == [f"m{idx}" for idx in range(5)]
+    assert matrix.uid_to_row == {f"m{idx}": idx for idx in range(5)}
+
+
+def test_append_of_a_known_uid_returns_its_row():
+    matrix = EmbeddingMatrix()
+    matrix.append("a", _rows(1)[0])
+    matrix.append("b", _rows(1, start=1)[0])
+    assert matrix.append("a", _rows(1, start=9)[0]) == 0
+    assert len(matrix) == 2
+    np.testing.assert_array_equal(matrix.matrix[0], _rows(1)[0])
+
+
+def test_append_rejects_another_dimension():
+    matrix = EmbeddingMatrix()
+    matrix.append("a", np.zeros(4))
+    with pytest.raises(ValueError, match="expected 4"):
+        matrix.append("b", np.zeros(3))
+
+
+def test_extend_adopts_the_first_buffer_and_copies_on_growth():
+    matrix = EmbeddingMatrix(initial_capacity=2)
+    first = _rows(3)
+    matrix.extend(["a", "b", "c"], first)
+    assert np.shares_memory(matrix.matrix, first)
+
+    matrix.extend(["b", "d", "e"], _rows(3, start=3))
+    assert not np.shares_memory(matrix.matrix, first)
+    assert matrix.row_to_uid == ["a", "b", "c", "d", "e"]
+    assert matrix.uid_to_row == {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4}
+    # "b" was already stored, so its new row is dropped.
+    np.testing.assert_array_equal(matrix.matrix[:, 0], [0, 1, 2, 4, 5])
+
+
+def test_extend_checks_its_arguments():
+    matrix = EmbeddingMatrix()
+    with pytest.raises(ValueError, match="2 uids for 1 embeddings"):
+        matrix.extend(["a", "b"], _rows(1))
+    matrix.extend(["a"], _rows(1))
+    with pytest.raises(ValueError, match="expected 4"):
+        matrix.extend(["b"], _rows(1, dim=3))
+
+
+def test_scores_are_dot_products_in_row_order():
+    matrix = EmbeddingMatrix()
+    assert matrix.scores(np.ones(4)).shape == (0,)
+    matrix.extend(["a", "b", "c"], _rows(3))
+    np.testing.assert_array_equal(matrix.scores(np.ones(4)), [0.0, 4.0, 8.0])
@@ -0,0 +1,72 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from llm_client.agent.memory.sql_backed_memory_objects import SqlInteraction, _LinkGroups, create_memory_tables
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    create_memory_tables(conn, search_index=False)
+    yield conn
+    conn.close()
+
+
+def _link(conn: sqlite3.Connection, table: str, column: str, links: list[tuple[str, str]]):
+    conn.executemany(f"INSERT INTO {table} (interaction_id, {column}) VALUES (?, ?)", links)
+
+
+def test_link_groups_keep_insertion_order_within_an_interaction(conn):
+    # Interleaved across interactions, as concurrent sessions would write them.
+    _link(
+        conn,
+        "interaction_system_messages",
+        "system_message_id",
+        [("b", "s3"), ("a", "s2"), ("b", "s1"), ("a", "s9"), ("c", "s4"), ("a", "s1")],
+    )
+    groups = _LinkGroups(conn, "interaction_system_messages", "system_message_id")
+    assert groups.take("a") == ["s2", "s9", "s1"]
+    assert groups.take("b") == ["s3", "s1"]
+    assert groups.take("c") == ["s4"]
+
+
+def test_link_groups_skip_orphans_and_interactions_without_links(conn):
+    _link(
+        conn,
+        "interaction_recent_interactions",
+        "related_interaction_id",
+        [("a", "x"), ("b-deleted", "y"), ("c", "z"), ("e-deleted", "w")],
+    )
+    groups = _LinkGroups(conn, "interaction_recent_interactions", "related_interaction_id")
+    assert groups.take("a") == ["x"]
+    assert groups.take("b") == []
+    # "b-deleted" sorts before "c" and is passed over.
+    assert groups.take("c") == ["z"]
+    assert groups.take("d") == []
+    assert groups.take("f") == []
+
+
+def test_load_all_merges_every_link_table(conn):
+    conn.executemany(
+        "INSERT INTO interactions (created_at, id, user_message_id, response_message_id) VALUES (?, ?, ?, ?)",
+        [(datetime(2024, 1, day), uid, f"u-{uid}", f"r-{uid}") for day, uid in [(3, "c"), (1, "a"), (2, "b")]],
+    )
+    _link(conn, "interaction_system_messages", "system_message_id", [("c", "s2"), ("a", "s1"), ("c", "s1")])
+    _link(conn, "interaction_relevant_interactions", "related_interaction_id", [("c", "b"), ("c", "a")])
+    _link(conn, "interaction_recent_interactions", "related_interaction_id", [("b", "a"), ("c", "b")])
+
+    loaded = {interaction.uid: interaction for interaction in SqlInteraction.load_all(conn)}
+
+    assert list(loaded) == ["a", "b", "c"]
+    assert [loaded[uid].system_message_ids for uid in "abc"] == [["s1"], [], ["s2", "s1"]]
+    assert [loaded[uid].relevant_interaction_ids for uid in "abc"] == [[], [], ["b", "a"]]
+    assert [loaded[uid].recent_interaction_ids for uid in "abc"] == [[], ["a"], ["b"]]
+    assert loaded["b"].created_at == datetime(2024, 1, 2)
+
+    between = SqlInteraction.load_created_between(conn, datetime(2024, 1, 2), datetime(2024, 1, 4))
+    assert [(interaction.uid, interaction.system_message_ids) for interaction in between] == [
+        ("b", []),
+        ("c", ["s2", "s1"]),
+    ]
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from llm_client.agent.memory.interaction_store import InteractionStore
+from llm_client.agent.memory.message_store import MessageStore
+from llm_client.agent.memory.sql_backed_memory_objects import SqlInteraction
+
+START = datetime(2024, 1, 1)
+
+
+def _interaction(uid: str, hour: int) -> SqlInteraction:
+    return SqlInteraction(
+        uid=uid,
+        created_at=START + timedelta(hours=hour),
+        user_message_id=f"u-{uid}",
+        response_message_id=f"r-{uid}",
+        system_message_ids=[],
+        relevant_interaction_ids=[],
+        recent_interaction_ids=[],
+    )
+
+
+def _uids(interactions: list[SqlInteraction]) -> list[str]:
+    return [interaction.uid for interaction in interactions]
+
+
+@pytest.fixture
+def store() -> InteractionStore:
+    """Interactions "h0" to "h5" created at hours 0 to 5, added out of order."""
+    store = InteractionStore(MessageStore())
+    store.add_interactions([_interaction("h3", 3), _interaction("h0", 0), _interaction("h4", 4)])
+    for uid, hour in [("h5", 5), ("h1", 1), ("h2", 2)]:
+        store.add_interaction(_interaction(uid, hour))
+    return store
+
+
+def test_latest_is_newest_first(store):
+    assert _uids(store.latest(3)) == ["h5", "h4", "h3"]
+    assert _uids(store.latest(10)) == ["h5", "h4", "h3", "h2", "h1", "h0"]
+    assert store.latest(0) == []
+
+
+def test_created_between_is_half_open_and_oldest_first(store):
+    assert _uids(store.created_between(START + timedelta(hours=1), START + timedelta(hours=4))) == ["h1", "h2", "h3"]
+    assert store.created_between(START + timedelta(hours=6), START + timedelta(hours=9)) == []
+
+
+def test_page(store):
+    assert _uids(store.page(0, 2)) == ["h5", "h4"]
+    assert _uids(store.page(4, 5)) == ["h1", "h0"]
+    assert store.page(6, 2) == []
+    assert _uids(store.page(1, 2, newest_first=False)) == ["h1", "h2"]
+
+
+def test_readding_an_interaction_moves_it(store):
+    store.add_interaction(_interaction("h1", 9))
+    assert _uids(store.latest(2)) == ["h1", "h5"]
+    assert len(store) == 6
+
+
+def test_k_most_recent_returns_the_newest_interactions(memory, store_turn):
+    for hour in [2, 0, 3, 1]:
+        store_turn(memory, f"question {hour}", f"answer {hour}", created_at=START + timedelta(hours=hour))
+    recent = memory.k_most_recent(3)
+    assert [interaction.created_at.hour for interaction in recent] == [3, 2, 1]
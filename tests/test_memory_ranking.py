@@ -0,0 +1,55 @@
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from llm_client.agent.memory.memory import maximal_marginal_relevance
+from llm_client.agent.prompt import pack_knapsack
+
+
+def test_lone_distinct_memory_is_still_packed():
+    # Two near-duplicates of the query, and one weakly related memory that is distinct from both.
+    relevance = np.array([0.9, 0.89, 0.1])
+    pairwise_similarity = np.array([[1.0, 0.99, 0.4], [0.99, 1.0, 0.4], [0.4, 0.4, 1.0]])
+    order, scores = maximal_marginal_relevance(relevance, pairwise_similarity, diversity=0.3)
+    assert (scores > 0).all()
+
+    chosen = pack_knapsack([10, 10, 10], scores.tolist(), budget=30)
+    assert sorted(order[chosen].tolist()) == [0, 1, 2]
+    # With room for two, the distinct memory is still worth less than a near-duplicate of a good match.
+    assert order[pack_knapsack([10, 10, 10], scores.tolist(), budget=20)].tolist() == [0, 1]
+
+
+def _best_total(costs: list[int], scores: list[float], budget: int) -> float:
+    """The optimum by trying every subset."""
+    return max(
+        sum(scores[idx] for idx in subset)
+        for size in range(len(costs) + 1)
+        for subset in combinations(range(len(costs)), size)
+        if sum(costs[idx] for idx in subset) <= budget
+    )
+
+
+def test_pack_knapsack_finds_the_best_subset():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        count = int(rng.integers(1, 9))
+        costs = rng.integers(1, 40, count).tolist()
+        scores = rng.uniform(0.01, 1.0, count).tolist()
+        budget = int(rng.integers(0, 120))
+
+        chosen = pack_knapsack(costs, scores, budget)
+
+        assert chosen == sorted(set(chosen))
+        assert sum(costs[idx] for idx in chosen) <= budget
+        assert sum(scores[idx] for idx in chosen) == pytest.approx(_best_total(costs, scores, budget))
+
+
+def test_pack_knapsack_never_takes_worthless_items():
+    assert pack_knapsack([5, 5, 5, 5], [0.5, 0.0, -0.2, 0.1], budget=100) == [0, 3]
+    assert pack_knapsack([5, 5], [0.0, -1.0], budget=100) == []
+
+
+def test_pack_knapsack_skips_items_over_budget():
+    assert pack_knapsack([50, 10], [10.0, 1.0], budget=20) == [1]
+    assert pack_knapsack([1], [1.0], budget=0) == []
@@ -0,0 +1,63 @@
+import numpy as np
+
+from llm_client.agent.memory.memory import Memory
+from llm_client.types.openai import Role
+
+
+def test_second_writer_keeps_embeddings_in_memory(memory_file, store_turn):
+    owner = Memory(memory_file)
+    store_turn(owner, "first question", "first answer")
+    assert owner.message_store.has_sidecars
+
+    # The file lock is per open file, so a second Memory in this process stands in for a second process.
+    other = Memory(memory_file)
+    assert not other.message_store.has_sidecars
+    store_turn(other, "second question", "second answer")
+    # The owner's file is untouched, and the other writer records no sidecar rows.
+    assert len(owner.message_store.embeddings[Role.User]) == 1
+    assert other.message_store.lookup_by_text(Role.User, "second question").embedding_row is None
+    other.close()
+    owner.close()
+
+    # Rows missing from the files make the next start rebuild them from the database.
+    reopened = Memory(memory_file)
+    try:
+        assert reopened.message_store.has_sidecars
+        assert len(reopened.message_store.embeddings[Role.User]) == 2
+        assert {message.text for message in reopened.messages} == {
+            "first question",
+            "first answer",
+            "second question",
+            "second answer",
+        }
+    finally:
+        reopened.close()
+
+
+def test_sidecars_are_released_on_close(memory_file, store_turn):
+    memory = Memory(memory_file)
+    store_turn(memory, "question", "answer")
+    memory.close()
+
+    reopened = Memory(memory_file)
+    try:
+        assert reopened.message_store.has_sidecars
+        assert sorted(message.text for message in reopened.messages) == ["answer", "question"]
+    finally:
+        reopened.close()
+
+
+def test_rebuilt_messages_point_at_the_sidecar_rows(memory_file, tmp_path, store_turn):
+    memory = Memory(memory_file)
+    store_turn(memory, "question", "answer")
+    memory.close()
+    for sidecar in tmp_path.glob("*.embeddings"):
+        sidecar.unlink()
+
+    # No sidecars: the embeddings are read from the BLOBs and copied into new files.
+    rebuilt = Memory(memory_file)
+    try:
+        for message in rebuilt.messages:
+            assert np.shares_memory(message.embedding.data, rebuilt.message_store.embeddings[message.role].matrix)
+    finally:
+        rebuilt.close()
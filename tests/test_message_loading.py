@@ -0,0 +1,85 @@
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from llm_client.agent.memory.sql_backed_memory_objects import (
+    SqlMessage,
+    Vector,
+    create_memory_tables,
+    parse_timestamps,
+)
+from llm_client.types.openai import Role
+
+from conftest import embed
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    create_memory_tables(conn)
+    yield conn
+    conn.close()
+
+
+def _stored(conn: sqlite3.Connection, role: Role, text: str, created_at: datetime) -> SqlMessage:
+    message = SqlMessage(
+        role=role, text=text, embedding=Vector.construct(data=embed(text)), created_at=created_at, token_count=len(text)
+    )
+    message.save_to_sql(conn)
+    return message
+
+
+def test_load_all_bulk_round_trips_messages_grouped_by_role(conn):
+    roles = [Role.User, Role.Assistant, Role.System, Role.User, Role.Assistant, Role.User]
+    stored = {}
+    for idx, role in enumerate(roles):
+        message = _stored(conn, role, f"message {idx}", datetime(2024, 1, idx + 1, 12, 30, 15, 250))
+        stored[message.uid] = message
+
+    messages, embeddings = SqlMessage.load_all_bulk(conn)
+
+    assert embeddings.dtype == np.float32 and embeddings.shape == (len(roles), 8)
+    # Each role's rows are one contiguous slice, in insertion order within the role.
+    assert [message.role for message in messages] == sorted(roles, key=lambda role: role.value)
+    assert [message.text for message in messages if message.role == Role.User] == [
+        "message 0",
+        "message 3",
+        "message 5",
+    ]
+    for row, message in enumerate(messages):
+        original = stored[message.uid]
+        assert (message.text, message.created_at, message.token_count) == (
+            original.text,
+            original.created_at,
+            original.token_count,
+        )
+        np.testing.assert_array_equal(message.embedding.data, original.embedding.data)
+        assert np.shares_memory(message.embedding.data, embeddings)
+        np.testing.assert_array_equal(embeddings[row], original.embedding.data)
+
+
+def test_load_all_bulk_of_an_empty_table(conn):
+    messages, embeddings = SqlMessage.load_all_bulk(conn)
+    assert messages == [] and embeddings.shape == (0, 0)
+
+
+def test_parse_timestamps_falls_back_for_odd_formats():
+    assert parse_timestamps(["2024-03-01 10:20:30.500000", "2024-03-02 08:00:00"]) == [
+        datetime(2024, 3, 1, 10, 20, 30, 500000),
+        datetime(2024, 3, 2, 8, 0),
+    ]
+    assert parse_timestamps(["2024-03-01 10:20:30", "March 2, 2024 8:00 AM"]) == [
+        datetime(2024, 3, 1, 10, 20, 30),
+        datetime(2024, 3, 2, 8, 0),
+    ]
+
+
+def test_load_all_bulk_reads_rows_with_odd_timestamps(conn):
+    message = _stored(conn, Role.User, "hello", datetime(2024, 3, 1, 10, 20, 30))
+    conn.execute("UPDATE messages SET timestamp = ? WHERE id = ?", ("March 1, 2024 10:20:30 AM", message.uid))
+
+    (loaded,), _ = SqlMessage.load_all_bulk(conn)
+
+    assert loaded.created_at == datetime(2024, 3, 1, 10, 20, 30)
@@ -0,0 +1,24 @@
+import numpy as np
+
+from llm_client.agent.memory.message_store import MessageStore
+from llm_client.agent.memory.sql_backed_memory_objects import SqlMessage, Vector
+from llm_client.types.openai import Role
+
+
+def _message(text: str) -> SqlMessage:
+    return SqlMessage(role=Role.User, text=text, embedding=Vector.construct(data=np.full(4, len(text), np.float32)))
+
+
+def test_messages_share_their_matrix_rows_across_growth():
+    store = MessageStore()
+    matrix = store.embeddings[Role.User]
+    messages = [_message("x" * (idx + 1)) for idx in range(matrix.initial_capacity + 1)]
+    for message in messages[:-1]:
+        store.add_message(message)
+    full_buffer = matrix.matrix
+    # The next append copies every row into a bigger buffer; no message may keep the old one alive.
+    store.add_message(messages[-1])
+    assert not np.shares_memory(matrix.matrix, full_buffer)
+    for row, message in enumerate(messages):
+        assert np.shares_memory(message.embedding.data, matrix.matrix)
+        assert message.embedding.data[0] == row + 1
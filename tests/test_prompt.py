@@ -0,0 +1,57 @@
+from datetime import datetime
+
+import pytest
+
+from llm_client.agent import prompt as prompt_module
+from llm_client.agent.memory.remembered_interaction import RememberedInteraction
+from llm_client.agent.prompt import ExceededTokenLimit, MemoryCandidate, Prompt, count_message_tokens
+
+
+def _candidates(count: int) -> list[MemoryCandidate]:
+    return [
+        MemoryCandidate(
+            interaction=RememberedInteraction(
+                uid=str(idx),
+                created_at=datetime(2024, 1, 1),
+                user_message=" ".join(["question"] * 40),
+                response_message=" ".join(["answer"] * 60),
+            ),
+            relevant=idx % 2 == 0,
+            score=1.0,
+        )
+        for idx in range(count)
+    ]
+
+
+def _memory_tokens(prompt: Prompt) -> int:
+    messages = prompt._messages.get("relevant_memory", []) + prompt._messages.get("recent_memory", [])
+    return sum(count_message_tokens(message) for message in messages)
+
+
+@pytest.fixture
+def cfg(monkeypatch):
+    monkeypatch.setattr(prompt_module.cfg, "smart_token_limit", 8000)
+    monkeypatch.setattr(prompt_module.cfg, "memory_token_budget", 500)
+    return prompt_module.cfg
+
+
+def test_memories_stay_within_the_configured_budget(cfg):
+    prompt = Prompt.for_model(cfg.smart_llm_model)
+    assert prompt.token_limit == 7000 and prompt.memory_token_budget == 500
+
+    added = prompt.add_memories(_candidates(50))
+
+    assert 0 < len(added) < 50
+    assert _memory_tokens(prompt) <= 500
+    # Another memory would still fit in the context, but not in the budget.
+    assert _memory_tokens(prompt) + count_message_tokens(prompt.recent_memory_message(added[0].interaction)) > 500
+    with pytest.raises(ExceededTokenLimit):
+        prompt.add_recent_memory(added[0].interaction)
+
+
+def test_context_size_caps_a_larger_budget(cfg, monkeypatch):
+    monkeypatch.setattr(cfg, "memory_token_budget", 100_000)
+    prompt = Prompt.for_model(cfg.smart_llm_model)
+    prompt.add_memories(_candidates(200))
+    assert prompt.memory_token_budget == 100_000
+    assert 6000 < _memory_tokens(prompt) <= prompt.token_limit
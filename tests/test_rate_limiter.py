@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+import pytest
+
+from benchmarks.fake_openai_server import FakeOpenAIServer
+from llm_client import rate_limiter
+from llm_client.async_llm_utils import AsyncLLMClient, _request_embeddings
+from llm_client.rate_limiter import RateLimiter
+from llm_client.singleton import Singleton
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "RATE_LIMIT_BACKOFF", 0.05)
+    monkeypatch.setattr(rate_limiter, "MAX_RATE_LIMIT_BACKOFF", 0.2)
+    Singleton._instances.pop(RateLimiter, None)
+    yield RateLimiter(path="")
+    Singleton._instances.pop(RateLimiter, None)
+
+
+def test_429_without_reset_time_backs_off_exponentially(limiter):
+    limiter.rate_limited("gpt-4", {})
+    first = limiter.try_acquire("gpt-4", 0)
+    limiter.rate_limited("gpt-4", {})
+    second = limiter.try_acquire("gpt-4", 0)
+    assert 0.04 < first < second <= 0.2
+
+    limiter.observe("gpt-4", {}, succeeded=True)
+    assert limiter._buckets["gpt-4"].consecutive_429s == 0
+
+
+def test_retries_wait_out_429s_without_reset_time(limiter):
+    server = FakeOpenAIServer(fail_every=1, fail_with_reset=False)
+
+    async def request() -> float:
+        await server.start()
+        client = AsyncLLMClient()
+        client.api_base = server.api_base
+        start = time.perf_counter()
+        try:
+            with pytest.raises(RuntimeError):
+                await _request_embeddings(["hello"], 1)
+            return time.perf_counter() - start
+        finally:
+            client.api_base = None
+            await client.aclose()
+            await server.stop()
+
+    elapsed = asyncio.run(request())
+    assert server.requests["embeddings"] == 10
+    # 0.05 + 0.1 + 0.2 (the cap) for each of the remaining retries.
+    assert elapsed >= 0.05 + 0.1 + 0.2 * 7
@@ -0,0 +1,45 @@
+import sqlite3
+
+import pytest
+
+from llm_client.agent.memory.sql_backed_memory_objects import SqlMessage, create_memory_tables, fts_words
+from llm_client.types.openai import Role
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    if not create_memory_tables(conn):
+        pytest.skip("SQLite was built without FTS5")
+    yield conn
+    conn.close()
+
+
+def test_fts_words_drop_diacritics_like_the_tokenizer():
+    assert fts_words("Café José, naïve CAFÉ") == ["cafe", "jose", "naive"]
+    assert fts_words("한국어 문장") == ["한국어", "문장"]
+
+
+def test_accented_query_matches_accented_message(conn):
+    conn.executemany(
+        "INSERT INTO messages (id, role, content, embedding) VALUES (?, ?, ?, ?)",
+        [
+            ("cafe", Role.User.value, "Meeting at the café with José", b""),
+            ("other", Role.User.value, "Lunch at the office", b""),
+        ],
+    )
+    results = SqlMessage.search_text(conn, "café José", [Role.User], k=5)
+    assert [uid for uid, _ in results] == ["cafe"]
+
+
+def test_query_longer_than_the_sqlite_parameter_limit(conn):
+    conn.execute(
+        "INSERT INTO messages (id, role, content, embedding) VALUES (?, ?, ?, ?)",
+        ("needle", Role.User.value, "the needle word", b""),
+    )
+    # Builds before SQLite 3.32 allow at most 999 bound parameters.
+    conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+    # A pasted wall of text, with far more distinct words than that.
+    text = " ".join(f"filler{idx}" for idx in range(5000)) + " needle"
+    results = SqlMessage.search_text(conn, text, [Role.User], k=5)
+    assert [uid for uid, _ in results] == ["needle"]
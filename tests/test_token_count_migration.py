@@ -0,0 +1,58 @@
+import sqlite3
+
+import pytest
+
+from llm_client.agent.memory import memory as memory_module
+from llm_client.agent.memory.memory import Memory
+from llm_client.agent.memory.sql_backed_memory_objects import vector_to_blob
+from llm_client.token_counter import TOKEN_COUNT_MODEL, count_tokens
+from llm_client.types.openai import Role
+
+from conftest import embed
+
+TEXTS = {"old-1": "an old message from before token counts", "old-2": "another one"}
+
+
+@pytest.fixture
+def old_database(memory_file) -> str:
+    """A database written before messages had the embedding_row and token_count columns."""
+    with sqlite3.connect(memory_file) as conn:
+        conn.execute(
+            "CREATE TABLE messages ("
+            "   id TEXT PRIMARY KEY,"
+            "   timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,"
+            "   role TEXT NOT NULL,"
+            "   content TEXT NOT NULL,"
+            "   embedding BLOB NOT NULL"
+            ")"
+        )
+        conn.executemany(
+            "INSERT INTO messages (id, role, content, embedding) VALUES (?, ?, ?, ?)",
+            [(uid, Role.User.value, text, vector_to_blob(embed(text))) for uid, text in TEXTS.items()],
+        )
+    conn.close()
+    return memory_file
+
+
+def _stored_counts(path: str) -> dict[str, int]:
+    with sqlite3.connect(path) as conn:
+        counts = dict(conn.execute("SELECT id, token_count FROM messages").fetchall())
+    conn.close()
+    return counts
+
+
+def test_token_counts_are_added_and_stored_once(old_database, monkeypatch):
+    expected = {uid: count_tokens(text, TOKEN_COUNT_MODEL) for uid, text in TEXTS.items()}
+
+    memory = Memory(old_database)
+    assert {message.uid: message.token_count for message in memory.messages} == expected
+    memory.close()
+    assert _stored_counts(old_database) == expected
+
+    def no_recount(text, model):
+        raise AssertionError("Stored token counts should be read, not recounted.")
+
+    monkeypatch.setattr(memory_module, "count_tokens", no_recount)
+    memory = Memory(old_database)
+    assert {message.uid: message.token_count for message in memory.messages} == expected
+    memory.close()
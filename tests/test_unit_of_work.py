@@ -0,0 +1,103 @@
+from datetime import datetime
+
+import pytest
+
+from llm_client.agent.memory.memory import Memory
+from llm_client.agent.memory.sql_backed_memory_objects import SqlInteraction
+from llm_client.agent.memory.unit_of_work import UnitOfWork
+from llm_client.types.openai import Role
+
+from conftest import embed
+
+
+class _RecordingCursor:
+    def __init__(self):
+        self.calls: list[tuple[str, list]] = []
+
+    def executemany(self, sql: str, rows):
+        self.calls.append((sql, list(rows)))
+
+
+class _RecordingConnection:
+    def __init__(self):
+        self.recorded = _RecordingCursor()
+
+    def cursor(self):
+        return self.recorded
+
+
+def _turn(memory: Memory, unit: UnitOfWork, user_text: str, linked: SqlInteraction = None) -> SqlInteraction:
+    system = memory._new_message(Role.System, "be brief", embed("be brief"))
+    interaction = SqlInteraction(
+        created_at=datetime.utcnow(),
+        user_message_id=unit.add_message(memory._new_message(Role.User, user_text, embed(user_text))),
+        response_message_id=unit.add_message(memory._new_message(Role.Assistant, "ok", embed("ok"))),
+        system_message_ids=[unit.add_message(system)],
+        relevant_interaction_ids=[linked.uid] if linked else [],
+        recent_interaction_ids=[linked.uid] if linked else [],
+    )
+    unit.add_interaction(interaction)
+    return interaction
+
+
+def _count(memory: Memory, table: str) -> int:
+    with memory.pool.read() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_messages_are_staged_once(memory):
+    unit = UnitOfWork()
+    message = memory._new_message(Role.User, "hello", embed("hello"))
+    assert unit.add_message(message) == unit.add_message(message) == message.uid
+    assert unit.messages == [message]
+    assert len(unit) == 1
+
+
+def test_flush_writes_each_table_with_one_executemany(memory):
+    unit = UnitOfWork()
+    first = _turn(memory, unit, "first")
+    _turn(memory, unit, "second", linked=first)
+    conn = _RecordingConnection()
+
+    unit.flush(conn)
+
+    rows_per_table = [len(rows) for _, rows in conn.recorded.calls]
+    # Messages, interactions, then the system, relevant and recent link tables.
+    assert rows_per_table == [6, 2, 2, 1, 1]
+
+
+def test_commit_stores_and_publishes_the_unit(memory, memory_file):
+    unit = UnitOfWork()
+    first = _turn(memory, unit, "first")
+    second = _turn(memory, unit, "second", linked=first)
+    memory.commit(unit)
+
+    assert len(memory.messages) == 6 and len(memory.interactions) == 2
+    memory.close()
+    reopened = Memory(memory_file)
+    try:
+        assert {message.uid for message in reopened.messages} == {message.uid for message in unit.messages}
+        stored = reopened.interaction_store.lookup_by_id(second.uid)
+        assert stored.relevant_interaction_ids == stored.recent_interaction_ids == [first.uid]
+        assert stored.system_message_ids == second.system_message_ids
+    finally:
+        reopened.close()
+
+
+def test_failed_commit_rolls_back_and_publishes_nothing(memory, monkeypatch):
+    unit = UnitOfWork()
+    _turn(memory, unit, "first")
+    flush = UnitOfWork.flush
+
+    def flush_then_fail(self, conn):
+        flush(self, conn)
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(UnitOfWork, "flush", flush_then_fail)
+    with pytest.raises(RuntimeError, match="disk full"):
+        memory.commit(unit)
+
+    assert memory.messages == [] and memory.interactions == []
+    assert memory.message_store.lookup_by_text(Role.User, "first") is None
+    assert _count(memory, "messages") == 0 and _count(memory, "interactions") == 0
+    assert _count(memory, "interaction_system_messages") == 0
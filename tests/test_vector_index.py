@@ -0,0 +1,145 @@
+import numpy as np
+
+from llm_client.agent.memory.embedding_matrix import EmbeddingMatrix
+from llm_client.agent.memory.rw_lock import ReadWriteLock
+from llm_client.agent.memory.vector_index import ExactIndex, Int8Index, IVFFlatIndex
+from llm_client.types.openai import Role
+
+
+def _random_rows(rng: np.random.Generator, n: int, dim: int = 16) -> np.ndarray:
+    rows = rng.standard_normal((n, dim)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def _indexed_rows(index: IVFFlatIndex) -> list[int]:
+    return sorted(np.concatenate([*index._lists, *map(np.asarray, index._pending)]).astype(int).tolist())
+
+
+def test_ivf_retrains_in_background_and_swaps_in_under_the_write_lock():
+    rng = np.random.default_rng(0)
+    matrix = EmbeddingMatrix()
+    index = IVFFlatIndex(matrix, n_probe=1, n_lists=4, min_train_size=100)
+    index.lock = ReadWriteLock()
+
+    with index.lock.write():
+        matrix.extend([str(row) for row in range(100)], _random_rows(rng, 100))
+        index.add_rows(range(100))
+        # Training can't publish while the writer holds the lock.
+        assert not index.trained
+    index.join()
+    assert index.trained
+    assert _indexed_rows(index) == list(range(100))
+
+    old_centroids = index.centroids
+    with index.lock.write():
+        matrix.extend([str(row) for row in range(100, 200)], _random_rows(rng, 100))
+        index.add_rows(range(100, 200))
+        # Retraining has started; meanwhile new rows go to the old centroids.
+        matrix.extend([str(row) for row in range(200, 210)], _random_rows(rng, 10))
+        index.add_rows(range(200, 210))
+        assert index.centroids is old_centroids
+        assert _indexed_rows(index) == list(range(210))
+    index.join()
+    assert index.centroids is not old_centroids
+    assert index._trained_size == 200
+    assert _indexed_rows(index) == list(range(210))
+
+    rows, scores = index.search(matrix.matrix[205], 1)
+    assert rows.tolist() == [205]
+
+
+def test_int8_refits_in_background_and_swaps_in_under_the_write_lock():
+    rng = np.random.default_rng(0)
+    matrix = EmbeddingMatrix()
+    index = Int8Index(matrix, rerank=2)
+    index.lock = ReadWriteLock()
+
+    with index.lock.write():
+        matrix.extend([str(row) for row in range(100)], _random_rows(rng, 100))
+        index.add_rows(range(100))
+        assert index.scale is None
+    index.join()
+    assert index.codes.shape == (100, 16)
+
+    old_scale = index.scale
+    with index.lock.write():
+        # Values outside the first fit's range, which only a refit can encode without clipping.
+        matrix.extend([str(row) for row in range(100, 200)], 2 * _random_rows(rng, 100))
+        index.add_rows(range(100, 200))
+        assert index.scale is old_scale
+        assert len(index.codes) == 200
+    index.join()
+    assert index.scale is not old_scale
+    assert len(index.codes) == 200
+
+    rows, scores = index.search(matrix.matrix[150], 1)
+    assert rows.tolist() == [150]
+
+
+def _matrix_of(rows: np.ndarray) -> EmbeddingMatrix:
+    matrix = EmbeddingMatrix()
+    matrix.extend([str(row) for row in range(len(rows))], rows)
+    return matrix
+
+
+def _true_top_k(rows: np.ndarray, queries: np.ndarray, k: int) -> list[np.ndarray]:
+    return [np.argsort(-scores)[:k] for scores in queries @ rows.T]
+
+
+def test_exact_search_batch_matches_a_full_sort_across_blocks():
+    rng = np.random.default_rng(1)
+    rows, queries = _random_rows(rng, 500), _random_rows(rng, 20)
+    index = ExactIndex(_matrix_of(rows))
+
+    results = index.search_batch(queries, k=5, query_block=3, row_block=7)
+
+    for (found, scores), query, expected in zip(results, queries, _true_top_k(rows, queries, 5)):
+        assert found.tolist() == expected.tolist()
+        np.testing.assert_allclose(scores, rows[expected] @ query, rtol=1e-5)
+
+
+def test_int8_search_batch_matches_search_and_the_exact_top_k():
+    rng = np.random.default_rng(2)
+    rows, queries = _random_rows(rng, 500), _random_rows(rng, 20)
+    index = Int8Index(_matrix_of(rows), block_size=64)
+    index.add_rows(range(len(rows)))
+
+    results = index.search_batch(queries, k=5)
+
+    for (found, scores), query, expected in zip(results, queries, _true_top_k(rows, queries, 5)):
+        single_found, single_scores = index.search(query, 5)
+        assert found.tolist() == single_found.tolist() == expected.tolist()
+        np.testing.assert_allclose(scores, single_scores, rtol=1e-5)
+        np.testing.assert_allclose(scores, rows[expected] @ query, rtol=1e-5)
+
+
+def test_ivf_search_batch_matches_search():
+    rng = np.random.default_rng(2)
+    rows, queries = _random_rows(rng, 500), _random_rows(rng, 20)
+    index = IVFFlatIndex(_matrix_of(rows), n_probe=2, n_lists=4, min_train_size=100)
+    index.add_rows(range(len(rows)))
+    assert index.trained
+
+    results = index.search_batch(queries, k=5)
+
+    for (found, scores), query in zip(results, queries):
+        single_found, single_scores = index.search(query, 5)
+        assert found.tolist() == single_found.tolist()
+        np.testing.assert_allclose(scores, single_scores, rtol=1e-5)
+    # Probing every list scans every row.
+    index.n_probe = 4
+    for (found, _), expected in zip(index.search_batch(queries, k=5), _true_top_k(rows, queries, 5)):
+        assert found.tolist() == expected.tolist()
+
+
+def test_memory_k_most_similar_batch_matches_single_queries(memory, store_turn):
+    for idx in range(30):
+        store_turn(memory, f"question {idx}", f"answer {idx}")
+    queries = _random_rows(np.random.default_rng(3), 6, dim=8)
+
+    for exact in (False, True):
+        batch = memory.k_most_similar_batch(queries, k=4, exact=exact)
+        for query, matches in zip(queries, batch):
+            single = memory.k_most_similar_messages_scored("", [Role.User, Role.Assistant], 4, query_embedding=query)
+            assert [message.uid for message, _ in matches] == [message.uid for message, _ in single]
+            np.testing.assert_allclose([score for _, score in matches], [score for _, score in single], rtol=1e-5)